@@ -1,9 +1,13 @@
 """Create database from ORM"""
 from app.api.database.models.base import Base, engine
-from app.api.database.models import imported_document  
+from app.api.database.models import (
+    conversation, conversation_detail, custom_prompt, imported_document, ingestion_job, indexed_chunk, bulk_load,
+)
+from app.api.database.migrations import run_migrations
 
 async def create_db():
-    """Create Database"""
+    """Create Database: base tables from ORM, then indexes / schema changes from migrations"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
     await engine.dispose()
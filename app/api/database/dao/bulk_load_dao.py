@@ -0,0 +1,46 @@
+from __future__ import annotations
+from datetime import timedelta
+from typing import Optional, Tuple
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.database.models.bulk_load import BulkLoad
+
+class BulkLoadDAO:
+    """Bulk load holders per index Data Access Object; mọi method chạy trong transaction của caller"""
+
+    async def lock(self, db: AsyncSession, index_name: str) -> None:
+        """Serialize holder changes of one index until the caller commits"""
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"bulk_load:{index_name}"}
+        )
+
+    async def live_holders(self, db: AsyncSession, index_name: str) -> Tuple[int, Optional[str]]:
+        """Drop expired holders; (number of live holders, saved original refresh_interval)"""
+        await db.execute(
+            delete(BulkLoad)
+            .where(BulkLoad.index_name == index_name, BulkLoad.expires_at < func.now())
+            .execution_options(synchronize_session=False)
+        )
+        res = await db.execute(
+            select(func.count(), func.max(BulkLoad.original_refresh)).where(BulkLoad.index_name == index_name)
+        )
+        count, original = res.one()
+        return count, original
+
+    async def hold(self, db: AsyncSession, index_name: str, holder: str, original: Optional[str],
+                   lease: float) -> None:
+        """Register or renew `holder` for `lease` seconds"""
+        expires_at = func.now() + timedelta(seconds=lease)
+        await db.execute(
+            insert(BulkLoad)
+            .values(index_name=index_name, holder=holder, original_refresh=original, expires_at=expires_at)
+            .on_conflict_do_update(index_elements=["index_name", "holder"], set_={"expires_at": expires_at})
+        )
+
+    async def release(self, db: AsyncSession, index_name: str, holder: str) -> None:
+        await db.execute(
+            delete(BulkLoad)
+            .where(BulkLoad.index_name == index_name, BulkLoad.holder == holder)
+            .execution_options(synchronize_session=False)
+        )
@@ -1,8 +1,13 @@
-from sqlalchemy import select, desc
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+from sqlalchemy import select, desc, tuple_
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 from app.api.database.models.conversation_detail import ConversationDetail
 from app.api.database.models.custom_prompt import CustomPrompt
 from app.api.database.models.conversation import Conversation
+from app.api.services.history_archive import history_archive
+from app.api.services.pagination import Cursor
 
 class ConversationDAO:
     """Conversation Data Access Object"""
@@ -22,12 +27,92 @@ class ConversationDAO:
             return result.scalars().all()
         
     async def get_detail_by_id(self, async_session: async_sessionmaker[AsyncSession], id: str):
-        """Get Conversation Detail by id"""
+        """Get Conversation Detail by id, including rows moved to the history archive"""
         async with async_session() as session:
-            statement = select(ConversationDetail).filter(ConversationDetail.conversation_id == id)
+            statement = select(ConversationDetail)\
+                .filter(ConversationDetail.conversation_id == id)\
+                .order_by(ConversationDetail.time.asc())
             result = await session.execute(statement)
-            return result.scalars().all()
+            details = list(result.scalars().all())
+            archived_at = await session.scalar(
+                select(Conversation.archived_at).where(Conversation.conversation_id == id)
+            )
+        if archived_at is None:
+            return details
+        # Row trong archive trả về dạng ConversationDetail transient (không gắn session)
+        archived = await asyncio.to_thread(history_archive.read, id)
+        seen = {d.id for d in details}
+        details += [ConversationDetail(**row) for row in archived if row["id"] not in seen]
+        return sorted(details, key=lambda d: d.time)
         
+    async def list_conversations(self, db: AsyncSession, limit: int, after: Optional[Cursor] = None) -> List[dict]:
+        """One page of Conversations ordered by (time_start, conversation_id), after the keyset cursor"""
+        statement = select(Conversation.conversation_id, Conversation.time_start, Conversation.archived_at)\
+            .order_by(Conversation.time_start, Conversation.conversation_id)\
+            .limit(limit)
+        if after is not None:
+            statement = statement.where(tuple_(Conversation.time_start, Conversation.conversation_id) > tuple_(*after))
+        return [dict(r._mapping) for r in await db.execute(statement)]
+
+    async def list_details(self, db: AsyncSession, conversation_id: str, limit: int,
+                           after: Optional[Cursor] = None) -> List[dict]:
+        """One page of a conversation's messages ordered by (time, id), archived messages included"""
+        statement = select(ConversationDetail.id, ConversationDetail.time,
+                           ConversationDetail.role, ConversationDetail.message_detail)\
+            .where(ConversationDetail.conversation_id == conversation_id)\
+            .order_by(ConversationDetail.time, ConversationDetail.id)\
+            .limit(limit)
+        if after is not None:
+            statement = statement.where(tuple_(ConversationDetail.time, ConversationDetail.id) > tuple_(*after))
+        rows = [dict(r._mapping) for r in await db.execute(statement)]
+
+        archived_at = await db.scalar(
+            select(Conversation.archived_at).where(Conversation.conversation_id == conversation_id)
+        )
+        if archived_at is None:
+            return rows
+        # Archive của một conversation nhỏ; ghép với trang từ DB rồi cắt lại theo limit
+        seen = {r["id"] for r in rows}
+        for r in await asyncio.to_thread(history_archive.read, conversation_id):
+            if r["id"] not in seen and (after is None or (r["time"], r["id"]) > after):
+                rows.append({k: r[k] for k in ("id", "time", "role", "message_detail")})
+        return sorted(rows, key=lambda r: (r["time"], r["id"]))[:limit]
+
+    async def stream_conversations(self, db: AsyncSession, batch_size: int,
+                                   after: Optional[Cursor] = None) -> AsyncIterator[dict]:
+        """Every Conversation after the cursor, fetched through a server-side cursor"""
+        statement = select(Conversation.conversation_id, Conversation.time_start, Conversation.archived_at)\
+            .order_by(Conversation.time_start, Conversation.conversation_id)\
+            .execution_options(yield_per=batch_size)
+        if after is not None:
+            statement = statement.where(tuple_(Conversation.time_start, Conversation.conversation_id) > tuple_(*after))
+        result = await db.stream(statement)
+        async for row in result:
+            yield dict(row._mapping)
+
+    async def stream_details(self, db: AsyncSession, batch_size: int,
+                             conversation_id: Optional[str] = None,
+                             since: Optional[datetime] = None,
+                             until: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """Messages still in the database (archived ones are already gzip JSONL files).
+
+        Theo một conversation thì sắp theo (time, id); export toàn bộ thì không sort để đọc tuần tự
+        từng partition, `since` / `until` giúp bỏ qua partition không cần thiết.
+        """
+        statement = select(ConversationDetail.id, ConversationDetail.time, ConversationDetail.role,
+                           ConversationDetail.message_detail, ConversationDetail.conversation_id)\
+            .execution_options(yield_per=batch_size)
+        if conversation_id is not None:
+            statement = statement.where(ConversationDetail.conversation_id == conversation_id)\
+                .order_by(ConversationDetail.time, ConversationDetail.id)
+        if since is not None:
+            statement = statement.where(ConversationDetail.time >= since)
+        if until is not None:
+            statement = statement.where(ConversationDetail.time < until)
+        result = await db.stream(statement)
+        async for row in result:
+            yield dict(row._mapping)
+
     async def add_conversation(self, async_session: async_sessionmaker[AsyncSession], conversation: Conversation):
         """Add Conversation to database"""
         async with async_session() as session:
@@ -62,3 +147,10 @@ class ConversationDAO:
             statement = select(CustomPrompt).order_by(desc(CustomPrompt.created_at)).limit(1)
             result = await db.execute(statement)
             return result.scalar_one_or_none()
+
+    async def get_prompt_version(self, db: AsyncSession):
+        """Get only the id of the latest Custom Prompt (cheap version check)"""
+        async with db.begin():
+            statement = select(CustomPrompt.id).order_by(desc(CustomPrompt.created_at)).limit(1)
+            result = await db.execute(statement)
+            return result.scalar_one_or_none()
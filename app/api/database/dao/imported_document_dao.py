@@ -1,9 +1,17 @@
 from __future__ import annotations
-from typing import Optional, List
-from sqlalchemy import select, update
+import uuid
+from typing import Optional, List, Sequence
+from sqlalchemy import select, insert, update, exists, func, cast, literal, false, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 from app.api.database.models.imported_document import ImportedDocument
 
+def id_in(ids: Sequence[str]):
+    """`id = ANY(:ids)` với một tham số array duy nhất, thay cho IN với N tham số."""
+    return ImportedDocument.id == any_(bindparam("ids", list(ids), type_=ARRAY(String)))
+
+
 class ImportedDocumentDAO:
     async def add_document(self, db: AsyncSession, doc: ImportedDocument) -> ImportedDocument:
         db.add(doc)
@@ -19,7 +27,8 @@ class ImportedDocumentDAO:
     async def list_unprocessed(self, db: AsyncSession, limit: Optional[int] = None) -> List[ImportedDocument]:
         stmt = (
             select(ImportedDocument)
-            .where(ImportedDocument.is_process.is_(False))
+            # `NOT is_process` khớp đúng predicate của partial index ix_imported_document_unprocessed_created_at
+            .where(~ImportedDocument.is_process)
             .order_by(ImportedDocument.created_at.asc())
         )
         if limit:
@@ -27,6 +36,28 @@ class ImportedDocumentDAO:
         res = await db.execute(stmt)
         return list(res.scalars().all())
 
+    async def is_superseded(self, db: AsyncSession, doc: ImportedDocument) -> bool:
+        """True when a newer upload of the same file is indexed or queued (the old content must not win)"""
+        newer = (
+            select(ImportedDocument.id)
+            .where(ImportedDocument.file_name == doc.file_name)
+            .where(ImportedDocument.created_at > doc.created_at)
+            .where(ImportedDocument.failed_at.is_(None))
+            .where(ImportedDocument.is_process | ImportedDocument.job_id.is_not(None))
+            # Cùng part, hoặc bản mới ngắn hơn không còn part này
+            .where((ImportedDocument.part == doc.part) | (ImportedDocument.parts <= doc.part))
+        )
+        return bool(await db.scalar(select(exists(newer))))
+
+    async def has_earlier_upload(self, db: AsyncSession, doc: ImportedDocument) -> bool:
+        """True when the same file was uploaded before `doc` (its chunks may still be in the index)"""
+        earlier = (
+            select(ImportedDocument.id)
+            .where(ImportedDocument.file_name == doc.file_name)
+            .where(ImportedDocument.created_at < doc.created_at)
+        )
+        return bool(await db.scalar(select(exists(earlier))))
+
     async def mark_processed(self, db: AsyncSession, doc_id: str) -> None:
         stmt = (
             update(ImportedDocument)
@@ -36,3 +67,69 @@ class ImportedDocumentDAO:
         )
         await db.execute(stmt)
         await db.commit()
+
+    async def mark_processed_many(self, db: AsyncSession, doc_ids: Sequence[str]) -> None:
+        """Mark a batch of documents processed with a single UPDATE."""
+        if not doc_ids:
+            return
+        await db.execute(
+            update(ImportedDocument)
+            .where(id_in(doc_ids))
+            .values(is_process=True)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    async def latest_upload(self, db: AsyncSession, *, file_name: Optional[str] = None,
+                            content_hash: Optional[str] = None, complete: bool = False) -> List:
+        """(id, part, content_hash, failed_at) of every part of the newest upload matching the filter, by part.
+
+        Upload được xác định bằng upload_id; `complete`: bỏ qua upload có part bị lỗi. Không đọc cột content.
+        """
+        newest = (
+            select(ImportedDocument.upload_id)
+            .where(ImportedDocument.upload_id.is_not(None))
+            .order_by(ImportedDocument.created_at.desc())
+            .limit(1)
+        )
+        if file_name is not None:
+            newest = newest.where(ImportedDocument.file_name == file_name)
+        if content_hash is not None:
+            newest = newest.where(ImportedDocument.content_hash == content_hash)
+        if complete:
+            failed = aliased(ImportedDocument)
+            newest = newest.where(~exists(
+                select(failed.id)
+                .where(failed.upload_id == ImportedDocument.upload_id)
+                .where(failed.failed_at.is_not(None))
+            ))
+        res = await db.execute(
+            select(ImportedDocument.id, ImportedDocument.part, ImportedDocument.content_hash,
+                   ImportedDocument.failed_at)
+            .where(ImportedDocument.upload_id == newest.scalar_subquery())
+            .order_by(ImportedDocument.part)
+        )
+        return list(res.all())
+
+    async def copy_upload(self, db: AsyncSession, source: Sequence, file_name: str) -> List[str]:
+        """Copy the parts of an existing upload under `file_name` inside the database (text không đi qua app)."""
+        res = await db.execute(
+            insert(ImportedDocument)
+            .from_select(
+                ["id", "file_name", "content", "is_process", "part", "parts", "content_hash", "upload_id"],
+                select(
+                    cast(func.gen_random_uuid(), String),
+                    literal(file_name, String),
+                    ImportedDocument.content,
+                    false(),
+                    ImportedDocument.part,
+                    ImportedDocument.parts,
+                    ImportedDocument.content_hash,
+                    literal(str(uuid.uuid4()), String),
+                ).where(id_in([row.id for row in source])),
+            )
+            .returning(ImportedDocument.id, ImportedDocument.part)
+        )
+        ids = [r.id for r in sorted(res.all(), key=lambda r: r.part)]
+        await db.commit()
+        return ids
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import select, delete, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.database.models.indexed_chunk import IndexedChunk
+
+class IndexedChunkDAO:
+    """Chunk fingerprints per (index, file_name) Data Access Object"""
+
+    async def chunks_for_file(self, db: AsyncSession, index_name: str, file_name: str,
+                              part: int = 0) -> List[Tuple[str, str]]:
+        """(chunk_id, chunk_hash) of every chunk indexed for one part of `file_name`"""
+        res = await db.execute(
+            select(IndexedChunk.chunk_id, IndexedChunk.chunk_hash)
+            .where(IndexedChunk.index_name == index_name, IndexedChunk.file_name == file_name)
+            .where(IndexedChunk.part == part)
+        )
+        return [(r.chunk_id, r.chunk_hash) for r in res]
+
+    async def chunks_beyond(self, db: AsyncSession, index_name: str, file_name: str, parts: int) -> List[str]:
+        """chunk_id of parts >= `parts`, left over from a previous, longer upload of `file_name`"""
+        res = await db.execute(
+            select(IndexedChunk.chunk_id)
+            .where(IndexedChunk.index_name == index_name, IndexedChunk.file_name == file_name)
+            .where(IndexedChunk.part >= parts)
+        )
+        return list(res.scalars().all())
+
+    async def replace(self, db: AsyncSession, index_name: str, removed_ids: Sequence[str],
+                      added: Sequence[Dict]) -> None:
+        """Drop removed chunks and record added ones; committed by the caller"""
+        if removed_ids:
+            await db.execute(
+                delete(IndexedChunk)
+                .where(IndexedChunk.index_name == index_name)
+                .where(IndexedChunk.chunk_id == any_(bindparam("removed_ids", list(removed_ids), type_=ARRAY(String))))
+                .execution_options(synchronize_session=False)
+            )
+        if added:
+            await db.execute(
+                insert(IndexedChunk)
+                .values([{**row, "index_name": index_name} for row in added])
+                .on_conflict_do_nothing(index_elements=["index_name", "chunk_id"])
+            )
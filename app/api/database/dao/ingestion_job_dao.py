@@ -0,0 +1,202 @@
+from __future__ import annotations
+import uuid
+from datetime import timedelta
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import select, update, func, case, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.database.models.imported_document import ImportedDocument
+from app.api.database.models.ingestion_job import IngestionJob
+
+def _leased(docs: Sequence[ImportedDocument]):
+    """Rows still leased by the caller: (id, attempts, locked_until) như lúc claim.
+
+    Lease hết hạn và worker khác đã claim lại -> attempts / locked_until đã đổi, row không khớp.
+    """
+    return tuple_(ImportedDocument.id, ImportedDocument.attempts, ImportedDocument.locked_until).in_(
+        [(doc.id, doc.attempts, doc.locked_until) for doc in docs]
+    )
+
+
+class IngestionJobDAO:
+    """Ingestion job Data Access Object"""
+
+    async def create_job(self, db: AsyncSession, index_name: str, limit: Optional[int] = None) -> Optional[IngestionJob]:
+        """Create a job and assign it up to `limit` unassigned unprocessed documents (None if there is nothing to do)"""
+        job = IngestionJob(id=str(uuid.uuid4()), index_name=index_name, status="queued")
+        db.add(job)
+        await db.flush()
+
+        candidates = (
+            select(ImportedDocument.id)
+            .where(~ImportedDocument.is_process)
+            .where(ImportedDocument.job_id.is_(None))
+            .where(ImportedDocument.failed_at.is_(None))
+            .order_by(ImportedDocument.created_at.asc())
+            .with_for_update(skip_locked=True)
+        )
+        if limit:
+            candidates = candidates.limit(limit)
+        assigned = await db.execute(
+            update(ImportedDocument)
+            .where(ImportedDocument.id.in_(candidates.scalar_subquery()))
+            .values(job_id=job.id, attempts=0, next_attempt_at=None, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        if not assigned.rowcount:
+            await db.rollback()
+            return None
+        job.docs_total = assigned.rowcount
+        await db.commit()
+        # Lấy created_at (server default) để trả về ngay trong response
+        await db.refresh(job)
+        return job
+
+    async def get_job(self, db: AsyncSession, job_id: str) -> Optional[IngestionJob]:
+        return await db.get(IngestionJob, job_id)
+
+    async def index_names(self, db: AsyncSession, job_ids: Iterable[str]) -> Dict[str, str]:
+        """index_name of each job"""
+        rows = await db.execute(select(IngestionJob.id, IngestionJob.index_name).where(IngestionJob.id.in_(set(job_ids))))
+        return {job_id: index_name for job_id, index_name in rows.all()}
+
+    async def requeue_failed(self, db: AsyncSession, job_id: str, doc_ids: Optional[Sequence[str]] = None) -> int:
+        """Give documents of `job_id` that failed for good a fresh set of attempts; returns how many were requeued.
+
+        Job được mở lại (queued / running) và docs_failed giảm tương ứng.
+        """
+        statement = (
+            update(ImportedDocument)
+            .where(ImportedDocument.job_id == job_id)
+            .where(ImportedDocument.failed_at.is_not(None))
+            .where(~ImportedDocument.is_process)
+        )
+        if doc_ids is not None:
+            statement = statement.where(ImportedDocument.id.in_(doc_ids))
+        res = await db.execute(
+            statement
+            .values(failed_at=None, attempts=0, next_attempt_at=None, locked_until=None, last_error=None)
+            .returning(ImportedDocument.id)
+            .execution_options(synchronize_session=False)
+        )
+        requeued = len(res.scalars().all())
+        if not requeued:
+            await db.rollback()
+            return 0
+        await db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id)
+            .values(
+                docs_failed=func.greatest(IngestionJob.docs_failed - requeued, 0),
+                status=case((IngestionJob.started_at.is_(None), "queued"), else_="running"),
+                finished_at=None,
+            )
+        )
+        await db.commit()
+        return requeued
+
+    async def claim_documents(self, db: AsyncSession, lease: float, limit: int) -> List[ImportedDocument]:
+        """Lease up to `limit` oldest ready documents of any job; concurrent workers skip rows locked by others"""
+        now = func.now()
+        ready = (
+            select(ImportedDocument.id)
+            .where(ImportedDocument.job_id.is_not(None))
+            .where(~ImportedDocument.is_process)
+            .where(ImportedDocument.failed_at.is_(None))
+            .where((ImportedDocument.next_attempt_at.is_(None)) | (ImportedDocument.next_attempt_at <= now))
+            .where((ImportedDocument.locked_until.is_(None)) | (ImportedDocument.locked_until < now))
+            .order_by(ImportedDocument.created_at.asc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("ready")
+        )
+        result = await db.execute(
+            update(ImportedDocument)
+            .where(ImportedDocument.id == ready.c.id)
+            .values(locked_until=now + timedelta(seconds=lease), attempts=ImportedDocument.attempts + 1)
+            .returning(ImportedDocument)
+            .execution_options(synchronize_session=False)
+        )
+        docs = list(result.scalars().all())
+        if not docs:
+            await db.rollback()
+            return []
+        await db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id.in_({d.job_id for d in docs}), IngestionJob.status == "queued")
+            .values(status="running", started_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return docs
+
+    async def mark_done_many(self, db: AsyncSession, done: Sequence[Tuple[ImportedDocument, int]]) -> Set[str]:
+        """Mark indexed documents processed with one UPDATE, then one counter update per job.
+
+        Chỉ document còn giữ lease được cập nhật và tính vào job; trả về id của chúng.
+        """
+        if not done:
+            return set()
+        res = await db.execute(
+            update(ImportedDocument)
+            .where(_leased([doc for doc, _ in done]))
+            .values(is_process=True, locked_until=None, next_attempt_at=None, last_error=None)
+            .returning(ImportedDocument.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = set(res.scalars().all())
+        docs, chunks = Counter(), Counter()
+        for doc, n in done:
+            if doc.id in updated:
+                docs[doc.job_id] += 1
+                chunks[doc.job_id] += n
+        for job_id in docs:
+            await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id)
+                .values(docs_done=IngestionJob.docs_done + docs[job_id],
+                        chunks_done=IngestionJob.chunks_done + chunks[job_id])
+            )
+            await self._finish_if_complete(db, job_id)
+        await db.commit()
+        return updated
+
+    async def mark_failed(self, db: AsyncSession, doc: ImportedDocument, error: str,
+                          retry_in: Optional[float]) -> bool:
+        """Schedule a retry in `retry_in` seconds, or fail the document for good when it is None.
+
+        False khi lease đã mất (worker khác đang xử lý document): không đổi gì.
+        """
+        now = func.now()
+        if retry_in is None:
+            doc_values = dict(locked_until=None, failed_at=now, last_error=error)
+            job_values = dict(docs_failed=IngestionJob.docs_failed + 1, last_error=error)
+        else:
+            doc_values = dict(locked_until=None, next_attempt_at=now + timedelta(seconds=retry_in), last_error=error)
+            job_values = dict(retries=IngestionJob.retries + 1, last_error=error)
+        res = await db.execute(
+            update(ImportedDocument)
+            .where(_leased([doc]))
+            .values(**doc_values)
+            .returning(ImportedDocument.id)
+            .execution_options(synchronize_session=False)
+        )
+        if res.scalar_one_or_none() is None:
+            # Không rollback: transaction còn giữ thay đổi của document khác trong batch
+            return False
+        await db.execute(update(IngestionJob).where(IngestionJob.id == doc.job_id).values(**job_values))
+        await self._finish_if_complete(db, doc.job_id)
+        await db.commit()
+        return True
+
+    async def _finish_if_complete(self, db: AsyncSession, job_id: str) -> None:
+        await db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id)
+            .where(IngestionJob.finished_at.is_(None))
+            .where(IngestionJob.docs_done + IngestionJob.docs_failed >= IngestionJob.docs_total)
+            .values(
+                status=case((IngestionJob.docs_failed > 0, "completed_with_errors"), else_="completed"),
+                finished_at=func.now(),
+            )
+        )
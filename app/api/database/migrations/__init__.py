@@ -0,0 +1,4 @@
+"""Versioned schema migrations for the Postgres database."""
+from app.api.database.migrations.runner import run_migrations
+
+__all__ = ["run_migrations"]
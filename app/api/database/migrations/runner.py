@@ -0,0 +1,148 @@
+"""
+    Chạy các migration chưa được ghi trong bảng schema_migrations
+"""
+from __future__ import annotations
+import asyncio
+from typing import Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.api.database.migrations.versions import MIGRATIONS, Index, Migration
+from app.logger.logger import custom_logger
+
+# Khoá advisory để nhiều worker khởi động cùng lúc không chạy migration song song
+_LOCK_KEY = 7_301_245_118
+# Giây giữa hai lần thử lấy khoá
+_LOCK_POLL = 1.0
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+
+async def _applied_versions(conn: AsyncConnection) -> Set[int]:
+    rows = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return {r[0] for r in rows}
+
+
+async def create_index(conn: AsyncConnection, index: Index) -> None:
+    """Create `index` concurrently; `conn` must be in AUTOCOMMIT mode.
+
+    CONCURRENTLY bị lỗi giữa chừng để lại index INVALID mà IF NOT EXISTS sẽ bỏ qua,
+    nên drop nó trước khi tạo lại.
+    """
+    invalid = await conn.scalar(text(
+        "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": index.name})
+    if invalid:
+        custom_logger.warning(f"dropping invalid index {index.name}")
+        await conn.execute(text(index.drop_sql()))
+    await conn.execute(text(index.create_sql()))
+
+
+async def create_partitioned_index(conn: AsyncConnection, index: Index) -> None:
+    """Build `index` on a partitioned table: CONCURRENTLY on each partition, then attach to the parent.
+
+    CREATE INDEX CONCURRENTLY không chạy được trên bảng partition; index ON ONLY của bảng cha
+    chỉ hợp lệ khi mọi partition đã có index được attach. `conn` phải ở AUTOCOMMIT.
+    """
+    unique = "UNIQUE " if index.unique else ""
+    where = f" WHERE {index.where}" if index.where else ""
+    await conn.execute(text(
+        f"CREATE {unique}INDEX IF NOT EXISTS {index.name} ON ONLY {index.table} {index.definition}{where}"
+    ))
+    partitions = (await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+    ), {"table": index.table})).scalars().all()
+    for partition in partitions:
+        # Partition đã có index gắn vào index cha (vd. tạo cùng partition) -> bỏ qua
+        attached = await conn.scalar(text(
+            "SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:index AS regclass) AND x.indrelid = CAST(:partition AS regclass)"
+        ), {"index": index.name, "partition": partition})
+        if attached:
+            continue
+        name = index.name.replace(index.table, partition, 1) if index.table in index.name else f"{index.name}_{partition}"
+        part_index = Index(name=name, table=partition, definition=index.definition,
+                           where=index.where, unique=index.unique)
+        await create_index(conn, part_index)
+        await conn.execute(text(f"ALTER INDEX {index.name} ATTACH PARTITION {part_index.name}"))
+
+
+async def _run_online(engine: AsyncEngine, migration: Migration) -> None:
+    async with engine.connect() as online_conn:
+        online_conn = await online_conn.execution_options(isolation_level="AUTOCOMMIT")
+        for step in migration.online:
+            if isinstance(step, Index):
+                await create_index(online_conn, step)
+            else:
+                await online_conn.execute(text(step))
+
+
+async def _apply(engine: AsyncEngine, conn: AsyncConnection, migration: Migration) -> None:
+    if migration.only_if:
+        async with conn.begin():
+            needed = await conn.scalar(text(migration.only_if))
+        if not needed:
+            custom_logger.info(f"migration {migration.version} not needed, recording it as applied")
+            migration = Migration(version=migration.version, name=migration.name)
+    if migration.online:
+        await _run_online(engine, migration)
+    if migration.statements:
+        async with conn.begin():
+            for statement in migration.statements:
+                await conn.execute(text(statement))
+    if migration.indexes:
+        # CONCURRENTLY không chạy được trong transaction -> connection riêng ở AUTOCOMMIT
+        async with engine.connect() as index_conn:
+            index_conn = await index_conn.execution_options(isolation_level="AUTOCOMMIT")
+            for index in migration.indexes:
+                await create_index(index_conn, index)
+    async with conn.begin():
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+            {"version": migration.version, "name": migration.name},
+        )
+
+
+async def _acquire_lock(lock_conn: AsyncConnection) -> None:
+    """Poll `pg_try_advisory_lock` on an AUTOCOMMIT connection.
+
+    Worker đang chờ không được giữ transaction (snapshot) mở: CREATE INDEX CONCURRENTLY
+    của worker giữ khoá sẽ chờ snapshot đó, còn worker chờ lại chờ khoá -> deadlock
+    mà Postgres không phát hiện được.
+    """
+    waiting = False
+    while not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _LOCK_KEY}):
+        if not waiting:
+            custom_logger.info("waiting for another process to finish migrations")
+            waiting = True
+        await asyncio.sleep(_LOCK_POLL)
+
+
+async def run_migrations(engine: AsyncEngine, target: Optional[int] = None) -> None:
+    """Apply pending migrations up to `target` (default: all), in version order."""
+    # Khoá (session) nằm trên connection riêng không bao giờ mở transaction
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await _acquire_lock(lock_conn)
+        try:
+            async with engine.connect() as conn:
+                async with conn.begin():
+                    await conn.execute(text(_CREATE_TABLE))
+                async with conn.begin():
+                    applied = await _applied_versions(conn)
+                for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+                    if migration.version in applied or (target is not None and migration.version > target):
+                        continue
+                    custom_logger.info(f"applying migration {migration.version}: {migration.name}")
+                    await _apply(engine, conn, migration)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
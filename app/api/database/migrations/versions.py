@@ -0,0 +1,328 @@
+"""
+    Danh sách migration theo thứ tự version; chỉ được thêm mới, không sửa migration đã chạy
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Union
+
+
+@dataclass(frozen=True)
+class Index:
+    """Index built with CREATE INDEX CONCURRENTLY (no write lock on the table)."""
+
+    name: str
+    table: str
+    definition: str
+    where: str = ""
+    unique: bool = False
+
+    def create_sql(self) -> str:
+        unique = "UNIQUE " if self.unique else ""
+        sql = f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.table} {self.definition}"
+        return f"{sql} WHERE {self.where}" if self.where else sql
+
+    def drop_sql(self) -> str:
+        return f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"
+
+
+@dataclass(frozen=True)
+class Migration:
+    """`statements` run in one transaction; `indexes` run afterwards in autocommit mode.
+
+    `online` (câu lệnh / index) chạy trước `statements`, từng bước ở autocommit: dành cho bước quét cả bảng
+    không được giữ khoá của transaction. `only_if` trả về false thì migration chỉ được ghi nhận.
+    """
+
+    version: int
+    name: str
+    statements: List[str] = field(default_factory=list)
+    indexes: List[Index] = field(default_factory=list)
+    online: List[Union[str, Index]] = field(default_factory=list)
+    only_if: str = ""
+
+
+HISTORY_INDEX = Index(
+    name="ix_conversation_detail_conversation_id_time",
+    table="conversation_detail",
+    definition="(conversation_id, time)",
+)
+UNPROCESSED_INDEX = Index(
+    name="ix_imported_document_unprocessed_created_at",
+    table="imported_document",
+    definition="(created_at)",
+    where="NOT is_process",
+)
+PROMPT_INDEX = Index(
+    name="ix_custom_prompts_created_at",
+    table="custom_prompts",
+    definition="(created_at DESC)",
+)
+CONVERSATION_LIST_INDEX = Index(
+    name="ix_conversation_time_start_conversation_id",
+    table="conversation",
+    definition="(time_start, conversation_id)",
+)
+CLAIMABLE_DOCUMENT_INDEX = Index(
+    name="ix_imported_document_claimable",
+    table="imported_document",
+    definition="(created_at)",
+    where="job_id IS NOT NULL AND NOT is_process AND failed_at IS NULL",
+)
+DOCUMENT_FILE_NAME_INDEX = Index(
+    name="ix_imported_document_file_name_created_at",
+    table="imported_document",
+    definition="(file_name, created_at)",
+)
+INDEXED_CHUNK_FILE_INDEX = Index(
+    name="ix_indexed_chunk_index_name_file_name",
+    table="indexed_chunk",
+    definition="(index_name, file_name)",
+)
+DOCUMENT_CONTENT_HASH_INDEX = Index(
+    name="ix_imported_document_content_hash_created_at",
+    table="imported_document",
+    definition="(content_hash, created_at)",
+    where="content_hash IS NOT NULL",
+)
+DOCUMENT_UPLOAD_INDEX = Index(
+    name="ix_imported_document_upload_id",
+    table="imported_document",
+    definition="(upload_id)",
+)
+
+# Tạo partition theo tháng (UTC) từ `start_month` tới `months_ahead` tháng sau tháng hiện tại.
+# Row của tháng đó đã rơi vào DEFAULT thì CREATE ... PARTITION OF sẽ lỗi -> chuyển sang bảng mới rồi ATTACH.
+# Tháng nằm trong partition legacy (conversation_detail_before_YYYYMM) bị bỏ qua (lỗi overlap).
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION conversation_detail_ensure_partitions(start_month date, months_ahead integer)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    m date := date_trunc('month', start_month)::date;
+    stop date := (date_trunc('month', now() AT TIME ZONE 'utc') + make_interval(months => months_ahead))::date;
+    next date;
+    part text;
+BEGIN
+    WHILE m <= stop LOOP
+        part := 'conversation_detail_' || to_char(m, 'YYYYMM');
+        next := (m + interval '1 month')::date;
+        IF to_regclass(part) IS NULL THEN
+            BEGIN
+                IF EXISTS (SELECT 1 FROM conversation_detail_default WHERE time >= m AND time < next) THEN
+                    EXECUTE format('CREATE TABLE %I (LIKE conversation_detail INCLUDING DEFAULTS)', part);
+                    EXECUTE format('WITH moved AS (DELETE FROM conversation_detail_default '
+                                   'WHERE time >= %L AND time < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                                   m, next, part);
+                    EXECUTE format('ALTER TABLE conversation_detail ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                   part, m, next);
+                ELSE
+                    EXECUTE format('CREATE TABLE %I PARTITION OF conversation_detail FOR VALUES FROM (%L) TO (%L)',
+                                   part, m, next);
+                END IF;
+            EXCEPTION WHEN invalid_object_definition THEN
+                NULL;
+            END;
+        END IF;
+        m := next;
+    END LOOP;
+END $$
+"""
+
+# Bảng cũ được ATTACH nguyên vẹn làm partition (MINVALUE, tháng hiện tại + 2) thay vì copy từng row.
+# Các bước quét cả bảng chạy trước ở autocommit, không giữ ACCESS EXCLUSIVE:
+#   - CHECK (time IS NOT NULL AND time < bound) NOT VALID + VALIDATE: SET NOT NULL và ATTACH không phải quét lại
+#   - unique index (id, time) tạo CONCURRENTLY làm khoá chính mới (khoá chính phải chứa cột partition)
+CONVERSATION_DETAIL_PARTITIONED = """
+SELECT NOT EXISTS (SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid
+                   WHERE c.relname = 'conversation_detail')
+"""
+CONVERSATION_DETAIL_TIME_BOUND = """
+DO $$
+BEGIN
+    ALTER TABLE conversation_detail DROP CONSTRAINT IF EXISTS conversation_detail_time_bound;
+    EXECUTE format('ALTER TABLE conversation_detail ADD CONSTRAINT conversation_detail_time_bound '
+                   'CHECK (time IS NOT NULL AND time < %L::timestamp) NOT VALID',
+                   date_trunc('month', now() AT TIME ZONE 'utc') + interval '2 months');
+END $$
+"""
+CONVERSATION_DETAIL_ID_TIME_INDEX = Index(
+    name="ix_conversation_detail_id_time",
+    table="conversation_detail",
+    definition="(id, time)",
+    unique=True,
+)
+PARTITION_CONVERSATION_DETAIL = """
+DO $$
+DECLARE
+    bound date := (date_trunc('month', now() AT TIME ZONE 'utc') + interval '2 months')::date;
+    legacy text := 'conversation_detail_before_' || to_char(bound, 'YYYYMM');
+BEGIN
+    ALTER TABLE conversation_detail DROP CONSTRAINT conversation_detail_pkey;
+    ALTER TABLE conversation_detail ALTER COLUMN time SET NOT NULL;
+    ALTER TABLE conversation_detail ADD CONSTRAINT conversation_detail_legacy_pkey
+        PRIMARY KEY USING INDEX ix_conversation_detail_id_time;
+    EXECUTE format('ALTER TABLE conversation_detail RENAME TO %I', legacy);
+    EXECUTE format('ALTER INDEX IF EXISTS ix_conversation_detail_conversation_id_time RENAME TO %I',
+                   'ix_' || legacy || '_conversation_id_time');
+
+    CREATE TABLE conversation_detail (
+        id VARCHAR NOT NULL,
+        time TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        message_detail VARCHAR,
+        role VARCHAR,
+        conversation_id VARCHAR REFERENCES conversation (conversation_id),
+        PRIMARY KEY (id, time)
+    ) PARTITION BY RANGE (time);
+    -- CHECK đã VALIDATE chứng minh constraint của partition -> ATTACH không quét bảng
+    EXECUTE format('ALTER TABLE conversation_detail ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)',
+                   legacy, bound);
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT conversation_detail_time_bound', legacy);
+    CREATE TABLE conversation_detail_default PARTITION OF conversation_detail DEFAULT;
+    -- Index cùng định nghĩa trên bảng cũ được gắn vào, không tạo lại
+    CREATE INDEX ix_conversation_detail_conversation_id_time ON conversation_detail (conversation_id, time);
+    PERFORM conversation_detail_ensure_partitions(bound, 2);
+END $$
+"""
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        name="query indexes for history, unprocessed documents and latest prompt",
+        indexes=[HISTORY_INDEX, UNPROCESSED_INDEX, PROMPT_INDEX],
+    ),
+    Migration(
+        version=2,
+        name="monthly partitions for conversation_detail, archived_at on conversation",
+        online=[
+            "UPDATE conversation_detail SET time = now() AT TIME ZONE 'utc' WHERE time IS NULL",
+            CONVERSATION_DETAIL_TIME_BOUND,
+            "ALTER TABLE conversation_detail VALIDATE CONSTRAINT conversation_detail_time_bound",
+            CONVERSATION_DETAIL_ID_TIME_INDEX,
+        ],
+        statements=[
+            "ALTER TABLE conversation ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITHOUT TIME ZONE",
+            ENSURE_PARTITIONS_FUNCTION,
+            PARTITION_CONVERSATION_DETAIL,
+        ],
+        only_if=CONVERSATION_DETAIL_PARTITIONED,
+    ),
+    Migration(
+        version=3,
+        name="keyset pagination index for conversation listing",
+        indexes=[CONVERSATION_LIST_INDEX],
+    ),
+    Migration(
+        version=4,
+        name="background ingestion jobs",
+        statements=[
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS job_id VARCHAR(36)",
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ",
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ",
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS failed_at TIMESTAMPTZ",
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS last_error TEXT",
+            """
+            CREATE TABLE IF NOT EXISTS ingestion_job (
+                id VARCHAR(36) PRIMARY KEY,
+                index_name VARCHAR(255) NOT NULL,
+                status VARCHAR(32) NOT NULL DEFAULT 'queued',
+                docs_total INTEGER NOT NULL DEFAULT 0,
+                docs_done INTEGER NOT NULL DEFAULT 0,
+                docs_failed INTEGER NOT NULL DEFAULT 0,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                retries INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                started_at TIMESTAMPTZ,
+                finished_at TIMESTAMPTZ
+            )
+            """,
+        ],
+        indexes=[CLAIMABLE_DOCUMENT_INDEX],
+    ),
+    Migration(
+        version=5,
+        name="chunk fingerprints for incremental re-indexing",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS indexed_chunk (
+                index_name VARCHAR(255) NOT NULL,
+                chunk_id VARCHAR(80) NOT NULL,
+                file_name VARCHAR(255) NOT NULL,
+                chunk_hash VARCHAR(64) NOT NULL,
+                doc_id VARCHAR(36) NOT NULL,
+                PRIMARY KEY (index_name, chunk_id)
+            )
+            """,
+        ],
+        indexes=[INDEXED_CHUNK_FILE_INDEX, DOCUMENT_FILE_NAME_INDEX],
+    ),
+    Migration(
+        version=6,
+        name="multi-part documents for streamed uploads",
+        statements=[
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS part INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS parts INTEGER NOT NULL DEFAULT 1",
+            "ALTER TABLE indexed_chunk ADD COLUMN IF NOT EXISTS part INTEGER NOT NULL DEFAULT 0",
+        ],
+    ),
+    Migration(
+        version=7,
+        name="content hash of uploaded files",
+        statements=["ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"],
+        indexes=[DOCUMENT_CONTENT_HASH_INDEX],
+    ),
+    Migration(
+        version=8,
+        name="explicit upload id of document parts",
+        statements=[
+            "ALTER TABLE imported_document ADD COLUMN IF NOT EXISTS upload_id VARCHAR(36)",
+            # Row cũ: các part của một upload được lưu trong cùng transaction (cùng file_name, created_at)
+            """
+            UPDATE imported_document d SET upload_id = u.upload_id
+            FROM (
+                SELECT file_name, created_at, min(id) AS upload_id
+                FROM imported_document
+                GROUP BY file_name, created_at
+            ) u
+            WHERE d.upload_id IS NULL AND d.file_name = u.file_name AND d.created_at = u.created_at
+            """,
+        ],
+        indexes=[DOCUMENT_UPLOAD_INDEX],
+    ),
+    Migration(
+        version=9,
+        name="bulk load holders shared by all processes",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS bulk_load (
+                index_name VARCHAR(255) NOT NULL,
+                holder VARCHAR(64) NOT NULL,
+                original_refresh VARCHAR(32),
+                expires_at TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (index_name, holder)
+            )
+            """,
+        ],
+    ),
+    Migration(
+        version=10,
+        name="time_start of conversation is required",
+        statements=[
+            # NULL làm keyset (time_start, conversation_id) bỏ sót row: lấy tin nhắn đầu tiên, không có thì now()
+            """
+            UPDATE conversation c SET time_start = COALESCE(
+                (SELECT min(d.time) FROM conversation_detail d WHERE d.conversation_id = c.conversation_id),
+                now() AT TIME ZONE 'utc'
+            )
+            WHERE c.time_start IS NULL
+            """,
+            "ALTER TABLE conversation ALTER COLUMN time_start SET DEFAULT (now() AT TIME ZONE 'utc')",
+            "ALTER TABLE conversation ALTER COLUMN time_start SET NOT NULL",
+        ],
+    ),
+    Migration(
+        version=11,
+        name="partition maintenance moves rows out of the DEFAULT partition",
+        statements=[ENSURE_PARTITIONS_FUNCTION],
+    ),
+]
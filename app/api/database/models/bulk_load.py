@@ -0,0 +1,18 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from app.api.database.models.base import Base
+
+class BulkLoad(Base):
+    """Process currently bulk loading an index with refresh disabled (xem BulkIndexer.begin_load)"""
+    __tablename__ = "bulk_load"
+
+    index_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # host:pid:random của process đang load
+    holder: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # refresh_interval trước khi process đầu tiên tắt refresh (None = mặc định của cluster)
+    original_refresh: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    # Process chết không gọi end_loads: row hết hạn thì không còn được tính
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -1,13 +1,14 @@
 """Conversation class maps to table conversation on database"""
 
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, DateTime, text
 from app.api.database.models.base import Base
 
 """
 class Conversation:
     conversation_id: str
     time_start: datetime
+    archived_at: datetime (lần cuối history được chuyển sang archive, None nếu chưa)
 """
 
 class Conversation(Base):
@@ -16,4 +17,7 @@ class Conversation(Base):
     __tablename__ = 'conversation'
 
     conversation_id = Column(String, primary_key=True)
-    time_start = Column(DateTime, default=datetime.utcnow)
+    # NOT NULL: keyset pagination (time_start, conversation_id) không bỏ sót row nào
+    time_start = Column(DateTime, nullable=False, default=datetime.utcnow,
+                        server_default=text("(now() AT TIME ZONE 'utc')"))
+    archived_at = Column(DateTime, nullable=True)
@@ -20,8 +20,9 @@ class ConversationDetail(Base):
 
     __tablename__ = 'conversation_detail'
 
+    # Bảng partition theo tháng trên cột time (migration 2) nên khoá chính là (id, time)
     id = Column(String, primary_key=True)
-    time = Column(DateTime, default=datetime.utcnow)
+    time = Column(DateTime, primary_key=True, default=datetime.utcnow)
     message_detail = Column(String)
     role = Column(String)
     conversation_id = Column(String, ForeignKey('conversation.conversation_id'))
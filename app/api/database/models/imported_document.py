@@ -1,6 +1,7 @@
 from __future__ import annotations
 from datetime import datetime
-from sqlalchemy import String, Boolean, Text, DateTime, text, func
+from typing import Optional
+from sqlalchemy import String, Boolean, Integer, Text, DateTime, text, func
 from sqlalchemy.orm import Mapped, mapped_column
 from app.api.database.models.base import Base
 
@@ -16,3 +17,19 @@ class ImportedDocument(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=func.now()
     )
+    # File lớn được lưu thành nhiều part liên tiếp của cùng một upload
+    part: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    parts: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default=text("1"))
+    # sha256 của file upload gốc: upload trùng byte không phải extract / lưu lại
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # Các part của cùng một upload (bulk import insert nhiều upload với cùng created_at)
+    upload_id: Mapped[Optional[str]] = mapped_column(String(36), nullable=True)
+    # Trạng thái ingestion (xem IngestionJob): job đang giữ document, lease, số lần thử, backoff
+    job_id: Mapped[Optional[str]] = mapped_column(String(36), nullable=True)
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    next_attempt_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    failed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
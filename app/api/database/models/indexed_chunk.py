@@ -0,0 +1,17 @@
+from __future__ import annotations
+from sqlalchemy import String, Integer, Index, text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.api.database.models.base import Base
+
+class IndexedChunk(Base):
+    """Chunk currently in an OpenSearch index, by file part; lets a re-imported file be re-indexed by diff"""
+    __tablename__ = "indexed_chunk"
+    __table_args__ = (Index("ix_indexed_chunk_index_name_file_name", "index_name", "file_name"),)
+
+    index_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # _id của chunk trong OpenSearch ("<doc_id>:<chunk>" của document đã index nó)
+    chunk_id: Mapped[str] = mapped_column(String(80), primary_key=True)
+    file_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    part: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    chunk_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    doc_id: Mapped[str] = mapped_column(String(36), nullable=False)
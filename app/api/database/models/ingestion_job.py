@@ -0,0 +1,28 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, Text, DateTime, text, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.api.database.models.base import Base
+
+class IngestionJob(Base):
+    """One process_unprocessed request, worked on by the background ingestion workers"""
+    __tablename__ = "ingestion_job"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    index_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    # queued -> running -> completed / completed_with_errors
+    status: Mapped[str] = mapped_column(
+        String(32), nullable=False, default="queued", server_default=text("'queued'")
+    )
+    docs_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    docs_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    docs_failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    chunks_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    retries: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -1,6 +1,6 @@
 """Chat Request model"""
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 
 class ChatRequest(BaseModel):
     """
@@ -9,13 +9,16 @@ class ChatRequest(BaseModel):
     """
     message: str
     conversation_id: str
+    # "text": stream token thô; "sse": Server-Sent Events + event metadata cuối
+    stream_format: Literal["text", "sse"] = "text"
 
     class Config:
         """Config."""
         json_schema_extra = {
             "example": {
                 "conversation_id": "1231223",
-                "message": "Hello. What is your name?"
+                "message": "Hello. What is your name?",
+                "stream_format": "sse"
             }
         }
 
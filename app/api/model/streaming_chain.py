@@ -2,36 +2,106 @@
     StreamingChat using LangChain and ChatOpenAI (no in-RAM memory)
 """
 from __future__ import annotations
-from collections.abc import AsyncGenerator
-from starlette import status
+import asyncio
+import re
+import time
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, Optional
 
-from langchain.callbacks.manager import AsyncCallbackManager
-from langchain.callbacks import AsyncIteratorCallbackHandler
+from langchain_core.callbacks import AsyncCallbackHandler
 from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from starlette import status
 
 from app.core.condense_prompt import _template
 from app.api.services.custom_prompt_service import CustomPromptService
-from app.api.responses.base import BaseResponse
+from app.api.services.answer_cache import answer_cache
+from app.api.services.admission import admission, AdmissionRejected
+from app.api.services.resilience import run_stage, get_stage_stats, backoff_delay, RETRYABLE_ERRORS
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.api.services.question_heuristics import is_self_contained, same_question
+from app.core.config import (
+    CONDENSE_MODE, CONDENSE_MIN_WORDS, CONDENSE_SPECULATIVE_RETRIEVAL, CHAT_DEADLINE, LLM_MAX_RETRIES,
+)
 from app.logger.logger import custom_logger
 
+# Tag gắn vào LLM trả lời, chỉ token của LLM này mới được stream ra client
+ANSWER_TAG = "answer_stream"
+
+NO_INFO_MESSAGE = "Sorry! I don't have any information about this question. Please provide me document about this."
+
+_WORD_CHUNK = re.compile(r"\S+\s*|\s+")
+
+
+class TokenQueueCallbackHandler(AsyncCallbackHandler):
+    """Collect tokens of the answer LLM into a queue for a single request."""
+
+    def __init__(self, tag: str = ANSWER_TAG) -> None:
+        self.tag = tag
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+
+    async def on_llm_new_token(self, token: str, *, tags: Optional[list[str]] = None, **kwargs: Any) -> None:
+        if token and tags and self.tag in tags:
+            self.queue.put_nowait(token)
+
+    async def aiter_until(
+        self, task: asyncio.Future, deadline: Optional[Deadline] = None
+    ) -> AsyncGenerator[str, None]:
+        """Yield queued tokens until `task` finishes, then drain what is left."""
+        while not task.done():
+            timeout = deadline.remaining() if deadline is not None else None
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("answer")
+            getter = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter, task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+        while not self.queue.empty():
+            yield self.queue.get_nowait()
+
+
+@asynccontextmanager
+async def _llm_slot(deadline: Deadline, stage: str) -> AsyncIterator[None]:
+    """LLM slot, chờ không quá thời gian còn lại của request.
+
+    Hết thời gian của request là DeadlineExceeded, không phải 503 "queue wait timed out".
+    """
+    gate = admission.llm
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(stage)
+    try:
+        await gate.acquire(min(gate.timeout, remaining))
+    except AdmissionRejected as e:
+        if e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE and remaining < gate.timeout:
+            raise DeadlineExceeded(stage) from e
+        raise
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        gate.release(time.monotonic() - started)
+
 
 class StreamingConversationRetrievalChain:
     """
     Streaming, không dùng ConversationBufferWindowMemory.
     Lịch sử chat được truyền qua tham số `chat_history` (nạp từ DB).
     Prompt lấy từ DB, không đọc file.
+    Kết quả (output, error, rejected, metrics) là của một request: tạo chain mới cho mỗi request.
     """
 
-    def __init__(self,
-                 conversation_id: str,
-                 streaming_cb: AsyncIteratorCallbackHandler,
-                 conv_cb_manager: AsyncCallbackManager,
-                 qa_prompt) -> None:
+    def __init__(self, conversation_id: str, qa_prompt) -> None:
         self.conversation_id = conversation_id
-        self.streaming_cb = streaming_cb
-        self.conv_cb_manager = conv_cb_manager
         self.qa_prompt = qa_prompt
         self.output = None
+        self.error: Optional[str] = None
+        # Gate LLM / embedding từ chối (luôn trước token đầu tiên): route trả 429 / 503
+        self.rejected: Optional[AdmissionRejected] = None
+        self.metrics: dict = {}
 
     def _build_prompts(self, current_template: str):
         cps = CustomPromptService(current_template, _template)
@@ -39,40 +109,233 @@ class StreamingConversationRetrievalChain:
         condense_question_prompt = cps.custom_condense_prompt()
         return chat_prompt_template, condense_question_prompt
 
+    async def _condense(
+        self,
+        conversation_chain: ConversationalRetrievalChain,
+        message: str,
+        chat_history_str: str,
+        deadline: Deadline,
+    ) -> str:
+        """Standalone question, như ConversationalRetrievalChain._acall."""
+        if not chat_history_str or conversation_chain.question_generator is None:
+            return message
+        async with _llm_slot(deadline, "condense"):
+            return await run_stage(
+                "condense",
+                lambda: conversation_chain.question_generator.arun(
+                    question=message, chat_history=chat_history_str
+                ),
+                deadline,
+                hedge=True,
+            )
+
+    async def _retrieve(self, conversation_chain: ConversationalRetrievalChain, question: str, deadline: Deadline):
+        docs = await run_stage("retrieval", lambda: conversation_chain.retriever.ainvoke(question), deadline, hedge=True)
+        return conversation_chain._reduce_tokens_below_limit(docs)
+
+    @staticmethod
+    def _needs_condense(message: str, chat_history_str: str) -> bool:
+        if not chat_history_str:
+            return False
+        if CONDENSE_MODE == "auto" and is_self_contained(message, CONDENSE_MIN_WORDS):
+            return False
+        return True
+
+    async def _prepare_question(
+        self,
+        conversation_chain: ConversationalRetrievalChain,
+        message: str,
+        chat_history_str: str,
+        deadline: Deadline,
+    ) -> tuple[str, Optional[asyncio.Future], bool]:
+        """Return (question, retrieval task already running for it or None, question is standalone).
+
+        Khi phải condense, retrieval trên câu hỏi gốc chạy song song với LLM condense và
+        kết quả nào xong trước được giữ. Retrieval thắng -> huỷ condense, trả lời câu gốc
+        (LLM trả lời vẫn thấy chat history) và không dùng answer cache cho lượt này.
+        """
+        if not self._needs_condense(message, chat_history_str):
+            self.metrics["condensed"] = False
+            return message, None, True
+        if not CONDENSE_SPECULATIVE_RETRIEVAL:
+            self.metrics["condensed"] = True
+            return await self._condense(conversation_chain, message, chat_history_str, deadline), None, True
+
+        speculative = asyncio.ensure_future(self._retrieve(conversation_chain, message, deadline))
+        condense = asyncio.ensure_future(self._condense(conversation_chain, message, chat_history_str, deadline))
+        try:
+            await asyncio.wait({speculative, condense}, return_when=asyncio.FIRST_COMPLETED)
+            # Retrieval lỗi không chặn lượt chat: chờ condense như bình thường
+            if not condense.done() and speculative.exception() is None:
+                condense.cancel()
+                self.metrics["condensed"] = False
+                self.metrics["speculative_hit"] = True
+                return message, speculative, False
+            question = await condense
+        except BaseException:
+            speculative.cancel()
+            condense.cancel()
+            raise
+        self.metrics["condensed"] = True
+        if same_question(question, message) and not (speculative.done() and speculative.exception() is not None):
+            self.metrics["speculative_hit"] = True
+            return question, speculative, True
+        speculative.cancel()
+        self.metrics["speculative_hit"] = False
+        return question, None, True
+
+    async def _stream_answer(
+        self,
+        conversation_chain: ConversationalRetrievalChain,
+        docs,
+        question: str,
+        chat_history_str: str,
+        deadline: Deadline,
+    ) -> AsyncGenerator[str, None]:
+        """Run the answer chain in background and yield tokens as they arrive.
+
+        Chỉ retry khi chưa có token nào được gửi cho client; không hedge vì output là stream.
+        """
+        stats = get_stage_stats("answer")
+        attempt = 0
+        while True:
+            handler = TokenQueueCallbackHandler()
+            emitted = False
+            started = time.monotonic()
+            async with _llm_slot(deadline, "answer"):
+                stats.calls += 1
+                task = asyncio.ensure_future(conversation_chain.combine_docs_chain.arun(
+                    input_documents=docs,
+                    question=question,
+                    chat_history=chat_history_str,
+                    callbacks=[handler],
+                ))
+                try:
+                    async for token in handler.aiter_until(task, deadline):
+                        emitted = True
+                        yield token
+                    self.output = task.result()
+                    stats.observe(time.monotonic() - started)
+                    return
+                except DeadlineExceeded:
+                    stats.timeouts += 1
+                    deadline.record("answer", "timeouts")
+                    raise
+                except RETRYABLE_ERRORS:
+                    attempt += 1
+                    delay = backoff_delay(attempt)
+                    if emitted or attempt > LLM_MAX_RETRIES or deadline.remaining() <= delay:
+                        stats.failures += 1
+                        raise
+                    stats.retries += 1
+                    deadline.record("answer", "retries")
+                finally:
+                    if not task.done():
+                        task.cancel()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _replay(answer: str) -> AsyncGenerator[str, None]:
+        """Stream a cached answer word by word."""
+        for chunk in _WORD_CHUNK.findall(answer):
+            yield chunk
+            await asyncio.sleep(0)
+
     async def generate_response(
         self,
         message: str,
         chat_template: str,
         conv_chain_service,
         conversation_chain: ConversationalRetrievalChain,
-        chat_history=None
+        chat_history=None,
+        prompt_version: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
     ) -> AsyncGenerator[str, None]:
+        """Yield answer tokens; `output`, `error`, `rejected` and `metrics` are set when done."""
+        deadline = deadline or Deadline(CHAT_DEADLINE)
+        self.output = None
+        self.error = None
+        self.rejected = None
+        self.metrics = {}
+        started = time.perf_counter()
+        first_token_at: Optional[float] = None
+        n_tokens = 0
+        cache_hit = False
+        retrieval: Optional[asyncio.Future] = None
         try:
-            if chat_template == getattr(conv_chain_service, "qa_prompt_text", None):
-                if chat_history is not None:
-                    output = await conversation_chain.acall({"question": message, "chat_history": chat_history})
-                else:
-                    output = await conversation_chain.acall({"question": message})
-                self.output = output["answer"]
-                yield self.output
-                return
+            if chat_template != getattr(conv_chain_service, "qa_prompt_text", None):
+                new_chat_prompt_template, condense_prompt = self._build_prompts(chat_template)
+                conv_chain_service.qa_prompt = new_chat_prompt_template
+                conv_chain_service.qa_prompt_text = chat_template
+                conversation_chain = conv_chain_service.generate_conv_chain(condense_prompt)
 
-            new_chat_prompt_template, condense_prompt = self._build_prompts(chat_template)
-            conv_chain_service.qa_prompt = new_chat_prompt_template
-            conv_chain_service.qa_prompt_text = chat_template
-            conversation_chain = conv_chain_service.generate_conv_chain(condense_prompt)
             if conversation_chain is None:
-                self.output = "Sorry! I don't have any information about this question. Please provide me document about this."
+                self.output = NO_INFO_MESSAGE
+                first_token_at = time.perf_counter()
+                n_tokens = 1
                 yield self.output
                 return
 
-            if chat_history is not None:
-                output = await conversation_chain.acall({"question": message, "chat_history": chat_history})
-            else:
-                output = await conversation_chain.acall({"question": message})
-            self.output = output["answer"]
-            yield self.output
+            chat_history_str = _get_chat_history(chat_history or [])
+            question, retrieval, standalone = await self._prepare_question(
+                conversation_chain, message, chat_history_str, deadline
+            )
+
+            # Semantic cache theo câu hỏi đã condense; embedding này cũng được
+            # retriever dùng lại từ embedding cache nên không tốn thêm request
+            question_vector = None
+            embeddings = getattr(getattr(conv_chain_service, "clients", None), "embeddings", None)
+            if answer_cache.enabled and prompt_version and embeddings is not None and standalone:
+                question_vector = await embeddings.aembed_query(question)
+                cached = answer_cache.lookup(question_vector, prompt_version)
+                if cached:
+                    cache_hit = True
+                    self.output = cached
+                    async for token in self._replay(cached):
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        n_tokens += 1
+                        yield token
+                    return
+
+            if retrieval is None:
+                retrieval = asyncio.ensure_future(self._retrieve(conversation_chain, question, deadline))
+            docs = await retrieval
+            async for token in self._stream_answer(conversation_chain, docs, question, chat_history_str, deadline):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                n_tokens += 1
+                yield token
+
+            if question_vector is not None and self.output:
+                answer_cache.store(question_vector, prompt_version, self.output)
+
+            # LLM không stream (vd. bị tắt streaming) -> trả nguyên câu trả lời
+            if n_tokens == 0 and self.output:
+                first_token_at = time.perf_counter()
+                n_tokens = 1
+                yield self.output
 
+        except AdmissionRejected as e:
+            custom_logger.warning(str(e))
+            self.rejected = e
+            self.error = str(e)
         except Exception as e:
             custom_logger.error(str(e))
-            yield BaseResponse.error_response(message=str(e), status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            self.error = str(e)
+        finally:
+            if retrieval is not None and not retrieval.done():
+                retrieval.cancel()
+            ended = time.perf_counter()
+            self.metrics = {
+                **self.metrics,
+                "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+                "total_ms": round((ended - started) * 1000, 1),
+                "tokens": n_tokens,
+                "cache_hit": cache_hit,
+                "stages": deadline.summary(),
+            }
+            custom_logger.info(
+                f"conversation={self.conversation_id} ttft_ms={self.metrics['ttft_ms']} "
+                f"total_ms={self.metrics['total_ms']} tokens={n_tokens} cache_hit={cache_hit}"
+            )
@@ -1,4 +1,5 @@
 """Base Response."""
+from __future__ import annotations
 
 from fastapi.responses import JSONResponse, ORJSONResponse
 from starlette import status
@@ -41,13 +42,18 @@ class BaseResponse:
         )
 
     @staticmethod
-    def error_response(message: str = "API error", status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR):
+    def error_response(
+            message: str = "API error",
+            status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            headers: dict | None = None,
+    ):
         """Error response with message and status code.
 
         Args:
             message: API Message.
             status_code: API status code.
             message_code: API message code.
+            headers: Extra response headers (e.g. Retry-After).
 
         Returns:
             Error response.
@@ -56,5 +62,6 @@ class BaseResponse:
             status_code=status_code,
             content={
                 "message": message,
-            }
+            },
+            headers=headers,
         )
@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
 
-from app.api.routes import import_route, chat_route, custom_prompt_route
+from app.api.routes import import_route, chat_route, custom_prompt_route, metrics_route, conversation_route
 
 app = APIRouter()
 
@@ -25,3 +25,17 @@ app.include_router(
     tags=["Custom Prompt"],
     prefix="/bot",
 )
+
+# Conversation listing / export route
+app.include_router(
+    conversation_route.router,
+    tags=["Conversation"],
+    prefix="/bot",
+)
+
+# Metrics route
+app.include_router(
+    metrics_route.router,
+    tags=["Metrics"],
+    prefix="/bot",
+)
@@ -2,107 +2,153 @@
     Chat API using LangChain and ChatOpenAI (DB history + OpenSearch retriever)
 """
 from __future__ import annotations
-import datetime
+import json
 from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from langchain.callbacks import AsyncIteratorCallbackHandler
-from langchain.callbacks.manager import AsyncCallbackManager
+from starlette.background import BackgroundTask
 
 from app.api.model.request import ChatRequest
 from app.api.services.chat_service import ConversationChainService
+from app.api.services.conversation_state import ConversationState, conversation_states
 from app.api.model.streaming_chain import StreamingConversationRetrievalChain
 from app.api.responses.base import BaseResponse
 from app.logger.logger import custom_logger
 
 from app.api.database.models.base import get_db
-from app.api.database.dao.conversation_dao import ConversationDAO
 from app.api.services.db_history import DbChatHistory
-from app.api.services.custom_prompt_service import CustomPromptService
-from app.core.condense_prompt import _template
+from app.api.services.prompt_cache import prompt_cache
+from app.api.services.admission import admission, AdmissionRejected, Ticket
+from app.core.deadline import Deadline
+from app.core.config import CHAT_DEADLINE
 
 router = APIRouter()
 
-callbacks: dict[str, dict] = {}
-conv_chain_services: dict[str, ConversationChainService] = {}
-conversation_chains: dict[str, object] = {}
-streaming_conversation_chains: dict[str, StreamingConversationRetrievalChain] = {}
 
-dao = ConversationDAO()
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
 @router.post("/stream_chat/")
 async def generate_response(data: ChatRequest, db: AsyncSession = Depends(get_db)):
     """
     Streaming chat. Prompt lấy từ DB. History lưu/đọc từ DB.
     """
+    ticket: Ticket | None = None
+    # Ngân sách thời gian end-to-end, dùng chung cho condense / retrieval / answer
+    deadline = Deadline(CHAT_DEADLINE)
     try:
         if not data.conversation_id:
             custom_logger.error("conversation_id is empty")
             return BaseResponse.error_response(message="conversation_id is empty")
 
-        now = datetime.datetime.now()
-        if data.conversation_id not in callbacks:
-            callbacks[data.conversation_id] = {"cb": AsyncIteratorCallbackHandler(),
-                                               "time_created": now}
-        else:
-            latest = callbacks[data.conversation_id]["time_created"]
-            if (now - latest).total_seconds() >= 43200:  # 12h reset
-                callbacks[data.conversation_id] = {"cb": AsyncIteratorCallbackHandler(),
-                                                   "time_created": now}
-        cb: AsyncIteratorCallbackHandler = callbacks[data.conversation_id]["cb"]
-        conv_cb_manager = AsyncCallbackManager([cb])
-
-        latest_prompt = await dao.get_prompt(db)
-        current_template = latest_prompt.content if latest_prompt else "You are a helpful assistant."
-
-        cps = CustomPromptService(current_template, _template)
-        qa_prompt = cps.custom_prompt()
-        condense_prompt = cps.custom_condense_prompt()
-
-        if data.conversation_id not in conv_chain_services:
-            conv_chain_services[data.conversation_id] = ConversationChainService(
-                temperature=0.2,
-                streaming_cb=cb,
-                conv_cb_manager=conv_cb_manager,
-                qa_prompt=qa_prompt
-            )
-        conv_svc = conv_chain_services[data.conversation_id]
+        # Quá tải -> trả 429/503 ngay thay vì nhận thêm request
+        ticket = await admission.admit_chat()
 
-        conv_svc.qa_prompt_text = current_template
+        prompt = await prompt_cache.get(db)
+        current_template = prompt.content
+        qa_prompt = prompt.qa_prompt
 
-        if data.conversation_id not in conversation_chains:
-            conversation_chains[data.conversation_id] = conv_svc.generate_conv_chain(condense_prompt)
+        state: ConversationState | None = conversation_states.get(data.conversation_id)
+        if state is None:
+            state = ConversationState(
+                conv_svc=ConversationChainService(
+                    temperature=0.2,
+                    qa_prompt=qa_prompt
+                ),
+            )
+            conversation_states.set(data.conversation_id, state)
+        conv_svc = state.conv_svc
+
+        # Prompt đổi -> dựng lại chain với template đã compile sẵn trong cache
+        if state.conversation_chain is None or state.prompt_version != prompt.version:
+            conv_svc.qa_prompt = qa_prompt
+            conv_svc.qa_prompt_text = current_template
+            state.conversation_chain = conv_svc.generate_conv_chain(prompt.condense_prompt)
+            state.prompt_version = prompt.version
 
         history = DbChatHistory(db, data.conversation_id, k=4)
-        await history.append_user(data.message)
+        # Nạp history TRƯỚC khi lưu câu hỏi hiện tại: lượt đầu có history rỗng -> không cần condense
         chat_history = await history.load_messages()
+        await history.append_user(data.message)
 
-        if data.conversation_id not in streaming_conversation_chains:
-            streaming_conversation_chains[data.conversation_id] = StreamingConversationRetrievalChain(
-                conversation_id=data.conversation_id,
-                streaming_cb=cb,
-                conv_cb_manager=conv_cb_manager,
-                qa_prompt=qa_prompt
-            )
+        # Mỗi request một chain: output / error / metrics không bị request song song cùng conversation ghi đè
+        streaming_chain = StreamingConversationRetrievalChain(
+            conversation_id=data.conversation_id,
+            qa_prompt=qa_prompt
+        )
+        use_sse = data.stream_format == "sse"
 
         async def event_generator():
-            async for token in streaming_conversation_chains[data.conversation_id].generate_response(
-                message=data.message,
-                chat_template=current_template,
-                conv_chain_service=conv_svc,
-                conversation_chain=conversation_chains[data.conversation_id],
-                chat_history=chat_history
-            ):
-                if isinstance(token, str):
-                    yield token
-
-            # Lưu câu trả lời AI vào DB sau khi stream xong
-            answer = streaming_conversation_chains[data.conversation_id].output
-            if isinstance(answer, str) and answer:
-                await history.append_ai(answer)
-
-        return StreamingResponse(event_generator(), media_type="text/plain")
-
+            try:
+                async for token in streaming_chain.generate_response(
+                    message=data.message,
+                    chat_template=current_template,
+                    conv_chain_service=conv_svc,
+                    conversation_chain=state.conversation_chain,
+                    chat_history=chat_history,
+                    prompt_version=prompt.version,
+                    deadline=deadline,
+                ):
+                    yield _sse("token", {"token": token}) if use_sse else token
+
+                if streaming_chain.rejected is not None and streaming_chain.output is None:
+                    # Chưa gửi gì: route trả lỗi HTTP kèm Retry-After thay cho stream
+                    return
+
+                # Lưu câu trả lời AI vào DB sau khi stream xong
+                answer = streaming_chain.output
+                if isinstance(answer, str) and answer:
+                    await history.append_ai(answer)
+
+                if use_sse:
+                    rejected = streaming_chain.rejected
+                    if rejected is not None:
+                        yield _sse("rejected", {"message": str(rejected), "status": rejected.status_code,
+                                                "retry_after": rejected.retry_after})
+                    elif streaming_chain.error:
+                        yield _sse("error", {"message": streaming_chain.error})
+                    yield _sse("metadata", {"conversation_id": data.conversation_id, **streaming_chain.metrics})
+            finally:
+                ticket.release()
+
+        # Chạy tới chunk đầu tiên trước khi gửi header: gate LLM / embedding chỉ từ chối trước
+        # token đầu tiên, nên lúc này vẫn trả được 429 / 503 + Retry-After cho cả sse và text
+        stream = event_generator()
+        first = await anext(stream, None)
+        if first is None and streaming_chain.rejected is not None:
+            raise streaming_chain.rejected
+        if first is None and streaming_chain.error:
+            # text: lỗi trước token đầu tiên (vd. hết deadline) -> trả lỗi thay vì body 200 rỗng
+            custom_logger.error(streaming_chain.error)
+            return BaseResponse.error_response(message=streaming_chain.error)
+
+        async def body():
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+
+        # BackgroundTask phòng trường hợp generator không bao giờ được chạy
+        if use_sse:
+            return StreamingResponse(
+                body(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                background=BackgroundTask(ticket.release),
+            )
+        return StreamingResponse(body(), media_type="text/plain", background=BackgroundTask(ticket.release))
+
+    except AdmissionRejected as e:
+        custom_logger.warning(str(e))
+        return BaseResponse.error_response(
+            message=str(e),
+            status_code=e.status_code,
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
+        if ticket is not None:
+            ticket.release()
         custom_logger.error(str(e))
         return BaseResponse.error_response(message=str(e))
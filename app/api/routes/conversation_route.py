@@ -0,0 +1,110 @@
+"""
+    Conversation / history listing API (keyset pagination + NDJSON export)
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import AsyncIterator, Callable, Literal, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app.api.database.dao.conversation_dao import ConversationDAO
+from app.api.database.models.base import get_db, session as async_session
+from app.api.responses.base import BaseResponse
+from app.api.services.pagination import decode_cursor, encode_cursor, page_size
+from app.core.config import EXPORT_BATCH_SIZE
+from app.logger.logger import custom_logger
+
+router = APIRouter()
+dao = ConversationDAO()
+
+
+def _ndjson(rows: Callable[[AsyncSession], AsyncIterator[dict]], filename: str) -> StreamingResponse:
+    """Stream rows as NDJSON; the generator owns its session since it outlives the request dependency."""
+
+    async def body():
+        async with async_session() as db:
+            async for row in rows(db):
+                yield orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/conversations")
+async def list_conversations(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Danh sách conversation theo (time_start, conversation_id).
+    `format=ndjson` export toàn bộ từ cursor trở đi, bộ nhớ không đổi.
+    """
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        return BaseResponse.error_response(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+    try:
+        if format == "ndjson":
+            return _ndjson(lambda s: dao.stream_conversations(s, EXPORT_BATCH_SIZE, after), "conversations.ndjson")
+
+        size = page_size(limit)
+        items = await dao.list_conversations(db, size, after)
+        next_cursor = None
+        if len(items) == size:
+            next_cursor = encode_cursor(items[-1]["time_start"], items[-1]["conversation_id"])
+        return BaseResponse.success_response(data={"items": items, "next_cursor": next_cursor})
+    except Exception as e:
+        custom_logger.error(str(e))
+        return BaseResponse.error_response(message=str(e))
+
+
+@router.get("/conversations/{conversation_id}/messages")
+async def list_messages(
+    conversation_id: str,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Tin nhắn của một conversation theo (time, id), gồm cả phần đã archive.
+    `format=ndjson` export các tin nhắn còn trong DB.
+    """
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        return BaseResponse.error_response(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+    try:
+        if format == "ndjson":
+            return _ndjson(
+                lambda s: dao.stream_details(s, EXPORT_BATCH_SIZE, conversation_id=conversation_id),
+                "messages.ndjson",
+            )
+
+        size = page_size(limit)
+        items = await dao.list_details(db, conversation_id, size, after)
+        next_cursor = encode_cursor(items[-1]["time"], items[-1]["id"]) if len(items) == size else None
+        return BaseResponse.success_response(data={"items": items, "next_cursor": next_cursor})
+    except Exception as e:
+        custom_logger.error(str(e))
+        return BaseResponse.error_response(message=str(e))
+
+
+@router.get("/messages/export")
+async def export_messages(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Export NDJSON mọi tin nhắn còn trong DB (không sort), lọc theo khoảng thời gian [since, until).
+    """
+    return _ndjson(
+        lambda s: dao.stream_details(s, EXPORT_BATCH_SIZE, since=since, until=until),
+        "messages.ndjson",
+    )
@@ -10,6 +10,7 @@ from app.api.model.request import PromptRequest
 from app.api.database.models.base import get_db
 from app.api.database.dao.conversation_dao import ConversationDAO
 from app.api.database.models.custom_prompt import CustomPrompt
+from app.api.services.prompt_cache import prompt_cache
 
 router = APIRouter()
 dao = ConversationDAO()
@@ -21,4 +22,5 @@ async def custom_prompt(prompt_request: PromptRequest, db: AsyncSession = Depend
     """
     cp = CustomPrompt(id=str(uuid.uuid4()), content=prompt_request.prompt)
     await dao.add_custom_prompt(db, cp)
+    prompt_cache.invalidate(cp)
     return prompt_request.prompt
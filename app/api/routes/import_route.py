@@ -1,24 +1,30 @@
 """ Import routes """
 from __future__ import annotations
-import io
+import os
+from collections import Counter
+from typing import List
 from fastapi import APIRouter, UploadFile, File, Depends
+from starlette import status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.services.import_service import ImportService
-from app.api.services.opensearch_processor import OpenSearchProcessor
+from app.api.services.bulk_import import BulkImporter
+from app.api.services.import_service import ImportService, FileTooLargeError, SUPPORTED_EXTENSIONS, spool_upload
+from app.api.services.ingestion_worker import ingestion_workers, job_status
+from app.api.database.dao.ingestion_job_dao import IngestionJobDAO
 from app.api.model.request import ProcessUnprocessedRequest
 from app.api.responses.base import BaseResponse
 from app.logger.logger import custom_logger
-from app.core.config import MAX_FILE_SIZE
+from app.core.config import MAX_FILE_SIZE, OPENSEARCH_INDEX
 from app.api.database.models.base import get_db
 
 router = APIRouter()
+job_dao = IngestionJobDAO()
 
 @router.post("/import_data", response_description="import")
 async def upload_file(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
     """
-    Upload -> extract text -> LƯU RAW vào DB (is_process=false).
-    Hỗ trợ .pdf, .txt, .docx
+    Upload (ghi ra file tạm theo từng khối, tính sha256) -> extract text theo trang -> LƯU RAW vào DB (is_process=false).
+    File lớn được lưu thành nhiều part; file trùng byte dùng lại bản đã lưu. Hỗ trợ .pdf, .txt, .docx
     """
     try:
         file_size = getattr(file, "size", None)
@@ -26,24 +32,36 @@ async def upload_file(file: UploadFile = File(...), db: AsyncSession = Depends(g
             return BaseResponse.error_response(message="File is too large")
 
         ext = file.filename.split(".")[-1].lower()
-        if ext not in ["pdf", "txt", "docx"]:
+        if ext not in SUPPORTED_EXTENSIONS:
             return BaseResponse.error_response(message="Only support .pdf, .txt, .docx")
 
-        await file.seek(0)
-        file_bytes = await file.read()
-        file_stream = io.BytesIO(file_bytes)
+        path, content_hash = await spool_upload(file, MAX_FILE_SIZE)
+        try:
+            return await ImportService(db).save_upload(path, file.filename, ext, content_hash)
+        finally:
+            os.remove(path)
 
-        svc = ImportService(file_stream, db)
-
-        if ext == "pdf":
-            text = svc.pdf_to_text()
-        elif ext == "txt":
-            text = svc.txt_to_text()
-        else:
-            text = svc.docx_to_text()
+    except FileTooLargeError as e:
+        return BaseResponse.error_response(message=str(e))
+    except Exception as e:
+        custom_logger.error(str(e))
+        return BaseResponse.error_response(message=str(e))
 
-        return await svc.save_raw(file.filename, text)
 
+@router.post("/import_bulk", response_description="bulk import")
+async def bulk_import(files: List[UploadFile] = File(...)):
+    """
+    Import nhiều file (.pdf, .txt, .docx) và / hoặc file .zip trong một request.
+    Extract song song, insert theo batch; trả về manifest trạng thái của từng file / member ZIP.
+    """
+    try:
+        manifest = await BulkImporter().run(files)
+        counts = Counter(entry["status"] for entry in manifest)
+        return BaseResponse.success_response(
+            message=f"Imported {counts['imported']} file(s), {counts['unchanged']} unchanged, "
+                    f"{counts['failed']} failed, {counts['skipped']} skipped",
+            data={"files": manifest, **{status_: counts[status_] for status_ in ("imported", "unchanged", "failed", "skipped")}},
+        )
     except Exception as e:
         custom_logger.error(str(e))
         return BaseResponse.error_response(message=str(e))
@@ -52,9 +70,57 @@ async def upload_file(file: UploadFile = File(...), db: AsyncSession = Depends(g
 @router.post("/opensearch/process_unprocessed")
 async def process_unprocessed(req: ProcessUnprocessedRequest, db: AsyncSession = Depends(get_db)):
     """
-    Đọc các record imported_document có is_process=false,
-    chunk + embed + index vào OpenSearch,
-    sau đó set is_process=true.
+    Tạo ingestion job cho tối đa batch_size record imported_document có is_process=false.
+    Worker nền sẽ chunk + embed + index vào OpenSearch rồi set is_process=true;
+    theo dõi tiến độ qua GET /opensearch/jobs/{job_id}.
+    """
+    try:
+        job = await job_dao.create_job(db, req.index_name or OPENSEARCH_INDEX, req.batch_size)
+        if job is None:
+            return BaseResponse.success_response(message="No unprocessed documents.")
+        ingestion_workers.wake()
+        return BaseResponse.success_response(
+            message=f"Queued {job.docs_total} document(s) for OpenSearch index '{job.index_name}'",
+            status_code=status.HTTP_202_ACCEPTED,
+            data=job_status(job),
+        )
+    except Exception as e:
+        custom_logger.error(str(e))
+        return BaseResponse.error_response(message=str(e))
+
+
+@router.post("/opensearch/jobs/{job_id}/requeue_failed")
+async def requeue_failed_documents(job_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Đưa các document của job đã lỗi hẳn (hết số lần thử) về hàng đợi, số lần thử tính lại từ 0.
+    """
+    try:
+        job = await job_dao.get_job(db, job_id)
+        if job is None:
+            return BaseResponse.error_response(message="Job not found", status_code=status.HTTP_404_NOT_FOUND)
+        requeued = await job_dao.requeue_failed(db, job_id)
+        if requeued:
+            ingestion_workers.wake()
+        await db.refresh(job)
+        return BaseResponse.success_response(
+            message=f"Requeued {requeued} failed document(s)",
+            data=job_status(job),
+        )
+    except Exception as e:
+        custom_logger.error(str(e))
+        return BaseResponse.error_response(message=str(e))
+
+
+@router.get("/opensearch/jobs/{job_id}")
+async def ingestion_job_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Tiến độ của ingestion job: số document xong / lỗi, chunk, docs/sec, chunks/sec.
     """
-    processor = OpenSearchProcessor(db, index_name=req.index_name)
-    return await processor.process_unprocessed(limit=req.batch_size)
+    try:
+        job = await job_dao.get_job(db, job_id)
+        if job is None:
+            return BaseResponse.error_response(message="Job not found", status_code=status.HTTP_404_NOT_FOUND)
+        return BaseResponse.success_response(data=job_status(job))
+    except Exception as e:
+        custom_logger.error(str(e))
+        return BaseResponse.error_response(message=str(e))
@@ -0,0 +1,18 @@
+"""
+    Metrics API
+"""
+from __future__ import annotations
+from fastapi import APIRouter
+
+from app.api.responses.base import BaseResponse
+from app.core.metrics import collect_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Counter nội bộ của process (cache hit/miss/eviction, ...).
+    """
+    return BaseResponse.success_response(data=collect_metrics())
@@ -0,0 +1,137 @@
+"""
+    Admission control: giới hạn số chat / LLM call / embedding call đồng thời
+"""
+from __future__ import annotations
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from starlette import status
+
+from app.core.metrics import register_metrics
+from app.core.config import (
+    ADMISSION_MAX_CHATS, ADMISSION_CHAT_QUEUE,
+    ADMISSION_MAX_LLM_CALLS, ADMISSION_MAX_EMBED_CALLS, ADMISSION_CALL_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a gate is saturated; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, gate: str, status_code: int, retry_after: int) -> None:
+        self.gate = gate
+        self.status_code = status_code
+        self.retry_after = retry_after
+        reason = "queue is full" if status_code == status.HTTP_429_TOO_MANY_REQUESTS else "queue wait timed out"
+        super().__init__(f"Server is busy ({gate} {reason}), retry after {retry_after}s")
+
+
+class Gate:
+    """Concurrency cap with a bounded FIFO wait queue and a wait deadline."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, timeout: float) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # EWMA thời gian giữ slot, dùng để ước lượng Retry-After
+        self._avg_hold = 1.0
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold * (self.waiting + 1) / self.max_concurrency))
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        if not self._sem.locked():
+            # Còn slot: semaphore trả về ngay, không xếp hàng
+            await self._sem.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected_full += 1
+                raise AdmissionRejected(self.name, status.HTTP_429_TOO_MANY_REQUESTS, self.retry_after())
+            self.waiting += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout if timeout is not None else self.timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise AdmissionRejected(self.name, status.HTTP_503_SERVICE_UNAVAILABLE, self.retry_after())
+            finally:
+                self.waiting -= 1
+                waited = time.monotonic() - started
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self, held: Optional[float] = None) -> None:
+        self.in_flight -= 1
+        if held is not None:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+        self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        await self.acquire(timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else None,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class Ticket:
+    """Slot held for a whole request; `release` is idempotent."""
+
+    def __init__(self, gate: Gate) -> None:
+        self.gate = gate
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.gate.release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """Gates for whole chat requests and for individual LLM / embedding calls."""
+
+    def __init__(self) -> None:
+        self.chat = Gate("chat", ADMISSION_MAX_CHATS, ADMISSION_CHAT_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+        self.llm = Gate("llm", ADMISSION_MAX_LLM_CALLS, ADMISSION_CALL_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+        self.embedding = Gate("embedding", ADMISSION_MAX_EMBED_CALLS, ADMISSION_CALL_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+        register_metrics("admission", self.stats)
+
+    async def admit_chat(self) -> Ticket:
+        await self.chat.acquire()
+        return Ticket(self.chat)
+
+    def stats(self) -> Dict[str, dict]:
+        return {gate.name: gate.stats() for gate in (self.chat, self.llm, self.embedding)}
+
+
+admission = AdmissionController()
@@ -0,0 +1,107 @@
+"""
+    Semantic answer cache: trả lại câu trả lời cũ cho câu hỏi gần trùng
+"""
+from __future__ import annotations
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import register_metrics
+from app.core.config import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL,
+)
+
+
+class AnswerCache:
+    """Answers keyed by the standalone-question embedding.
+
+    Chỉ giữ entry của (prompt version, index generation) hiện tại: đổi prompt
+    hoặc index thêm tài liệu thì toàn bộ cache bị bỏ. Worker khác không thấy
+    `invalidate()` nên entry còn bị giới hạn bởi `ttl`.
+    """
+
+    def __init__(self, enabled: bool, threshold: float, max_entries: int, ttl: float) -> None:
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self._scope: Optional[Tuple[str, int]] = None
+        self._vectors: List[np.ndarray] = []
+        self._answers: List[str] = []
+        self._created: List[float] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        register_metrics("answer_cache", self.stats)
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _reset(self, scope: Optional[Tuple[str, int]]) -> None:
+        self._scope = scope
+        self._vectors, self._answers, self._created = [], [], []
+        self._matrix = None
+
+    def lookup(self, vector: List[float], prompt_version: str) -> Optional[str]:
+        """Cached answer whose question has cosine similarity >= threshold, if any."""
+        with self._lock:
+            if self._scope != (prompt_version, self.generation) or not self._vectors:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+            scores = self._matrix @ self._unit(vector)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold and time.monotonic() - self._created[best] <= self.ttl:
+                self.hits += 1
+                return self._answers[best]
+            self.misses += 1
+            return None
+
+    def store(self, vector: List[float], prompt_version: str, answer: str) -> None:
+        with self._lock:
+            scope = (prompt_version, self.generation)
+            if self._scope != scope:
+                self._reset(scope)
+            # Bỏ entry cũ nhất khi đầy
+            if len(self._vectors) >= self.max_entries:
+                del self._vectors[0], self._answers[0], self._created[0]
+            self._vectors.append(self._unit(vector))
+            self._answers.append(answer)
+            self._created.append(time.monotonic())
+            self._matrix = None
+
+    def invalidate(self) -> None:
+        """Drop every entry, e.g. after new documents were indexed."""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._reset(None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._vectors),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "generation": self.generation,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = AnswerCache(
+    enabled=ANSWER_CACHE_ENABLED,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl=ANSWER_CACHE_TTL,
+)
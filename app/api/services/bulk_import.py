@@ -0,0 +1,240 @@
+"""
+    Bulk import: nhiều file hoặc file ZIP trong một request, extract song song,
+    insert imported_document theo batch nhiều row, trả về manifest theo từng file
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.database.models.base import session as async_session
+from app.api.database.models.imported_document import ImportedDocument
+from app.api.services.extraction_pool import extraction_pool
+from app.api.services.import_service import (
+    ImportService, FileTooLargeError, SUPPORTED_EXTENSIONS, aiter_parts, spool_upload,
+)
+from app.core.config import (
+    MAX_FILE_SIZE, UPLOAD_SPOOL_DIR, UPLOAD_READ_CHUNK,
+    IMPORT_BULK_MAX_FILES, IMPORT_BULK_MAX_BYTES, IMPORT_BULK_CONCURRENCY,
+    IMPORT_BULK_INSERT_ROWS, IMPORT_BULK_INSERT_CHARS,
+)
+from app.logger.logger import custom_logger
+
+# file_name trong DB tối đa 255 ký tự
+_MAX_NAME = 255
+
+
+def _extension(name: str) -> str:
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+def _copy_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, max_size: int) -> Tuple[str, str]:
+    """Decompress one member to a temp file, enforcing `max_size` on the bytes actually read; (path, sha256)."""
+    fd, path = tempfile.mkstemp(suffix=f".{_extension(info.filename)}", dir=UPLOAD_SPOOL_DIR or None)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out, zf.open(info) as src:
+            while block := src.read(UPLOAD_READ_CHUNK):
+                size += len(block)
+                if size > max_size:
+                    raise FileTooLargeError("File is too large")
+                digest.update(block)
+                out.write(block)
+        return path, digest.hexdigest()
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+async def _chain(first: List[str], rest: AsyncIterator[str]) -> AsyncIterator[str]:
+    for item in first:
+        yield item
+    async for item in rest:
+        yield item
+
+
+class BulkImporter:
+    """One bulk import request: sources -> parallel extraction -> batched inserts -> manifest."""
+
+    def __init__(self,
+                 session_factory: async_sessionmaker[AsyncSession] = async_session,
+                 concurrency: int = IMPORT_BULK_CONCURRENCY,
+                 insert_rows: int = IMPORT_BULK_INSERT_ROWS,
+                 insert_chars: int = IMPORT_BULK_INSERT_CHARS,
+                 max_files: int = IMPORT_BULK_MAX_FILES,
+                 max_bytes: int = IMPORT_BULK_MAX_BYTES) -> None:
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.insert_rows = insert_rows
+        self.insert_chars = insert_chars
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.manifest: List[Dict] = []
+        self._bytes = 0
+        # Row của các file một part chờ insert chung; (manifest entry, row)
+        self._pending: List[Tuple[Dict, Dict]] = []
+        self._pending_chars = 0
+        self._flush_lock = asyncio.Lock()
+
+    def _entry(self, file_name: str, status: str, **fields) -> Dict:
+        entry = {"file_name": file_name, "status": status, **fields}
+        self.manifest.append(entry)
+        return entry
+
+    def _admit(self, file_name: str, size: int) -> Optional[Dict]:
+        """Manifest entry when a file is rejected by the request limits, else None."""
+        if len(self.manifest) >= self.max_files:
+            return self._entry(file_name, "skipped", error=f"More than {self.max_files} files in one request")
+        if size > MAX_FILE_SIZE:
+            return self._entry(file_name, "failed", error="File is too large")
+        if self._bytes + size > self.max_bytes:
+            return self._entry(file_name, "skipped", error="Request exceeds the bulk import size limit")
+        self._bytes += size
+        return None
+
+    async def _sources(self, files: List[UploadFile]) -> AsyncIterator[Tuple[Dict, str, str, str]]:
+        """(manifest entry, path, ext, content_hash) per importable file, ZIP members included; the consumer removes path."""
+        for file in files:
+            name = file.filename or "upload"
+            ext = _extension(name)
+            if ext != "zip" and ext not in SUPPORTED_EXTENSIONS:
+                self._entry(name, "skipped", error="Only support .pdf, .txt, .docx, .zip")
+                continue
+            try:
+                path, content_hash = await spool_upload(file, MAX_FILE_SIZE if ext != "zip" else self.max_bytes)
+            except Exception as e:
+                self._entry(name, "failed", error=str(e))
+                continue
+            if ext != "zip":
+                if self._admit(name, os.path.getsize(path)) is None:
+                    yield self._entry(name, "pending"), path, ext, content_hash
+                else:
+                    os.remove(path)
+                continue
+
+            try:
+                async for item in self._zip_members(name, path):
+                    yield item
+            finally:
+                os.remove(path)
+
+    async def _zip_members(self, archive: str, path: str) -> AsyncIterator[Tuple[Dict, str, str, str]]:
+        try:
+            zf = await asyncio.to_thread(zipfile.ZipFile, path)
+        except zipfile.BadZipFile as e:
+            self._entry(archive, "failed", error=f"Invalid ZIP archive: {e}")
+            return
+        with zf:
+            for info in zf.infolist():
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+                name = info.filename[-_MAX_NAME:]
+                ext = _extension(info.filename)
+                if ext not in SUPPORTED_EXTENSIONS:
+                    self._entry(name, "skipped", error="Only support .pdf, .txt, .docx")
+                    continue
+                # file_size khai báo trong ZIP có thể sai: _copy_member kiểm tra lại theo byte thực
+                if self._admit(name, info.file_size) is not None:
+                    continue
+                try:
+                    member, content_hash = await asyncio.to_thread(_copy_member, zf, info, MAX_FILE_SIZE)
+                except Exception as e:
+                    self._entry(name, "failed", error=str(e))
+                    continue
+                yield self._entry(name, "pending"), member, ext, content_hash
+
+    async def _flush(self, force: bool = False) -> None:
+        """Insert buffered single-part documents with one multi-row INSERT."""
+        async with self._flush_lock:
+            if not self._pending or (not force and len(self._pending) < self.insert_rows
+                                     and self._pending_chars < self.insert_chars):
+                return
+            batch, self._pending, self._pending_chars = self._pending, [], 0
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(ImportedDocument).values([row for _, row in batch]))
+                    await db.commit()
+            except Exception as e:
+                custom_logger.error(str(e))
+                for entry, _ in batch:
+                    entry.update(status="failed", error=str(e))
+                return
+            for entry, row in batch:
+                entry.update(status="imported", id=row["id"], parts=1)
+
+    async def _import(self, entry: Dict, path: str, ext: str, content_hash: str) -> None:
+        try:
+            # File trùng byte: dùng lại bản đã lưu, không extract
+            async with self.session_factory() as db:
+                reused, ids = await ImportService(db).reuse_upload(entry["file_name"], content_hash)
+            if reused is not None:
+                entry.update(status="imported" if reused == "reused" else reused, id=ids[0], parts=len(ids),
+                             reused=True)
+                return
+            pages = extraction_pool.pages(path, ext, wait=True)
+            parts = aiter_parts(pages)
+            try:
+                # Đọc trước tối đa hai part: một part -> batch insert, nhiều part -> transaction riêng
+                head: List[str] = []
+                async for part in parts:
+                    head.append(part)
+                    if len(head) == 2:
+                        break
+                if len(head) <= 1:
+                    content = head[0] if head else ""
+                    doc_id = str(uuid.uuid4())
+                    self._pending.append((entry, {
+                        "id": doc_id, "file_name": entry["file_name"], "content": content,
+                        "is_process": False, "part": 0, "parts": 1, "content_hash": content_hash,
+                        "upload_id": doc_id,
+                    }))
+                    self._pending_chars += len(content)
+                else:
+                    async with self.session_factory() as db:
+                        ids = await ImportService(db).save_parts(entry["file_name"], _chain(head, parts), content_hash)
+                    entry.update(status="imported", id=ids[0], parts=len(ids))
+            finally:
+                await parts.aclose()
+                await pages.aclose()
+        except Exception as e:
+            custom_logger.error(f"bulk import of {entry['file_name']} failed: {e}")
+            entry.update(status="failed", error=str(e))
+        finally:
+            os.remove(path)
+        await self._flush()
+
+    async def run(self, files: List[UploadFile]) -> List[Dict]:
+        """Import every file; the manifest lists each input file / ZIP member in order."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+
+        async def worker() -> None:
+            while (item := await queue.get()) is not None:
+                await self._import(*item)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            # Hàng đợi nhỏ: số file đã giải nén ra đĩa nhưng chưa extract luôn bị giới hạn
+            async for item in self._sources(files):
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            # Worker bị huỷ giữa chừng: xoá file tạm còn trong hàng đợi
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is not None and os.path.exists(item[1]):
+                    os.remove(item[1])
+        await self._flush(force=True)
+        return self.manifest
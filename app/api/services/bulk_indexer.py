@@ -0,0 +1,220 @@
+"""
+    Ghi chunk vào OpenSearch qua _bulk: batch theo số action / số byte, nhiều request song song,
+    tuỳ chọn tắt refresh trong lúc load lớn
+"""
+from __future__ import annotations
+import asyncio
+import os
+import random
+import socket
+import threading
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import orjson
+from opensearchpy import OpenSearch
+from opensearchpy.exceptions import TransportError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.database.dao.bulk_load_dao import BulkLoadDAO
+from app.core.metrics import register_metrics
+from app.logger.logger import custom_logger
+
+# Item bị từ chối do quá tải -> gửi lại
+_RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class BulkIndexer:
+    """Index (id, source) pairs through the `_bulk` API; returns the ids that could not be written."""
+
+    def __init__(self,
+                 client: OpenSearch,
+                 max_actions: int,
+                 max_bytes: int,
+                 concurrency: int,
+                 max_retries: int,
+                 session_factory: async_sessionmaker[AsyncSession],
+                 load_lease: float = 600,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 30.0) -> None:
+        self.client = client
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = concurrency
+        self._sem = asyncio.Semaphore(concurrency)
+        # Tắt / bật refresh được phối hợp giữa các process qua bảng bulk_load
+        self.session_factory = session_factory
+        self.loads = BulkLoadDAO()
+        self.load_lease = load_lease
+        self.holder = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # index đang load -> thời điểm (loop time) cần gia hạn lease
+        self._loading: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self.requests = 0
+        self.docs = 0
+        self.bytes = 0
+        self.retries = 0
+        self.failed = 0
+        register_metrics("bulk_indexer", self.stats)
+
+    def next_batch(
+        self, index_name: str, docs: Iterator[Tuple[str, dict]], carry: List[Tuple[str, bytes]]
+    ) -> Optional[Tuple[List[str], List[bytes]]]:
+        """Serialize the next NDJSON batch bounded by `max_actions` and `max_bytes`; None when `docs` is exhausted.
+
+        `carry` giữ action pair đã serialize nhưng vượt giới hạn byte của batch trước.
+        """
+        ids: List[str] = []
+        lines: List[bytes] = []
+        size = 0
+        while len(ids) < self.max_actions:
+            if carry:
+                _id, pair = carry.pop()
+            else:
+                item = next(docs, None)
+                if item is None:
+                    break
+                _id, source = item
+                pair = (
+                    orjson.dumps({"index": {"_index": index_name, "_id": _id}}, option=orjson.OPT_APPEND_NEWLINE)
+                    + orjson.dumps(source, option=orjson.OPT_APPEND_NEWLINE)
+                )
+            if ids and size + len(pair) > self.max_bytes:
+                carry.append((_id, pair))
+                break
+            ids.append(_id)
+            lines.append(pair)
+            size += len(pair)
+        return (ids, lines) if ids else None
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def _send(self, ids: List[str], lines: List[bytes]) -> Set[str]:
+        """One bulk request; items rejected for overload are sent again. Returns the ids that failed."""
+        failed: Set[str] = set()
+        error: Optional[str] = None
+        attempt = 0
+        while ids:
+            body = b"".join(lines)
+            try:
+                async with self._sem:
+                    res = await asyncio.to_thread(self.client.bulk, body=body)
+                self.requests += 1
+                self.bytes += len(body)
+            except TransportError as e:
+                # ConnectionError / ConnectionTimeout có status_code "N/A"
+                status = e.status_code if isinstance(e.status_code, int) else None
+                error = str(e)
+                if status is not None and status not in _RETRY_STATUSES:
+                    failed.update(ids)
+                    break
+                retry = list(range(len(ids)))
+            else:
+                retry = []
+                for i, item in enumerate(res["items"]):
+                    result = item.get("index", {})
+                    if result.get("status", 500) < 300:
+                        self.docs += 1
+                    elif result.get("status") in _RETRY_STATUSES:
+                        retry.append(i)
+                    else:
+                        failed.add(ids[i])
+                        error = str(result.get("error"))
+            if not retry:
+                break
+            ids, lines = [ids[i] for i in retry], [lines[i] for i in retry]
+            if attempt >= self.max_retries:
+                failed.update(ids)
+                break
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self._delay(attempt))
+        if failed:
+            self.failed += len(failed)
+            custom_logger.error(f"bulk index failed for {len(failed)} document(s): {error}")
+        return failed
+
+    async def index(self, index_name: str, docs: Iterable[Tuple[str, dict]]) -> Set[str]:
+        """Write `docs` to `index_name`; returns the ids that failed.
+
+        `concurrency` sender cùng lấy batch kế tiếp từ `docs` và serialize nó trong thread:
+        mỗi lúc chỉ có khoảng max_bytes x concurrency byte NDJSON trong RAM, không phải cả job.
+        """
+        docs = iter(docs)
+        carry: List[Tuple[str, bytes]] = []
+        lock = threading.Lock()
+
+        def take() -> Optional[Tuple[List[str], List[bytes]]]:
+            with lock:
+                return self.next_batch(index_name, docs, carry)
+
+        async def sender() -> Set[str]:
+            failed: Set[str] = set()
+            while True:
+                batch = await asyncio.to_thread(take)
+                if batch is None:
+                    return failed
+                failed |= await self._send(*batch)
+
+        results = await asyncio.gather(*(sender() for _ in range(max(1, self.concurrency))))
+        return set().union(*results)
+
+    def _refresh_interval(self, index_name: str) -> Optional[str]:
+        settings = self.client.indices.get_settings(index=index_name, name="index.refresh_interval")
+        return settings.get(index_name, {}).get("settings", {}).get("index", {}).get("refresh_interval")
+
+    def _set_refresh(self, index_name: str, interval: Optional[str]) -> None:
+        self.client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": interval}})
+
+    async def begin_load(self, index_name: str) -> None:
+        """Disable refresh of `index_name` until every process loading it has called `end_loads`.
+
+        Process đầu tiên lưu refresh_interval ban đầu vào bulk_load; các lần gọi sau chỉ gia hạn lease.
+        """
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if self._loading.get(index_name, 0) > now:
+                return
+            async with self.session_factory() as db:
+                await self.loads.lock(db, index_name)
+                holders, original = await self.loads.live_holders(db, index_name)
+                if not holders:
+                    current = await asyncio.to_thread(self._refresh_interval, index_name)
+                    # "-1" mà không còn process nào load: sót lại từ lần load bị crash -> khôi phục về mặc định
+                    original = None if current == "-1" else current
+                    await asyncio.to_thread(self._set_refresh, index_name, "-1")
+                await self.loads.hold(db, index_name, self.holder, original, self.load_lease)
+                await db.commit()
+            self._loading[index_name] = now + self.load_lease / 2
+
+    async def end_loads(self) -> None:
+        """Leave load mode for every index; the last process to leave restores refresh_interval and refreshes."""
+        async with self._lock:
+            for index_name in list(self._loading):
+                try:
+                    async with self.session_factory() as db:
+                        await self.loads.lock(db, index_name)
+                        _, original = await self.loads.live_holders(db, index_name)
+                        await self.loads.release(db, index_name, self.holder)
+                        remaining, _ = await self.loads.live_holders(db, index_name)
+                        if not remaining:
+                            await asyncio.to_thread(self._set_refresh, index_name, original)
+                            await asyncio.to_thread(self.client.indices.refresh, index=index_name)
+                        await db.commit()
+                    del self._loading[index_name]
+                except Exception as e:
+                    custom_logger.error(f"restoring refresh_interval of '{index_name}' failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "docs": self.docs,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "failed": self.failed,
+            "loading": list(self._loading),
+        }
@@ -2,63 +2,30 @@
 from __future__ import annotations
 from starlette import status
 
-# ✅ Dùng wrapper mới
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import OpenSearchVectorSearch
-
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain, ConversationalRetrievalChain
 from langchain.chains.question_answering import load_qa_chain
-from langchain.callbacks.manager import AsyncCallbackManager
-from langchain.callbacks import AsyncIteratorCallbackHandler
 
 from app.api.responses.base import BaseResponse
+from app.api.services.client_registry import get_clients
 from app.logger.logger import custom_logger
-from app.core.config import MODEL_NAME, OPENAI_API_KEY
-from app.core.config import (
-    OPENSEARCH_URL, OPENSEARCH_USER, OPENSEARCH_PASSWORD, OPENSEARCH_INDEX,
-    OPENSEARCH_USE_SSL, OPENSEARCH_VERIFY_CERTS
-)
 
-EMBED_MODEL = "text-embedding-3-small"
-EMBED_DIM = 1536
 
 class ConversationChainService:
+    """Per-conversation chain wiring; heavy clients come from the shared registry."""
+
     def __init__(self,
                  temperature: float,
-                 streaming_cb: AsyncIteratorCallbackHandler,
-                 conv_cb_manager: AsyncCallbackManager,
                  qa_prompt: PromptTemplate) -> None:
         self.temperature = temperature
-        self.streaming_cb = streaming_cb
-        self.conv_cb_manager = conv_cb_manager
         self.qa_prompt = qa_prompt
 
         try:
-            embeddings = OpenAIEmbeddings(
-                model=EMBED_MODEL,
-                dimensions=EMBED_DIM,
-                api_key=OPENAI_API_KEY,
-            )
-
-            vector_index = OpenSearchVectorSearch(
-                embedding_function=embeddings,
-                index_name=OPENSEARCH_INDEX,
-                opensearch_url=OPENSEARCH_URL,
-                http_auth=(OPENSEARCH_USER, OPENSEARCH_PASSWORD) if OPENSEARCH_USER else None,
-                use_ssl=OPENSEARCH_USE_SSL,
-                verify_certs=OPENSEARCH_VERIFY_CERTS,
-                vector_field="vector",
-                text_field="text",
-                engine="lucene",
-                space_type="cosinesimil",
-            )
-            self.retriever = vector_index.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 3, "vector_field": "vector", "text_field": "text"}
-            )
+            self.clients = get_clients()
+            self.retriever = self.clients.retriever
         except Exception as e:
             custom_logger.error(str(e))
+            self.clients = None
             self.retriever = None
 
     def generate_conv_chain(self, condense_prompt: PromptTemplate | None):
@@ -66,26 +33,7 @@ class ConversationChainService:
             if not self.retriever:
                 return None
 
-            question_gen_llm = ChatOpenAI(
-                model=MODEL_NAME,
-                temperature=self.temperature,
-                max_retries=15,
-                timeout=100,
-                max_tokens=200,
-                api_key=OPENAI_API_KEY,
-                streaming=False,
-            )
-
-            streaming_llm = ChatOpenAI(
-                model=MODEL_NAME,
-                temperature=self.temperature,
-                max_retries=15,
-                timeout=100,
-                max_tokens=350,
-                api_key=OPENAI_API_KEY,
-                streaming=True,                  
-                callbacks=[self.streaming_cb],  
-            )
+            question_gen_llm, streaming_llm = self.clients.chat_llms(self.temperature)
 
             question_gen_chain = None
             if condense_prompt is not None:
@@ -95,7 +43,6 @@ class ConversationChainService:
                 llm=streaming_llm,
                 chain_type="stuff",
                 prompt=self.qa_prompt,
-                callback_manager=self.conv_cb_manager
             )
 
             conversation_chain = ConversationalRetrievalChain(
@@ -104,7 +51,6 @@ class ConversationChainService:
                 combine_docs_chain=final_qa_chain,
                 return_source_documents=False,
                 max_tokens_limit=2000,
-                callback_manager=self.conv_cb_manager,
             )
             return conversation_chain
         except FileNotFoundError:
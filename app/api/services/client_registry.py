@@ -0,0 +1,215 @@
+"""
+    Process-wide client registry: embeddings, chat LLMs và OpenSearch dùng chung
+    một connection pool keep-alive cho toàn bộ vòng đời ứng dụng.
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+
+import httpx
+from opensearchpy import OpenSearch, AsyncOpenSearch
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_community.vectorstores import OpenSearchVectorSearch
+
+from app.api.model.streaming_chain import ANSWER_TAG
+from app.api.services.opensearch_retriever import AsyncOpenSearchRetriever
+from app.api.services.embedding_cache import CachedEmbeddings, EmbeddingStore
+from app.api.services.embedding_batcher import EmbeddingBatcher
+from app.api.services.bulk_indexer import BulkIndexer
+from app.api.database.models.base import session as async_session
+from app.core.rate_limit import RateLimiter
+from app.api.services.admission import admission
+from app.logger.logger import custom_logger
+from app.core.config import MODEL_NAME, OPENAI_API_KEY
+from app.core.config import (
+    OPENSEARCH_URL, OPENSEARCH_USER, OPENSEARCH_PASSWORD, OPENSEARCH_INDEX,
+    OPENSEARCH_USE_SSL, OPENSEARCH_VERIFY_CERTS, OPENSEARCH_POOL_MAXSIZE,
+    OPENSEARCH_K, OPENSEARCH_EF_SEARCH, OPENSEARCH_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+    EMBED_CACHE_MAX_ENTRIES, EMBED_CACHE_PATH, LLM_TIMEOUT,
+    EMBED_BATCH_MAX_TOKENS, EMBED_BATCH_MAX_INPUTS, EMBED_CONCURRENCY, EMBED_RPM, EMBED_TPM, EMBED_MAX_RETRIES,
+    INGESTION_BULK_MAX_ACTIONS, INGESTION_BULK_MAX_BYTES, INGESTION_BULK_CONCURRENCY, INGESTION_BULK_MAX_RETRIES,
+    INGESTION_BULK_LOAD_LEASE,
+)
+
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_DIM = 1536
+LLM_TEMPERATURE = 0.2
+
+
+class ClientRegistry:
+    """Shared clients, created once at startup and closed at shutdown."""
+
+    def __init__(self) -> None:
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        # Timeout thực tế do `timeout` của từng client OpenAI quyết định
+        self.http_client = httpx.Client(limits=limits)
+        self.http_async_client = httpx.AsyncClient(limits=limits)
+
+        self.embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(
+                model=EMBED_MODEL,
+                dimensions=EMBED_DIM,
+                api_key=OPENAI_API_KEY,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+            ),
+            model=EMBED_MODEL,
+            dim=EMBED_DIM,
+            memory_size=EMBED_CACHE_MAX_ENTRIES,
+            store=EmbeddingStore(EMBED_CACHE_PATH) if EMBED_CACHE_PATH else None,
+            gate=admission.embedding,
+        )
+
+        # Client riêng cho ingestion: mỗi batch là đúng một request, retry/429 do EmbeddingBatcher xử lý
+        self.ingest_embeddings_api = OpenAIEmbeddings(
+            model=EMBED_MODEL,
+            dimensions=EMBED_DIM,
+            api_key=OPENAI_API_KEY,
+            chunk_size=EMBED_BATCH_MAX_INPUTS,
+            max_retries=0,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+        self.embedding_batcher = EmbeddingBatcher(
+            self.ingest_embeddings_api.aembed_documents,
+            model=EMBED_MODEL,
+            max_tokens=EMBED_BATCH_MAX_TOKENS,
+            max_inputs=EMBED_BATCH_MAX_INPUTS,
+            concurrency=EMBED_CONCURRENCY,
+            limiter=RateLimiter(EMBED_RPM, EMBED_TPM),
+            max_retries=EMBED_MAX_RETRIES,
+        )
+
+        self.question_llm = ChatOpenAI(
+            model=MODEL_NAME,
+            temperature=LLM_TEMPERATURE,
+            # Retry do run_stage đảm nhận, trong giới hạn deadline của request
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            max_tokens=200,
+            api_key=OPENAI_API_KEY,
+            streaming=False,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+
+        self.answer_llm = ChatOpenAI(
+            model=MODEL_NAME,
+            temperature=LLM_TEMPERATURE,
+            # Retry do run_stage đảm nhận, trong giới hạn deadline của request
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            max_tokens=350,
+            api_key=OPENAI_API_KEY,
+            streaming=True,
+            # Callback stream token được gắn theo từng request (xem StreamingConversationRetrievalChain)
+            tags=[ANSWER_TAG],
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+
+        connection_kwargs = dict(
+            http_auth=(OPENSEARCH_USER, OPENSEARCH_PASSWORD) if OPENSEARCH_USER else None,
+            use_ssl=OPENSEARCH_USE_SSL,
+            verify_certs=OPENSEARCH_VERIFY_CERTS,
+        )
+        # Kích thước pool: Urllib3HttpConnection nhận `pool_maxsize`, AsyncHttpConnection nhận `maxsize`
+        self.opensearch_kwargs = dict(connection_kwargs, pool_maxsize=OPENSEARCH_POOL_MAXSIZE)
+        self.opensearch = OpenSearch(hosts=[OPENSEARCH_URL], **self.opensearch_kwargs)
+        # aiohttp session được tạo lười ở request đầu tiên, trong event loop của app
+        self.async_opensearch = AsyncOpenSearch(
+            hosts=[OPENSEARCH_URL], **connection_kwargs, maxsize=OPENSEARCH_POOL_MAXSIZE
+        )
+        self._vector_stores: Dict[Tuple[str, str, str], OpenSearchVectorSearch] = {}
+        self.bulk_indexer = BulkIndexer(
+            self.opensearch,
+            max_actions=INGESTION_BULK_MAX_ACTIONS,
+            max_bytes=INGESTION_BULK_MAX_BYTES,
+            concurrency=INGESTION_BULK_CONCURRENCY,
+            max_retries=INGESTION_BULK_MAX_RETRIES,
+            session_factory=async_session,
+            load_lease=INGESTION_BULK_LOAD_LEASE,
+        )
+
+        self.vector_store = self.vector_store_for(OPENSEARCH_INDEX)
+        self.retriever = AsyncOpenSearchRetriever(
+            async_client=self.async_opensearch,
+            client=self.opensearch,
+            embeddings=self.embeddings,
+            index_name=OPENSEARCH_INDEX,
+            vector_field="vector",
+            text_field="text",
+            k=OPENSEARCH_K,
+            ef_search=OPENSEARCH_EF_SEARCH or None,
+            request_timeout=OPENSEARCH_TIMEOUT,
+        )
+
+    def vector_store_for(
+        self,
+        index_name: str,
+        vector_field: str = "vector",
+        text_field: str = "text",
+    ) -> OpenSearchVectorSearch:
+        """Vector store of one index, reusing the shared OpenSearch client."""
+        key = (index_name, vector_field, text_field)
+        if key not in self._vector_stores:
+            vs = OpenSearchVectorSearch(
+                embedding_function=self.embeddings,
+                index_name=index_name,
+                opensearch_url=OPENSEARCH_URL,
+                vector_field=vector_field,
+                text_field=text_field,
+                engine="lucene",
+                space_type="cosinesimil",
+                **self.opensearch_kwargs,
+            )
+            # Client do OpenSearchVectorSearch tự tạo chưa mở kết nối nào, thay bằng client dùng chung
+            vs.client = self.opensearch
+            vs.async_client = self.async_opensearch
+            self._vector_stores[key] = vs
+        return self._vector_stores[key]
+
+    def chat_llms(self, temperature: float) -> Tuple[ChatOpenAI, ChatOpenAI]:
+        """(question_llm, answer_llm) at `temperature`; copies still share the HTTP pool."""
+        if temperature == LLM_TEMPERATURE:
+            return self.question_llm, self.answer_llm
+        return (
+            self.question_llm.model_copy(update={"temperature": temperature}),
+            self.answer_llm.model_copy(update={"temperature": temperature}),
+        )
+
+    async def aclose(self) -> None:
+        try:
+            await self.async_opensearch.close()
+        except Exception as e:
+            custom_logger.error(str(e))
+        self.opensearch.close()
+        self.embeddings.close()
+        self.http_client.close()
+        await self.http_async_client.aclose()
+
+
+_registry: Optional[ClientRegistry] = None
+
+
+def get_clients() -> ClientRegistry:
+    """Shared registry; created lazily if startup has not run (scripts, shell)."""
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry()
+    return _registry
+
+
+async def init_clients() -> ClientRegistry:
+    return get_clients()
+
+
+async def close_clients() -> None:
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
@@ -0,0 +1,28 @@
+"""Per-conversation chain state, kept in a bounded LRU/TTL cache."""
+from __future__ import annotations
+from typing import Optional
+
+from app.api.services.chat_service import ConversationChainService
+from app.core.cache import LRUCache
+from app.core.config import CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_TTL
+
+
+class ConversationState:
+    """Chain objects reused across turns of one conversation.
+
+    Không giữ StreamingConversationRetrievalChain: kết quả của nó thuộc về từng request.
+    """
+
+    def __init__(self, conv_svc: ConversationChainService) -> None:
+        self.conv_svc = conv_svc
+        self.conversation_chain: Optional[object] = None
+        self.prompt_version: Optional[str] = None
+
+
+# Bị evict khi quá số lượng (LRU) hoặc không dùng quá CONVERSATION_CACHE_TTL giây;
+# lượt chat tiếp theo của conversation đó chỉ cần dựng lại chain (history nằm trong DB)
+conversation_states = LRUCache(
+    maxsize=CONVERSATION_CACHE_MAX_ENTRIES,
+    ttl=CONVERSATION_CACHE_TTL,
+    name="conversation_state",
+)
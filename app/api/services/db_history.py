@@ -1,6 +1,8 @@
 from __future__ import annotations
+import asyncio
 import uuid
-from typing import List
+from collections import deque
+from typing import Deque, List, Optional, Tuple
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from langchain.schema import BaseMessage
@@ -8,6 +10,31 @@ from langchain.schema.messages import HumanMessage, AIMessage
 
 from app.api.database.models.conversation import Conversation
 from app.api.database.models.conversation_detail import ConversationDetail
+from app.core.cache import LRUCache
+from app.api.services.history_writer import history_writer
+from app.api.services.history_archive import history_archive, merge_rows
+from app.core.config import (
+    HISTORY_WRITE_BEHIND, HISTORY_BUFFER_ENABLED, HISTORY_BUFFER_TURNS, HISTORY_BUFFER_MAX_CONVERSATIONS, HISTORY_BUFFER_TTL,
+)
+
+# conversation_id -> deque[(role, message_detail)] chứa tối đa HISTORY_BUFFER_TURNS lượt gần nhất.
+# Chỉ tạo entry sau khi đã nạp từ DB, nên buffer luôn là đuôi đầy đủ của history.
+history_buffers = LRUCache(
+    maxsize=HISTORY_BUFFER_MAX_CONVERSATIONS,
+    ttl=HISTORY_BUFFER_TTL,
+    name="history_buffer",
+)
+
+
+def _to_messages(rows) -> List[BaseMessage]:
+    msgs: List[BaseMessage] = []
+    for role, text in rows:
+        if role == "user":
+            msgs.append(HumanMessage(content=text))
+        else:
+            msgs.append(AIMessage(content=text))
+    return msgs
+
 
 class DbChatHistory:
     def __init__(self, db: AsyncSession, conversation_id: str, k: int = 4):
@@ -15,27 +42,58 @@ class DbChatHistory:
         self.conversation_id = conversation_id
         self.k = k
 
+    def _buffered(self) -> bool:
+        return HISTORY_BUFFER_ENABLED and self.k <= HISTORY_BUFFER_TURNS
+
     async def ensure_conversation(self):
         conv = await self.db.get(Conversation, self.conversation_id)
         if not conv:
             self.db.add(Conversation(conversation_id=self.conversation_id))
             await self.db.commit()
 
-    async def load_messages(self) -> List[BaseMessage]:
-        stmt = select(ConversationDetail)\
+    async def _load_rows(self, limit: int) -> List[Tuple[str, str]]:
+        """Last `limit` (role, message_detail) rows, oldest first, including rows not yet flushed."""
+        # Lấy pending TRƯỚC khi query: row flush xong giữa chừng sẽ bị trùng (lọc theo id) chứ không bị mất
+        pending = history_writer.pending_for(self.conversation_id) if HISTORY_WRITE_BEHIND else []
+        stmt = select(ConversationDetail.id, ConversationDetail.time,
+                      ConversationDetail.role, ConversationDetail.message_detail)\
             .where(ConversationDetail.conversation_id == self.conversation_id)\
-            .order_by(ConversationDetail.time.asc())
-        rows = (await self.db.execute(stmt)).scalars().all()
-        rows = rows[-self.k*2:]
-        msgs: List[BaseMessage] = []
-        for r in rows:
-            if r.role == "user":
-                msgs.append(HumanMessage(content=r.message_detail))
-            else:
-                msgs.append(AIMessage(content=r.message_detail))
-        return msgs
+            .order_by(ConversationDetail.time.desc())\
+            .limit(limit)
+        rows = [dict(r._mapping) for r in reversed((await self.db.execute(stmt)).all())]
+        if pending:
+            rows = merge_rows(rows, pending)
+        if len(rows) < limit:
+            # History ngắn hơn limit: có thể phần cũ đã được chuyển sang archive
+            archived_at = await self.db.scalar(
+                select(Conversation.archived_at).where(Conversation.conversation_id == self.conversation_id)
+            )
+            if archived_at is not None:
+                rows = merge_rows(rows, await asyncio.to_thread(history_archive.read, self.conversation_id))
+        return [(r["role"], r["message_detail"]) for r in rows[-limit:]]
+
+    async def load_messages(self) -> List[BaseMessage]:
+        if not self._buffered():
+            return _to_messages(await self._load_rows(self.k*2))
+
+        buffer: Optional[Deque[Tuple[str, str]]] = history_buffers.get(self.conversation_id)
+        if buffer is None:
+            buffer = deque(await self._load_rows(HISTORY_BUFFER_TURNS*2), maxlen=HISTORY_BUFFER_TURNS*2)
+            history_buffers.set(self.conversation_id, buffer)
+        return _to_messages(list(buffer)[-self.k*2:])
+
+    def _remember(self, role: str, text: str):
+        if self._buffered():
+            buffer = history_buffers.get(self.conversation_id)
+            if buffer is not None:
+                buffer.append((role, text))
 
     async def append_user(self, text: str):
+        if HISTORY_WRITE_BEHIND:
+            history_writer.add_conversation(self.conversation_id)
+            history_writer.add_message(self.conversation_id, "user", text)
+            self._remember("user", text)
+            return
         await self.ensure_conversation()
         self.db.add(ConversationDetail(
             id=str(uuid.uuid4()),
@@ -44,8 +102,13 @@ class DbChatHistory:
             message_detail=text
         ))
         await self.db.commit()
+        self._remember("user", text)
 
     async def append_ai(self, text: str):
+        if HISTORY_WRITE_BEHIND:
+            history_writer.add_message(self.conversation_id, "assistant", text)
+            self._remember("assistant", text)
+            return
         self.db.add(ConversationDetail(
             id=str(uuid.uuid4()),
             conversation_id=self.conversation_id,
@@ -53,3 +116,4 @@ class DbChatHistory:
             message_detail=text
         ))
         await self.db.commit()
+        self._remember("assistant", text)
@@ -0,0 +1,144 @@
+"""
+    Embedding cho ingestion: gom chunk của nhiều document thành batch theo số token,
+    chạy song song trong giới hạn RPM / TPM và backoff khi bị 429
+"""
+from __future__ import annotations
+import asyncio
+import random
+from typing import Awaitable, Callable, List, Optional
+
+import openai
+
+from app.core.metrics import register_metrics
+from app.core.rate_limit import RateLimiter
+from app.logger.logger import custom_logger
+
+EmbedCall = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class EmbeddingBatcher:
+    """Split texts into token-bounded batches and embed them concurrently under a rate limiter."""
+
+    def __init__(self,
+                 embed_batch: EmbedCall,
+                 model: str,
+                 max_tokens: int,
+                 max_inputs: int,
+                 concurrency: int,
+                 limiter: RateLimiter,
+                 max_retries: int,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0) -> None:
+        self.embed_batch = embed_batch
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_inputs = max_inputs
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Dùng chung cho mọi worker ingestion của process
+        self._sem = asyncio.Semaphore(concurrency)
+        self._encoding = None
+        self.batches = 0
+        self.inputs = 0
+        self.tokens = 0
+        self.rate_limited = 0
+        self.retries = 0
+        register_metrics("embedding_batcher", self.stats)
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # Không tải được tokenizer: ước lượng dư (~2 ký tự / token)
+                custom_logger.warning(f"tiktoken unavailable, estimating tokens: {e}")
+                self._encoding = False
+        if self._encoding is False:
+            return len(text) // 2 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def plan(self, texts: List[str]) -> List[tuple[List[int], int]]:
+        """Group text indexes into batches bounded by `max_tokens` and `max_inputs`."""
+        batches: List[tuple[List[int], int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if current and (current_tokens + tokens > self.max_tokens or len(current) >= self.max_inputs):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def _call(self, batch: List[str], tokens: int) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                async with self._sem:
+                    await self.limiter.acquire(tokens)
+                    vectors = await self.embed_batch(batch)
+                self.batches += 1
+                self.inputs += len(batch)
+                self.tokens += tokens
+                return vectors
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = self._delay(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    self.rate_limited += 1
+                    # Quota đã hết: cả process cùng chờ, không chỉ batch bị 429
+                    self.limiter.pause(delay)
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings of `texts`, in order."""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        async def run(indexes: List[int], tokens: int) -> None:
+            vectors = await self._call([texts[i] for i in indexes], tokens)
+            for i, vec in zip(indexes, vectors):
+                results[i] = vec
+
+        # Đếm token bằng tiktoken tốn CPU -> chạy ngoài event loop
+        batches = await asyncio.to_thread(self.plan, texts)
+        tasks = [asyncio.ensure_future(run(indexes, tokens)) for indexes, tokens in batches]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "inputs": self.inputs,
+            "tokens": self.tokens,
+            "avg_batch_inputs": round(self.inputs / self.batches, 1) if self.batches else None,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "limiter_wait_s": round(self.limiter.waited, 1),
+        }
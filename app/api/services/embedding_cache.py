@@ -0,0 +1,219 @@
+"""
+    Embedding cache: LRU trong RAM + (tuỳ chọn) SQLite trên đĩa
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.cache import LRUCache
+from app.core.metrics import register_metrics
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC, casefold and collapse whitespace."""
+    return _WS.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def embedding_key(text: str, model: str, dim: int, query: bool = False) -> str:
+    """sha256 of model, dimension and text: normalized for queries, exact for documents.
+
+    Chuẩn hoá (mất thông tin) chỉ dùng cho câu hỏi chat; chunk document khác hoa / thường
+    hay khoảng trắng phải có vector riêng. Key document nằm trong namespace riêng.
+    """
+    if query:
+        return hashlib.sha256(f"{model}\x00{dim}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model}\x00{dim}\x00doc\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Persistent key -> float32 vector store backed by SQLite."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, array]:
+        found: Dict[str, array] = {}
+        with self._lock:
+            # SQLite giới hạn số tham số mỗi câu lệnh
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec
+        return found
+
+    def put_many(self, items: Dict[str, array]) -> None:
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(k, v.tobytes()) for k, v in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an Embeddings model with a memory LRU and an optional disk store.
+
+    Vector được giữ dạng float32 (`array('f')`) để tiết kiệm RAM.
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        model: str,
+        dim: int,
+        memory_size: int,
+        store: Optional[EmbeddingStore] = None,
+        name: str = "embedding_cache",
+        gate: Any = None,
+    ) -> None:
+        self.inner = inner
+        # Gate (admission control) giới hạn số request embedding async đồng thời ra API
+        self.gate = gate
+        self.model = model
+        self.dim = dim
+        self.memory = LRUCache(maxsize=memory_size)
+        self.store = store
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.api_calls = 0
+        register_metrics(name, self.stats)
+
+    def key(self, text: str, query: bool = False) -> str:
+        return embedding_key(text, self.model, self.dim, query)
+
+    def _lookup_memory(self, keys: Iterable[str]) -> Dict[str, array]:
+        found: Dict[str, array] = {}
+        for key in keys:
+            vec = self.memory.get(key)
+            if vec is not None:
+                found[key] = vec
+        return found
+
+    def _remember(self, items: Dict[str, array]) -> None:
+        for key, vec in items.items():
+            self.memory.set(key, vec)
+
+    def _split(self, texts: List[str], query: bool = False) -> tuple[List[str], Dict[str, array], Dict[str, str]]:
+        """Return keys, vectors found in memory, and distinct missing key -> text."""
+        keys = [self.key(t, query) for t in texts]
+        found = self._lookup_memory(keys)
+        self.memory_hits += len(found)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def _from_store(self, missing: Dict[str, str], remember: bool = True) -> Dict[str, array]:
+        if self.store is None or not missing:
+            return {}
+        from_disk = self.store.get_many(list(missing))
+        self.disk_hits += len(from_disk)
+        if remember:
+            self._remember(from_disk)
+        for key in from_disk:
+            missing.pop(key)
+        return from_disk
+
+    def _store_new(self, missing: Dict[str, str], vectors: List[List[float]], remember: bool = True) -> Dict[str, array]:
+        new = {key: array("f", vec) for key, vec in zip(missing, vectors)}
+        self.misses += len(new)
+        if remember:
+            self._remember(new)
+        return new
+
+    def embed_documents(self, texts: List[str], query: bool = False) -> List[List[float]]:
+        keys, found, missing = self._split(texts, query)
+        found.update(self._from_store(missing))
+        if missing:
+            self.api_calls += 1
+            new = self._store_new(missing, self.inner.embed_documents(list(missing.values())))
+            if self.store is not None:
+                self.store.put_many(new)
+            found.update(new)
+        return [found[k].tolist() for k in keys]
+
+    async def aembed_documents(
+        self,
+        texts: List[str],
+        call: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+        remember: bool = True,
+        query: bool = False,
+    ) -> List[List[float]]:
+        """`call` thay cho lời gọi API mặc định (vd. EmbeddingBatcher của ingestion);
+        `remember=False` chỉ ghi vector mới xuống đĩa, không đẩy vector query của chat ra khỏi LRU;
+        `query=True`: key theo text đã chuẩn hoá (embed_query)."""
+        keys, found, missing = self._split(texts, query)
+        if self.store is not None and missing:
+            found.update(await asyncio.to_thread(self._from_store, missing, remember))
+        if missing:
+            self.api_calls += 1
+            if call is not None:
+                vectors = await call(list(missing.values()))
+            elif self.gate is not None:
+                async with self.gate.slot():
+                    vectors = await self.inner.aembed_documents(list(missing.values()))
+            else:
+                vectors = await self.inner.aembed_documents(list(missing.values()))
+            new = self._store_new(missing, vectors, remember)
+            if self.store is not None:
+                await asyncio.to_thread(self.store.put_many, new)
+            found.update(new)
+        return [found[k].tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text], query=True)[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text], query=True))[0]
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_size": len(self.memory),
+            "memory_maxsize": self.memory.maxsize,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "api_calls": self.api_calls,
+            "disk_enabled": self.store is not None,
+        }
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
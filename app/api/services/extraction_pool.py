@@ -0,0 +1,173 @@
+"""
+    Extract text của file upload trong ProcessPoolExecutor để không chặn event loop (chat stream);
+    PDF lớn được chia theo khoảng trang cho nhiều process
+"""
+from __future__ import annotations
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Deque, Optional, Tuple
+
+from app.api.services.extractors import extract_docx, extract_pdf_range, iter_docx, iter_txt, pdf_page_count
+from app.core.metrics import register_metrics
+from app.core.config import (
+    EXTRACT_WORKERS, EXTRACT_MAX_PENDING, EXTRACT_TIMEOUT, EXTRACT_PDF_PAGES_PER_TASK,
+    EXTRACT_MAX_TASKS_PER_CHILD, UPLOAD_READ_CHUNK,
+)
+
+# PDF lớn: mỗi file tối đa `workers * _PDF_TASKS_PER_WORKER` khoảng trang, vì mỗi task mở lại file
+# và dựng lại PdfReader (xref, cây trang)
+_PDF_TASKS_PER_WORKER = 4
+
+# (future, executor chạy task; None khi chạy trong thread)
+_Task = Tuple[asyncio.Future, Optional[Executor]]
+
+
+class ExtractionBusyError(RuntimeError):
+    pass
+
+
+class ExtractionTimeoutError(TimeoutError):
+    pass
+
+
+class ExtractionPool:
+    """Bounded process pool for text extraction; `workers=0` falls back to the default thread pool."""
+
+    def __init__(self,
+                 workers: int,
+                 max_pending: int,
+                 timeout: float,
+                 pdf_pages_per_task: int,
+                 max_tasks_per_child: Optional[int] = None) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self._executor: Optional[Executor] = None
+        self._executor_tasks = 0
+        self._slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+        self.jobs = 0
+        self.tasks = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        register_metrics("extraction", self.stats)
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if (self._executor is not None and self.max_tasks_per_child
+                and self._executor_tasks >= self.max_tasks_per_child * self.workers):
+            # Thay cả pool sau N task/process (max_tasks_per_child của ProcessPoolExecutor cần Python 3.11);
+            # pool cũ chạy nốt task đã nhận rồi tự thoát
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self.restarts += 1
+        if self._executor is None:
+            # spawn: process con không kế thừa thread / event loop / kết nối DB của app
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._executor_tasks = 0
+        return self._executor
+
+    def _submit(self, fn: Callable, *args) -> _Task:
+        executor = self._get_executor()
+        self.tasks += 1
+        self._executor_tasks += 1
+        return asyncio.get_running_loop().run_in_executor(executor, fn, *args), executor
+
+    def _kill(self, executor: Executor) -> None:
+        """Terminate the processes of `executor`; task của file khác đang chạy trên pool này lỗi BrokenProcessPool."""
+        if executor is self._executor:
+            self._executor = None
+            self.restarts += 1
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _result(self, task: _Task, deadline: float):
+        future, executor = task
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            # shield: hết giờ thì huỷ ở finally của pages(), không huỷ ở đây hai lần
+            return await asyncio.wait_for(asyncio.shield(future), max(remaining, 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if executor is not None:
+                # Huỷ future không dừng được process con đang chạy (PDF lỗi có thể lặp mãi)
+                future.cancel()
+                self._kill(executor)
+            raise ExtractionTimeoutError(f"Extraction timed out after {self.timeout:.0f}s")
+
+    async def pages(self, path: str, ext: str, wait: bool = False) -> AsyncIterator[str]:
+        """Extracted text of `path` in order, as pages / blocks.
+
+        Khi đủ `max_pending` file đang extract: raise ExtractionBusyError, hoặc chờ slot nếu `wait` (bulk import).
+
+        Hết giờ: process con của pool bị kill và pool được tạo lại. Caller dừng giữa chừng: task
+        chưa chạy bị huỷ, task đang chạy chạy nốt trong process con.
+        """
+        if not wait and self._slots.locked():
+            self.rejected += 1
+            raise ExtractionBusyError("Too many extraction jobs in progress, try again later")
+        await self._slots.acquire()
+        self.pending += 1
+        self.jobs += 1
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        window: Deque[_Task] = deque()
+        try:
+            if ext == "txt" or (ext == "docx" and self.workers == 0):
+                # txt chỉ là I/O + decode; docx không có process pool: stream từng đoạn trong thread
+                blocks = iter_txt(path, UPLOAD_READ_CHUNK) if ext == "txt" else iter_docx(path)
+                while (block := await self._result((asyncio.ensure_future(
+                        asyncio.to_thread(next, blocks, None)), None), deadline)) is not None:
+                    yield block
+            elif ext == "pdf":
+                count = await self._result(self._submit(pdf_page_count, path), deadline)
+                # Tối đa `workers` khoảng trang chạy cùng lúc cho mỗi file, trả về theo thứ tự
+                in_flight = max(self.workers, 1)
+                step = max(self.pdf_pages_per_task, -(-count // (in_flight * _PDF_TASKS_PER_WORKER)))
+                for start in range(0, count, step):
+                    window.append(self._submit(extract_pdf_range, path, start, start + step))
+                    if len(window) >= in_flight:
+                        yield await self._result(window.popleft(), deadline)
+                while window:
+                    yield await self._result(window.popleft(), deadline)
+            else:
+                yield await self._result(self._submit(extract_docx, path), deadline)
+        finally:
+            for future, _ in window:
+                future.cancel()
+            self.pending -= 1
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "jobs": self.jobs,
+            "tasks": self.tasks,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+        }
+
+
+extraction_pool = ExtractionPool(
+    workers=EXTRACT_WORKERS,
+    max_pending=EXTRACT_MAX_PENDING,
+    timeout=EXTRACT_TIMEOUT,
+    pdf_pages_per_task=EXTRACT_PDF_PAGES_PER_TASK,
+    max_tasks_per_child=EXTRACT_MAX_TASKS_PER_CHILD,
+)
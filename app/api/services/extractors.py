@@ -0,0 +1,115 @@
+"""
+    Hàm extract text thuần (không phụ thuộc app), chạy được trong process con của ExtractionPool
+"""
+from __future__ import annotations
+import codecs
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import IO, Iterable, Iterator, Union
+
+import PyPDF2
+
+DEFAULT_READ_CHUNK = 1024 * 1024
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_HEADER = re.compile(r"word/header[0-9]*\.xml$")
+_DOCX_FOOTER = re.compile(r"word/footer[0-9]*\.xml$")
+# Khối cấp cao nhất của body / header / footer, được giải phóng ngay khi parse xong
+_DOCX_BLOCKS = {_W + "p", _W + "tbl", _W + "sdt"}
+
+
+def pdf_page_count(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pdf_range(path: str, start: int, end: int) -> str:
+    """Text of pages [start, end); pages after the first of the file are prefixed with a newline."""
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        texts = []
+        for i in range(start, min(end, len(reader.pages))):
+            text = reader.pages[i].extract_text() or ""
+            texts.append(f"\n{text}" if i else text)
+        return "".join(texts)
+
+
+def iter_txt(path: str, read_chunk: int = DEFAULT_READ_CHUNK) -> Iterator[str]:
+    """UTF-8 text in blocks; ký tự nhiều byte bị cắt giữa hai block được ghép lại."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        while block := f.read(read_chunk):
+            yield decoder.decode(block)
+        yield decoder.decode(b"", final=True)
+
+
+def _iter_part_text(stream: IO[bytes]) -> Iterator[str]:
+    """Text of one WordprocessingML part, one paragraph at a time.
+
+    Cùng quy tắc với docx2txt.xml2text: "\n\n" trước mỗi w:p, w:tab -> "\t", w:br / w:cr -> "\n".
+    """
+    buf = []
+    depth = 0
+    container, container_depth = None, 0
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1 or elem.tag == _W + "body":
+                container, container_depth = elem, depth
+            elif elem.tag == _W + "p":
+                if buf:
+                    yield "".join(buf)
+                buf = ["\n\n"]
+            elif elem.tag == _W + "tab":
+                buf.append("\t")
+            elif elem.tag in (_W + "br", _W + "cr"):
+                buf.append("\n")
+            continue
+
+        if elem.tag == _W + "t":
+            buf.append(elem.text or "")
+        elif depth == container_depth + 1 and elem.tag in _DOCX_BLOCKS:
+            # Bỏ cây con đã đọc xong: bộ nhớ theo kích thước một khối, không theo cả file
+            container.clear()
+        depth -= 1
+    if buf:
+        yield "".join(buf)
+
+
+def _strip_stream(pieces: Iterable[str]) -> Iterator[str]:
+    """Like str.strip() on the concatenation, without building it (trả chậm một piece)."""
+    held = None
+    for piece in pieces:
+        if held is None:
+            held = piece.lstrip() or None
+        elif piece.strip():
+            yield held
+            held = piece
+        else:
+            # Khoảng trắng chỉ được giữ nếu còn nội dung phía sau
+            held += piece
+    if held is not None:
+        yield held.rstrip()
+
+
+def iter_docx(source: Union[str, IO[bytes]]) -> Iterator[str]:
+    """Paragraph texts of a .docx (headers, body, footers) parsed incrementally from the zip.
+
+    `source` là path hoặc stream seek được (BytesIO, SpooledTemporaryFile); không ghi file tạm.
+    """
+    with zipfile.ZipFile(source) as zf:
+        names = zf.namelist()
+        parts = [n for n in names if _DOCX_HEADER.match(n)] + ["word/document.xml"] \
+            + [n for n in names if _DOCX_FOOTER.match(n)]
+
+        def pieces() -> Iterator[str]:
+            for name in parts:
+                with zf.open(name) as stream:
+                    yield from _iter_part_text(stream)
+
+        yield from _strip_stream(pieces())
+
+
+def extract_docx(path: str) -> str:
+    return "".join(iter_docx(path))
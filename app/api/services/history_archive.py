@@ -0,0 +1,260 @@
+"""
+    Archive conversation history ra file gzip JSONL và bảo trì partition của conversation_detail
+"""
+from __future__ import annotations
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.api.database.models.base import engine
+from app.core.metrics import register_metrics
+from app.core.config import (
+    HISTORY_ARCHIVE_DIR, HISTORY_ARCHIVE_IDLE_DAYS, HISTORY_RETENTION_MONTHS,
+    HISTORY_PARTITIONS_AHEAD, HISTORY_ARCHIVE_INTERVAL, HISTORY_ARCHIVE_BATCH,
+)
+from app.logger.logger import custom_logger
+
+_PARTITION_NAME = re.compile(r"^conversation_detail_(\d{4})(\d{2})$")
+# Bảng cũ được attach bởi migration 2: chứa mọi row trước tháng YYYYMM
+_LEGACY_PARTITION_NAME = re.compile(r"^conversation_detail_before_(\d{4})(\d{2})$")
+# Chỉ một worker chạy job tại một thời điểm
+_LOCK_KEY = 7_301_245_119
+_COLUMNS = "id, time, role, message_detail, conversation_id"
+
+
+class HistoryArchive:
+    """One gzip JSONL file per conversation; each archival run appends a new gzip member."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def path(self, conversation_id: str) -> str:
+        digest = hashlib.sha256(conversation_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.jsonl.gz")
+
+    def append(self, conversation_id: str, rows: Iterable[dict]) -> None:
+        path = self.path(conversation_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for row in rows:
+                    gz.write((json.dumps({**row, "time": row["time"].isoformat()}, ensure_ascii=False) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    def read(self, conversation_id: str) -> List[dict]:
+        """Archived rows, oldest first; rows are de-duplicated by id."""
+        path = self.path(conversation_id)
+        if not os.path.exists(path):
+            return []
+        rows: Dict[str, dict] = {}
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    row["time"] = datetime.fromisoformat(row["time"])
+                    rows[row["id"]] = row
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            # Member cuối bị cắt do crash khi append: các row đó vẫn còn trong DB
+            custom_logger.warning(f"truncated history archive {path}: {e}")
+        return sorted(rows.values(), key=lambda r: r["time"])
+
+
+def merge_rows(db_rows: List[dict], archived_rows: List[dict]) -> List[dict]:
+    """Union of DB and archived rows by id, ordered by time."""
+    seen = {r["id"] for r in db_rows}
+    return sorted(db_rows + [r for r in archived_rows if r["id"] not in seen], key=lambda r: r["time"])
+
+
+class HistoryArchiver:
+    """Periodic job: create upcoming partitions, archive idle conversations, drop expired partitions."""
+
+    def __init__(self,
+                 engine: AsyncEngine,
+                 archive: HistoryArchive,
+                 idle_days: int,
+                 retention_months: int,
+                 partitions_ahead: int,
+                 interval: float,
+                 batch: int) -> None:
+        self.engine = engine
+        self.archive = archive
+        self.idle_days = idle_days
+        self.retention_months = retention_months
+        self.partitions_ahead = partitions_ahead
+        self.interval = interval
+        self.batch = batch
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.conversations_archived = 0
+        self.rows_archived = 0
+        self.partitions_dropped = 0
+        self.last_run: Optional[str] = None
+        register_metrics("history_archive", self.stats)
+
+    async def ensure_partitions(self, conn: AsyncConnection) -> None:
+        await conn.execute(
+            text("SELECT conversation_detail_ensure_partitions((now() AT TIME ZONE 'utc')::date, :ahead)"),
+            {"ahead": self.partitions_ahead},
+        )
+        await conn.commit()
+
+    async def archive_idle(self, conn: AsyncConnection) -> int:
+        """Move every row of conversations idle for `idle_days` to the archive."""
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days)
+        ids = (await conn.execute(text(
+            "SELECT c.conversation_id FROM conversation c "
+            "WHERE c.time_start < :cutoff "
+            "AND EXISTS (SELECT 1 FROM conversation_detail d WHERE d.conversation_id = c.conversation_id) "
+            "AND NOT EXISTS (SELECT 1 FROM conversation_detail d "
+            "                WHERE d.conversation_id = c.conversation_id AND d.time >= :cutoff) "
+            "LIMIT :batch"
+        ), {"cutoff": cutoff, "batch": self.batch})).scalars().all()
+        await conn.commit()
+
+        for conversation_id in ids:
+            rows = [dict(r._mapping) for r in await conn.execute(text(
+                f"SELECT {_COLUMNS} FROM conversation_detail "
+                "WHERE conversation_id = :cid AND time < :cutoff ORDER BY time"
+            ), {"cid": conversation_id, "cutoff": cutoff})]
+            # Ghi file (fsync) xong mới xoá khỏi DB
+            await asyncio.to_thread(self.archive.append, conversation_id, rows)
+            await conn.execute(text(
+                "DELETE FROM conversation_detail WHERE conversation_id = :cid AND time < :cutoff"
+            ), {"cid": conversation_id, "cutoff": cutoff})
+            await conn.execute(text(
+                "UPDATE conversation SET archived_at = now() AT TIME ZONE 'utc' WHERE conversation_id = :cid"
+            ), {"cid": conversation_id})
+            await conn.commit()
+            self.conversations_archived += 1
+            self.rows_archived += len(rows)
+        return len(ids)
+
+    async def _partitions(self, conn: AsyncConnection) -> List[str]:
+        rows = await conn.execute(text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = 'conversation_detail'"
+        ))
+        return [r[0] for r in rows]
+
+    async def _archive_partition(self, conn: AsyncConnection, partition: str) -> None:
+        """Append remaining rows of `partition` to the archive, grouped by conversation."""
+        current: Optional[str] = None
+        pending: List[dict] = []
+        result = await conn.stream(text(
+            f'SELECT {_COLUMNS} FROM "{partition}" ORDER BY conversation_id, time'
+        ))
+        async for row in result:
+            row = dict(row._mapping)
+            if row["conversation_id"] != current and pending:
+                await asyncio.to_thread(self.archive.append, current, pending)
+                self.rows_archived += len(pending)
+                pending = []
+            current = row["conversation_id"]
+            pending.append(row)
+        if pending:
+            await asyncio.to_thread(self.archive.append, current, pending)
+            self.rows_archived += len(pending)
+        await conn.execute(text(
+            "UPDATE conversation SET archived_at = now() AT TIME ZONE 'utc' "
+            f'WHERE conversation_id IN (SELECT DISTINCT conversation_id FROM "{partition}")'
+        ))
+        await conn.commit()
+
+    async def expire_partitions(self, conn: AsyncConnection) -> int:
+        """Archive then detach and drop monthly partitions older than `retention_months`."""
+        now = datetime.utcnow()
+        months = now.year * 12 + now.month - 1 - self.retention_months
+        boundary = (months // 12, months % 12 + 1)
+        dropped = 0
+        for partition in sorted(await self._partitions(conn)):
+            match = _PARTITION_NAME.match(partition)
+            legacy = _LEGACY_PARTITION_NAME.match(partition)
+            if match and (int(match.group(1)), int(match.group(2))) >= boundary:
+                continue
+            if legacy and (int(legacy.group(1)), int(legacy.group(2))) > boundary:
+                continue
+            if not match and not legacy:
+                continue
+            await conn.commit()
+            await self._archive_partition(conn, partition)
+            await conn.execute(text(f'ALTER TABLE conversation_detail DETACH PARTITION "{partition}"'))
+            await conn.execute(text(f'DROP TABLE "{partition}"'))
+            await conn.commit()
+            custom_logger.info(f"history partition {partition} archived and dropped")
+            dropped += 1
+            self.partitions_dropped += 1
+        return dropped
+
+    async def run_once(self) -> None:
+        async with self.engine.connect() as conn:
+            locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _LOCK_KEY})
+            await conn.commit()
+            if not locked:
+                return
+            try:
+                await self.ensure_partitions(conn)
+                if self.idle_days > 0:
+                    while await self.archive_idle(conn) == self.batch:
+                        pass
+                if self.retention_months > 0:
+                    await self.expire_partitions(conn)
+                self.runs += 1
+                self.last_run = datetime.utcnow().isoformat()
+            finally:
+                await conn.rollback()
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+                await conn.commit()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                custom_logger.error(str(e))
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "conversations_archived": self.conversations_archived,
+            "rows_archived": self.rows_archived,
+            "partitions_dropped": self.partitions_dropped,
+        }
+
+
+history_archive = HistoryArchive(HISTORY_ARCHIVE_DIR)
+history_archiver = HistoryArchiver(
+    engine=engine,
+    archive=history_archive,
+    idle_days=HISTORY_ARCHIVE_IDLE_DAYS,
+    retention_months=HISTORY_RETENTION_MONTHS,
+    partitions_ahead=HISTORY_PARTITIONS_AHEAD,
+    interval=HISTORY_ARCHIVE_INTERVAL,
+    batch=HISTORY_ARCHIVE_BATCH,
+)
@@ -0,0 +1,239 @@
+"""
+    Write-behind cho conversation history: gom insert và flush theo batch
+"""
+from __future__ import annotations
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.database.models.base import session as async_session
+from app.api.database.models.conversation import Conversation
+from app.api.database.models.conversation_detail import ConversationDetail
+from app.core.metrics import register_metrics
+from app.core.config import (
+    HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_MAX_BATCH, HISTORY_MAX_PENDING, HISTORY_FLUSH_MAX_ATTEMPTS,
+)
+from app.logger.logger import custom_logger
+
+# Lỗi do dữ liệu của một row (constraint, không có partition...): ghi lại cả batch không bao giờ thành công
+_ROW_ERRORS = (IntegrityError, DataError)
+# Giây chờ tối đa giữa hai lần flush khi DB lỗi liên tục
+_MAX_BACKOFF = 30.0
+
+
+class HistoryWriter:
+    """Queue Conversation / ConversationDetail rows and insert them in batches.
+
+    Row được gán `id` và `time` ngay khi enqueue nên thứ tự không đổi dù flush trễ.
+    """
+
+    def __init__(self,
+                 session_factory: async_sessionmaker[AsyncSession],
+                 flush_interval: float,
+                 max_batch: int,
+                 max_pending: int = HISTORY_MAX_PENDING,
+                 max_attempts: int = HISTORY_FLUSH_MAX_ATTEMPTS) -> None:
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._conversations: Dict[str, datetime] = {}
+        self._details: List[dict] = []
+        # Số lần flush thất bại theo id của row
+        self._attempts: Dict[str, int] = {}
+        self._failing = 0
+        # Row đang được flush, vẫn phải nhìn thấy khi đọc history
+        self._inflight: List[dict] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.last_flush_ms: Optional[float] = None
+        register_metrics("history_writer", self.stats)
+
+    def add_conversation(self, conversation_id: str) -> None:
+        self._conversations.setdefault(conversation_id, datetime.utcnow())
+
+    def add_message(self, conversation_id: str, role: str, text: str) -> dict:
+        row = {
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "role": role,
+            "message_detail": text,
+            "time": datetime.utcnow(),
+        }
+        self._details.append(row)
+        if len(self._details) > self.max_pending:
+            self._trim()
+        if len(self._details) >= self.max_batch:
+            self._wakeup.set()
+        return row
+
+    def _trim(self) -> None:
+        """Drop the oldest queued messages beyond `max_pending` (DB down: bộ nhớ không tăng mãi)."""
+        overflow = len(self._details) - self.max_pending
+        if overflow <= 0:
+            return
+        for row in self._details[:overflow]:
+            self._attempts.pop(row["id"], None)
+        del self._details[:overflow]
+        if not self.dropped % 1000:
+            custom_logger.warning(f"history queue full ({self.max_pending}), dropping oldest messages")
+        self.dropped += overflow
+
+    def _dead_letter(self, what: str, error: Exception) -> None:
+        self.dead_lettered += 1
+        custom_logger.error(f"history row dropped: {what}: {error}")
+
+    def pending_for(self, conversation_id: str) -> List[dict]:
+        """Rows of the conversation not yet committed, oldest first."""
+        return [r for r in self._inflight + self._details if r["conversation_id"] == conversation_id]
+
+    async def _write(self, conversations: Dict[str, datetime], details: List[dict]) -> None:
+        async with self.session_factory() as db:
+            # Conversation trước để thoả foreign key của conversation_detail
+            if conversations:
+                await db.execute(
+                    insert(Conversation)
+                    .values([{"conversation_id": cid, "time_start": ts} for cid, ts in conversations.items()])
+                    .on_conflict_do_nothing(index_elements=["conversation_id"])
+                )
+            for i in range(0, len(details), self.max_batch):
+                await db.execute(
+                    insert(ConversationDetail)
+                    .values(details[i:i + self.max_batch])
+                    .on_conflict_do_nothing(index_elements=["id", "time"])
+                )
+            await db.commit()
+
+    async def _write_each(self, conversations: Dict[str, datetime], details: List[dict]) -> None:
+        """Row by row after a data error: row lỗi dữ liệu bị bỏ ngay, row lỗi khác được xếp lại."""
+        retry_conversations: Dict[str, datetime] = {}
+        retry: List[dict] = []
+        error: Optional[Exception] = None
+        for cid, ts in conversations.items():
+            try:
+                await self._write({cid: ts}, [])
+                self.rows_written += 1
+            except _ROW_ERRORS as e:
+                self._dead_letter(f"conversation {cid}", e)
+            except Exception as e:
+                retry_conversations[cid], error = ts, e
+        for row in details:
+            if row["conversation_id"] in retry_conversations:
+                # Conversation chưa ghi được (lỗi tạm thời): ghi detail bây giờ chỉ vướng foreign key
+                retry.append(row)
+                continue
+            try:
+                await self._write({}, [row])
+                self.rows_written += 1
+                self._attempts.pop(row["id"], None)
+            except _ROW_ERRORS as e:
+                self._attempts.pop(row["id"], None)
+                self._dead_letter(repr(row), e)
+            except Exception as e:
+                retry.append(row)
+                error = e
+        if error is not None:
+            self._failing += 1
+            self._requeue(retry_conversations, retry, error)
+        else:
+            self._failing = 0
+
+    def _requeue(self, conversations: Dict[str, datetime], details: List[dict], error: Exception) -> None:
+        """Put rows back for the next flush (insert idempotent theo id); row quá `max_attempts` lần bị bỏ."""
+        kept = []
+        for row in details:
+            attempts = self._attempts.get(row["id"], 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(row["id"], None)
+                self._dead_letter(repr(row), error)
+            else:
+                self._attempts[row["id"]] = attempts
+                kept.append(row)
+        custom_logger.error(f"history flush failed, {len(kept)} rows requeued: {error}")
+        for cid, ts in conversations.items():
+            self._conversations.setdefault(cid, ts)
+        self._details = kept + self._details
+        self._trim()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._conversations and not self._details:
+                return
+            conversations, self._conversations = self._conversations, {}
+            details, self._details = self._details, []
+            self._inflight = details
+            started = time.monotonic()
+            try:
+                await self._write(conversations, details)
+                self.flushes += 1
+                self.rows_written += len(conversations) + len(details)
+                self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+                self._failing = 0
+                if self._attempts:
+                    for row in details:
+                        self._attempts.pop(row["id"], None)
+            except _ROW_ERRORS as e:
+                # Một row hỏng làm hỏng cả batch: tách từng row để không chặn mọi lần flush sau
+                self.failures += 1
+                custom_logger.error(f"history flush failed, writing {len(details)} rows one by one: {e}")
+                await self._write_each(conversations, details)
+            except Exception as e:
+                self.failures += 1
+                self._failing += 1
+                self._requeue(conversations, details, e)
+            finally:
+                self._inflight = []
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            # DB lỗi liên tục: giãn khoảng flush (backoff) thay vì thử lại mỗi `flush_interval`
+            delay = min(_MAX_BACKOFF, self.flush_interval * 2 ** min(self._failing, 10)) if self._failing else self.flush_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the loop without interrupting a flush, then write what is left."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_conversations": len(self._conversations),
+            "pending_messages": len(self._details),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+history_writer = HistoryWriter(async_session, HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_MAX_BATCH)
@@ -1,56 +1,156 @@
-"""Import service: extract text -> save RAW to DB (is_process=false)."""
+"""Import service: spool upload -> extract text (process pool) -> save RAW to DB (is_process=false)."""
 from __future__ import annotations
-from io import BytesIO
+import hashlib
+import os
+import tempfile
 import uuid
-import docx2txt
-import PyPDF2
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple
 
+from fastapi import UploadFile
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
 
 from app.api.responses.base import BaseResponse
 from app.logger.logger import custom_logger
 from app.api.database.models.imported_document import ImportedDocument
-from app.api.database.dao.imported_document_dao import ImportedDocumentDAO
+from app.api.database.dao.imported_document_dao import ImportedDocumentDAO, id_in
+from app.api.services.extraction_pool import ExtractionBusyError, extraction_pool
+from app.core.config import UPLOAD_SPOOL_DIR, UPLOAD_READ_CHUNK, IMPORT_PART_CHARS
+
+SUPPORTED_EXTENSIONS = ("pdf", "txt", "docx")
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+async def spool_upload(file: UploadFile, max_size: int, read_chunk: int = UPLOAD_READ_CHUNK) -> Tuple[str, str]:
+    """Copy an upload to a temp file block by block, hashing it on the way.
+
+    Trả về (path, sha256 hex); caller xoá file.
+    """
+    ext = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(suffix=ext, dir=UPLOAD_SPOOL_DIR or None)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            await file.seek(0)
+            while block := await file.read(read_chunk):
+                size += len(block)
+                if size > max_size:
+                    raise FileTooLargeError("File is too large")
+                digest.update(block)
+                out.write(block)
+        return path, digest.hexdigest()
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+async def aiter_parts(pages: AsyncIterator[str], max_chars: int = IMPORT_PART_CHARS) -> AsyncIterator[str]:
+    """Concatenate page texts into parts of at most `max_chars`, breaking between pages when possible."""
+    buf: List[str] = []
+    size = 0
+    async for page in pages:
+        if buf and size + len(page) > max_chars:
+            yield "".join(buf)
+            buf, size = [], 0
+        # Một trang / block lớn hơn cả part: cắt cứng
+        while len(page) > max_chars:
+            yield page[:max_chars]
+            page = page[max_chars:]
+        if page:
+            buf.append(page)
+            size += len(page)
+    if buf:
+        yield "".join(buf)
 
 
 class ImportService:
-    def __init__(self, file_stream: BytesIO, db: AsyncSession):
-        self.file_stream = file_stream
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.dao = ImportedDocumentDAO()
 
-    def pdf_to_text(self) -> str:
-        reader = PyPDF2.PdfReader(self.file_stream)
-        texts = []
-        for page in reader.pages:
-            texts.append(page.extract_text() or "")
-        return "\n".join(texts)
-
-    def txt_to_text(self) -> str:
-        return self.file_stream.read().decode("utf-8")
-
-    def docx_to_text(self) -> str:
-        data = self.file_stream.read()
-        from tempfile import NamedTemporaryFile
-        with NamedTemporaryFile(suffix=".docx") as tmp:
-            tmp.write(data)
-            tmp.flush()
-            return docx2txt.process(tmp.name)
-
-    async def save_raw(self, file_name: str, content: str):
+    async def save_parts(self, file_name: str, parts: AsyncIterator[str],
+                         content_hash: Optional[str] = None) -> List[str]:
+        """Insert each part as it is extracted; all parts of the upload commit together.
+
+        Mỗi lúc chỉ giữ một part trong bộ nhớ.
+        """
+        ids: List[str] = []
+        upload_id = str(uuid.uuid4())
         try:
-            new_id = str(uuid.uuid4())
-            doc = ImportedDocument(
-                id=new_id,
-                file_name=file_name,
-                content=content,
-                is_process=False
+            async for content in parts:
+                new_id = str(uuid.uuid4())
+                await self.db.execute(
+                    insert(ImportedDocument).values(
+                        id=new_id, file_name=file_name, content=content, is_process=False, part=len(ids),
+                        content_hash=content_hash, upload_id=upload_id,
+                    )
+                )
+                ids.append(new_id)
+            if not ids:
+                # File rỗng vẫn được lưu như trước (một document không có nội dung)
+                ids.append(str(uuid.uuid4()))
+                await self.db.execute(
+                    insert(ImportedDocument).values(
+                        id=ids[0], file_name=file_name, content="", is_process=False, content_hash=content_hash,
+                        upload_id=upload_id,
+                    )
+                )
+            await self.db.execute(
+                update(ImportedDocument)
+                .where(id_in(ids))
+                .values(parts=len(ids))
+                .execution_options(synchronize_session=False)
             )
-            await self.dao.add_document(self.db, doc)
+            await self.db.commit()
+            return ids
+        except BaseException:
+            await self.db.rollback()
+            raise
+
+    async def reuse_upload(self, file_name: str, content_hash: str) -> Tuple[Optional[str], List[str]]:
+        """Short-circuit a byte-identical upload.
+
+        ("unchanged", ids) khi bản mới nhất của file_name có cùng hash và không part nào lỗi (không tạo row mới);
+        ("reused", ids) khi upload khác có cùng hash: copy text đã extract, không parse lại;
+        (None, []) khi phải extract.
+        """
+        latest = await self.dao.latest_upload(self.db, file_name=file_name)
+        if latest and latest[0].content_hash == content_hash and not any(row.failed_at for row in latest):
+            return "unchanged", [row.id for row in latest]
+        source = await self.dao.latest_upload(self.db, content_hash=content_hash, complete=True)
+        if source:
+            return "reused", await self.dao.copy_upload(self.db, source, file_name)
+        return None, []
+
+    async def save_upload(self, path: str, file_name: str, ext: str, content_hash: Optional[str] = None):
+        try:
+            if content_hash:
+                reused, ids = await self.reuse_upload(file_name, content_hash)
+                if reused == "unchanged":
+                    return BaseResponse.success_response(
+                        message=f"File unchanged, already stored with id={ids[0]}",
+                        data={"id": ids[0], "part_ids": ids, "duplicate": True}
+                    )
+                if reused == "reused":
+                    return BaseResponse.success_response(
+                        message=f"Saved raw doc to DB with id={ids[0]} (reused extracted text)",
+                        data={"id": ids[0], "part_ids": ids, "duplicate": False}
+                    )
+            # Extract (CPU) chạy trong process pool, event loop chỉ nhận text theo từng khoảng trang
+            async with aclosing(extraction_pool.pages(path, ext)) as pages:
+                ids = await self.save_parts(file_name, aiter_parts(pages), content_hash)
             return BaseResponse.success_response(
-                message=f"Saved raw doc to DB with id={new_id}",
-                data={"id": new_id}
+                message=f"Saved raw doc to DB with id={ids[0]}" + (f" ({len(ids)} parts)" if len(ids) > 1 else ""),
+                data={"id": ids[0], "part_ids": ids, "duplicate": False}
             )
+        except ExtractionBusyError as e:
+            return BaseResponse.error_response(message=str(e), status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             custom_logger.error(str(e))
             return BaseResponse.error_response(message=str(e))
@@ -0,0 +1,364 @@
+"""
+    Background ingestion: pool worker async lấy document từ các IngestionJob và index vào OpenSearch
+"""
+from __future__ import annotations
+import asyncio
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.database.dao.imported_document_dao import ImportedDocumentDAO
+from app.api.database.dao.indexed_chunk_dao import IndexedChunkDAO
+from app.api.database.dao.ingestion_job_dao import IngestionJobDAO
+from app.api.database.models.base import session as async_session
+from app.api.database.models.imported_document import ImportedDocument
+from app.api.database.models.ingestion_job import IngestionJob
+from app.api.services.answer_cache import answer_cache
+from app.api.services.client_registry import get_clients
+from app.api.services.opensearch_processor import OpenSearchProcessor
+from app.core.metrics import register_metrics
+from app.core.config import (
+    INGESTION_WORKERS, INGESTION_POLL_INTERVAL, INGESTION_LEASE_SECONDS, INGESTION_CLAIM_BATCH,
+    INGESTION_MAX_ATTEMPTS, INGESTION_BACKOFF_BASE, INGESTION_BACKOFF_MAX, INGESTION_BULK_DISABLE_REFRESH,
+    INGESTION_INCREMENTAL, INGESTION_EMBED_MAX_CHUNKS,
+)
+from app.logger.logger import custom_logger
+
+
+def job_status(job: IngestionJob) -> dict:
+    """Progress and throughput of a job, as returned by the status endpoint."""
+    elapsed = None
+    if job.started_at is not None:
+        end = job.finished_at or datetime.now(timezone.utc)
+        elapsed = max((end - job.started_at).total_seconds(), 1e-6)
+    finished = job.docs_done + job.docs_failed
+    return {
+        "job_id": job.id,
+        "index_name": job.index_name,
+        "status": job.status,
+        "docs_total": job.docs_total,
+        "docs_done": job.docs_done,
+        "docs_failed": job.docs_failed,
+        "chunks_done": job.chunks_done,
+        "retries": job.retries,
+        "progress": round(finished / job.docs_total, 4) if job.docs_total else None,
+        "elapsed_s": round(elapsed, 1) if elapsed is not None else None,
+        "docs_per_sec": round(job.docs_done / elapsed, 3) if elapsed else None,
+        "chunks_per_sec": round(job.chunks_done / elapsed, 3) if elapsed else None,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+@dataclass
+class _Prepared:
+    """Chunks of one claimed document waiting to be embedded and indexed."""
+
+    doc: ImportedDocument
+    processor: OpenSearchProcessor
+    texts: List[str]
+    metadatas: List[dict]
+    ids: List[str]
+    # chunk_id cần xoá khỏi index; chunk mới / đổi cần ghi vào indexed_chunk (kể cả chunk bị dedupe)
+    removed: List[str] = field(default_factory=list)
+    tracked: List[Tuple[str, dict]] = field(default_factory=list)
+    # Xoá bản cũ chưa được ghi vào indexed_chunk theo file_name (xem delete_file_copies)
+    purge: bool = False
+
+
+class IngestionWorkerPool:
+    """Async workers claiming documents with FOR UPDATE SKIP LOCKED; safe to run in several processes."""
+
+    def __init__(self,
+                 session_factory: async_sessionmaker[AsyncSession],
+                 workers: int,
+                 poll_interval: float,
+                 lease: float,
+                 claim_batch: int,
+                 max_attempts: int,
+                 backoff_base: float,
+                 backoff_max: float,
+                 disable_refresh: bool = False,
+                 incremental: bool = False,
+                 embed_max_chunks: int = 2000) -> None:
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.claim_batch = claim_batch
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # refresh_interval=-1 trong lúc còn document, khôi phục khi mọi worker rảnh
+        self.disable_refresh = disable_refresh
+        # File import lại: chỉ index phần chênh lệch so với bản trước (xem diff_chunks)
+        self.incremental = incremental
+        # Vector chỉ giữ cho một sub-batch: RAM không phụ thuộc kích thước document / claim batch
+        self.embed_max_chunks = max(1, embed_max_chunks)
+        self.dao = IngestionJobDAO()
+        self.doc_dao = ImportedDocumentDAO()
+        self.chunk_dao = IndexedChunkDAO()
+        self._processors: Dict[str, OpenSearchProcessor] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self.busy = 0
+        self.docs_done = 0
+        self.docs_retried = 0
+        self.docs_failed = 0
+        self.chunks_done = 0
+        self.chunks_deduped = 0
+        self.chunks_reused = 0
+        self.chunks_deleted = 0
+        self.docs_superseded = 0
+        register_metrics("ingestion", self.stats)
+
+    def wake(self) -> None:
+        """Let idle workers pick up a new job without waiting for the next poll."""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+    async def _processor(self, index_name: str) -> OpenSearchProcessor:
+        if index_name not in self._processors:
+            # Constructor gọi OpenSearch (sync) để tạo index nếu thiếu
+            self._processors[index_name] = await asyncio.to_thread(OpenSearchProcessor, None, index_name)
+        return self._processors[index_name]
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _fail(self, db: AsyncSession, doc: ImportedDocument, e: Exception) -> None:
+        error = f"{type(e).__name__}: {e}"[:2000]
+        retry_in = None if doc.attempts >= self.max_attempts else self.backoff(doc.attempts)
+        custom_logger.error(
+            f"ingestion of document {doc.id} failed (attempt {doc.attempts}): {error}"
+            + (f", retry in {retry_in:.0f}s" if retry_in is not None else ", giving up")
+        )
+        if not await self.dao.mark_failed(db, doc, error, retry_in):
+            custom_logger.warning(f"lease of document {doc.id} expired, result dropped")
+            return
+        if retry_in is None:
+            self.docs_failed += 1
+        else:
+            self.docs_retried += 1
+
+    async def _prepare(self, db: AsyncSession, doc: ImportedDocument, index_name: str,
+                       seen: Dict[str, Set[str]]) -> Optional[_Prepared]:
+        """Chunks of `doc` still to embed and index; None when a newer upload of the file supersedes it."""
+        processor = await self._processor(index_name)
+        if self.incremental and await self.doc_dao.is_superseded(db, doc):
+            return None
+        chunks = await asyncio.to_thread(processor.chunk_document, doc)
+        texts, metadatas, ids = chunks
+        removed: List[str] = []
+        purge = False
+        if self.incremental:
+            # Chỉ embed chunk mới / đã đổi, xoá chunk không còn trong bản mới của file
+            texts, metadatas, ids, removed, purge = await processor.plan_reindex(db, doc, chunks)
+            self.chunks_reused += len(chunks[0]) - len(texts)
+        deduped = await processor.drop_duplicates(
+            texts, metadatas, ids, seen=seen.setdefault(processor.index_name, set()),
+            check_index=not (removed or purge),
+        )
+        self.chunks_deduped += len(texts) - len(deduped[0])
+        tracked = [(_id, meta) for _id, meta in zip(ids, metadatas)] if self.incremental else []
+        return _Prepared(doc, processor, *deduped, removed=removed, tracked=tracked, purge=purge)
+
+    async def _index_slices(self, slices: List[Tuple[_Prepared, int, int]], failed_docs: Dict[str, Exception]) -> None:
+        """Embed and bulk index the (item, start, end) chunk slices; documents that fail go to `failed_docs`."""
+        slices = [s for s in slices if s[0].doc.id not in failed_docs]
+        texts = [t for item, start, end in slices for t in item.texts[start:end]]
+        if not texts:
+            return
+        try:
+            # Embedding không phụ thuộc index -> embed chung qua cache + batcher
+            vectors = await slices[0][0].processor.embed(texts)
+        except Exception as e:
+            failed_docs.update((item.doc.id, e) for item, _, _ in slices)
+            return
+
+        # Gom chunk theo index -> _bulk song song, chunk lỗi quy về document của nó
+        by_index: Dict[str, Tuple[OpenSearchProcessor, list]] = {}
+        owner: Dict[str, str] = {}
+        offset = 0
+        for item, start, end in slices:
+            pairs = item.processor.bulk_docs(
+                item.texts[start:end], vectors[offset:offset + end - start], item.metadatas[start:end], item.ids[start:end]
+            )
+            offset += end - start
+            by_index.setdefault(item.processor.index_name, (item.processor, []))[1].extend(pairs)
+            owner.update((_id, item.doc.id) for _id in item.ids[start:end])
+
+        for index_name, (processor, pairs) in by_index.items():
+            if not pairs:
+                continue
+            try:
+                if self.disable_refresh:
+                    await processor.bulk.begin_load(index_name)
+                failed = await processor.bulk.index(index_name, pairs)
+            except Exception as e:
+                failed_docs.update((owner[_id], e) for _id, _ in pairs)
+                continue
+            for _id in failed:
+                failed_docs[owner[_id]] = RuntimeError("bulk indexing rejected some chunks")
+
+    async def _index_chunks(self, prepared: List[_Prepared]) -> Dict[str, Exception]:
+        """Embed and index every chunk of `prepared`, `embed_max_chunks` at a time; returns the failed documents.
+
+        Sub-batch có thể gồm chunk của nhiều document hoặc một phần của document lớn;
+        document đã lỗi thì bỏ qua phần chunk còn lại của nó.
+        """
+        failed_docs: Dict[str, Exception] = {}
+        slices: List[Tuple[_Prepared, int, int]] = []
+        size = 0
+        for item in prepared:
+            start = 0
+            while start < len(item.texts):
+                end = min(len(item.texts), start + self.embed_max_chunks - size)
+                slices.append((item, start, end))
+                size += end - start
+                start = end
+                if size >= self.embed_max_chunks:
+                    await self._index_slices(slices, failed_docs)
+                    slices, size = [], 0
+        if slices:
+            await self._index_slices(slices, failed_docs)
+        return failed_docs
+
+    async def _run_batch(self) -> bool:
+        """Process one batch of claimed documents; False when there was nothing to claim.
+
+        Chunk của các document được embed và ghi qua _bulk theo sub-batch (xem _index_chunks),
+        rồi đánh dấu xong bằng một UPDATE cho cả batch.
+        """
+        async with self.session_factory() as db:
+            docs = await self.dao.claim_documents(db, self.lease, self.claim_batch)
+            if not docs:
+                return False
+            self.busy += 1
+            try:
+                prepared: List[_Prepared] = []
+                done = []
+                # chunk_hash đã gặp trong batch, theo index
+                seen: Dict[str, Set[str]] = {}
+                # Tra index_name mỗi batch (một query theo khoá chính) thay vì cache theo job mãi không xoá
+                index_names = await self.dao.index_names(db, {doc.job_id for doc in docs})
+                deleted = 0
+                for doc in docs:
+                    try:
+                        item = await self._prepare(db, doc, index_names[doc.job_id], seen)
+                    except Exception as e:
+                        await self._fail(db, doc, e)
+                        continue
+                    if item is None:
+                        self.docs_superseded += 1
+                        done.append((doc, 0))
+                    else:
+                        prepared.append(item)
+
+                failed_docs = await self._index_chunks(prepared)
+
+                for item in prepared:
+                    try:
+                        if item.doc.id in failed_docs:
+                            raise failed_docs[item.doc.id]
+                        if item.removed or item.purge:
+                            # Xoá sau khi bản mới đã index: lỗi giữa chừng chỉ để lại chunk cũ, không mất chunk
+                            deleted += await asyncio.to_thread(
+                                item.processor.remove_stale, item.doc, item.removed, item.purge
+                            )
+                    except Exception as e:
+                        await self._fail(db, item.doc, e)
+                        continue
+                    if self.incremental:
+                        await self.chunk_dao.replace(
+                            db, item.processor.index_name, item.removed, item.processor.chunk_rows(item.doc, item.tracked)
+                        )
+                    done.append((item.doc, len(item.texts)))
+                updated = await self.dao.mark_done_many(db, done)
+                if len(updated) < len(done):
+                    custom_logger.warning(f"lease of {len(done) - len(updated)} document(s) expired, results dropped")
+                written = sum(n for doc, n in done if doc.id in updated)
+                self.docs_done += len(updated)
+                self.chunks_done += written
+                self.chunks_deleted += deleted
+                # Index có chunk mới / bị xoá -> câu trả lời đã cache có thể đã cũ
+                if written or deleted:
+                    answer_cache.invalidate()
+                return True
+            finally:
+                self.busy -= 1
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            try:
+                if not await self._run_batch():
+                    await self._end_loads()
+                    await self._idle()
+            except Exception as e:
+                custom_logger.error(str(e))
+                await self._idle()
+
+    async def _end_loads(self) -> None:
+        """Hàng đợi rỗng và không worker nào đang index -> bật lại refresh."""
+        if self.disable_refresh and self.busy == 0 and self._processors:
+            await get_clients().bulk_indexer.end_loads()
+
+    def start(self) -> None:
+        if not self._tasks and self.workers > 0:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Let workers finish their current document; documents still running after `timeout`
+        are picked up again once their lease expires."""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        await self._end_loads()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "busy": self.busy,
+            "docs_done": self.docs_done,
+            "docs_retried": self.docs_retried,
+            "docs_failed": self.docs_failed,
+            "chunks_done": self.chunks_done,
+            "chunks_deduped": self.chunks_deduped,
+            "chunks_reused": self.chunks_reused,
+            "chunks_deleted": self.chunks_deleted,
+            "docs_superseded": self.docs_superseded,
+        }
+
+
+ingestion_workers = IngestionWorkerPool(
+    session_factory=async_session,
+    workers=INGESTION_WORKERS,
+    poll_interval=INGESTION_POLL_INTERVAL,
+    lease=INGESTION_LEASE_SECONDS,
+    claim_batch=INGESTION_CLAIM_BATCH,
+    max_attempts=INGESTION_MAX_ATTEMPTS,
+    backoff_base=INGESTION_BACKOFF_BASE,
+    backoff_max=INGESTION_BACKOFF_MAX,
+    disable_refresh=INGESTION_BULK_DISABLE_REFRESH,
+    incremental=INGESTION_INCREMENTAL,
+    embed_max_chunks=INGESTION_EMBED_MAX_CHUNKS,
+)
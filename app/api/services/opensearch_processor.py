@@ -1,25 +1,31 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+import asyncio
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from opensearchpy import OpenSearch
-from langchain_community.vectorstores import OpenSearchVectorSearch
-from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
 
 from app.api.database.dao.imported_document_dao import ImportedDocumentDAO
+from app.api.database.dao.indexed_chunk_dao import IndexedChunkDAO
+from app.api.database.models.imported_document import ImportedDocument
+from app.api.services.client_registry import get_clients, EMBED_DIM
+from app.api.services.answer_cache import answer_cache
 from app.api.responses.base import BaseResponse
 from app.logger.logger import custom_logger
-from app.core.config import CHUNK_SIZE, CHUNK_OVERLAP
-from app.core.config import OPENAI_API_KEY
-from app.core.config import (
-    OPENSEARCH_URL, OPENSEARCH_USER, OPENSEARCH_PASSWORD, OPENSEARCH_INDEX,
-    OPENSEARCH_USE_SSL, OPENSEARCH_VERIFY_CERTS
-)
+from app.core.config import CHUNK_SIZE, CHUNK_OVERLAP, INGESTION_DEDUPE_CHUNKS, INGESTION_INCREMENTAL
+from app.core.config import OPENSEARCH_INDEX, INGESTION_EMBED_MAX_CHUNKS
 
-EMBED_MODEL = "text-embedding-3-small"
-EMBED_DIM   = 1536
+# OpenSearchVectorSearch lưu metadata dưới field "metadata"
+CHUNK_HASH_FIELD = "metadata.chunk_hash"
+CHUNK_HASH_MAPPING = {"metadata": {"properties": {"chunk_hash": {"type": "keyword"}}}}
+# Chuỗi trong metadata được map động: text + sub-field keyword
+FILE_NAME_FIELD = "metadata.file_name.keyword"
+DOC_ID_FIELD = "metadata.doc_id.keyword"
+PART_FIELD = "metadata.part"
+# Số term / id tối đa mỗi query (kiểm tra trùng, xoá chunk)
+_TERMS_BATCH = 1000
 
 
 def default_index_body(
@@ -52,6 +58,7 @@ def default_index_body(
                 "doc_id": {"type": "keyword"},
                 "file_name": {"type": "keyword"},
                 "chunk": {"type": "integer"},
+                **CHUNK_HASH_MAPPING,
             }
         },
     }
@@ -62,10 +69,49 @@ def default_index_body(
     return body
 
 
+def hash_chunk(text: str) -> str:
+    """sha256 of the exact chunk text (không chuẩn hoá: chunk khác hoa / thường là chunk khác)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def diff_chunks(
+    texts: List[str], metadatas: List[Dict], ids: List[str], existing: Sequence[Tuple[str, str]]
+) -> Tuple[List[str], List[Dict], List[str], List[str]]:
+    """Compare a document's chunks with the (chunk_id, chunk_hash) already indexed for its file.
+
+    Trả về chunk mới / đã đổi (cần embed + index) và chunk_id không còn trong bản mới (cần xoá);
+    chunk trùng nội dung được giữ nguyên _id cũ. So khớp theo multiset nên chunk lặp lại vẫn đúng.
+    """
+    pool: Dict[str, List[str]] = defaultdict(list)
+    for chunk_id, chunk_hash in existing:
+        pool[chunk_hash].append(chunk_id)
+    new: Tuple[List[str], List[Dict], List[str]] = ([], [], [])
+    for text, meta, _id in zip(texts, metadatas, ids):
+        if pool.get(meta["chunk_hash"]):
+            pool[meta["chunk_hash"]].pop()
+            continue
+        new[0].append(text)
+        new[1].append(meta)
+        new[2].append(_id)
+    removed = [chunk_id for chunk_ids in pool.values() for chunk_id in chunk_ids]
+    return new[0], new[1], new[2], removed
+
+
+class Reindex(NamedTuple):
+    """Chunks of a re-imported document still to index, and what they replace (xem plan_reindex)."""
+
+    texts: List[str]
+    metadatas: List[Dict]
+    ids: List[str]
+    removed: List[str]
+    # File có bản cũ chưa được ghi vào indexed_chunk: xoá theo file_name (delete_file_copies)
+    purge: bool
+
+
 class OpenSearchProcessor:
     def __init__(
         self,
-        db: AsyncSession,
+        db: Optional[AsyncSession],
         index_name: Optional[str] = None,
         *,
         # Cho phép cấu hình theo từng index
@@ -73,20 +119,21 @@ class OpenSearchProcessor:
         text_field: str = "text",
         index_body: Optional[Dict] = None,
         create_if_missing: bool = True,
+        dedupe_chunks: bool = INGESTION_DEDUPE_CHUNKS,
+        incremental: bool = INGESTION_INCREMENTAL,
     ):
         self.db = db
         self.dao = ImportedDocumentDAO()
+        self.chunks = IndexedChunkDAO()
+        self.incremental = incremental
         self.index_name = index_name or OPENSEARCH_INDEX
         self.vector_field = vector_field
         self.text_field = text_field
+        self.dedupe_chunks = dedupe_chunks
 
-        # Khởi tạo client 1 lần để tái sử dụng
-        self.client = OpenSearch(
-            hosts=[OPENSEARCH_URL],
-            http_auth=(OPENSEARCH_USER, OPENSEARCH_PASSWORD) if OPENSEARCH_USER else None,
-            use_ssl=OPENSEARCH_USE_SSL,
-            verify_certs=OPENSEARCH_VERIFY_CERTS,
-        )
+        # Client/embeddings dùng chung toàn process (xem client_registry)
+        clients = get_clients()
+        self.client = clients.opensearch
 
         # Chỉ tạo index nếu chưa có và cho phép tạo
         if create_if_missing:
@@ -98,23 +145,13 @@ class OpenSearchProcessor:
                     text_field=self.text_field,
                 ),
             )
+        if self.dedupe_chunks:
+            self.dedupe_chunks = self._ensure_hash_mapping()
 
-        self.emb = OpenAIEmbeddings(
-            model=EMBED_MODEL,
-            dimensions=EMBED_DIM,
-            api_key=OPENAI_API_KEY,
-        )
-
-        self.vs = OpenSearchVectorSearch(
-            embedding_function=self.emb,
-            index_name=self.index_name,
-            opensearch_url=OPENSEARCH_URL,
-            http_auth=(OPENSEARCH_USER, OPENSEARCH_PASSWORD) if OPENSEARCH_USER else None,
-            use_ssl=OPENSEARCH_USE_SSL,
-            verify_certs=OPENSEARCH_VERIFY_CERTS,
-            vector_field=self.vector_field,
-            text_field=self.text_field,
-        )
+        self.emb = clients.embeddings
+        self.batcher = clients.embedding_batcher
+        self.bulk = clients.bulk_indexer
+        self.vs = clients.vector_store_for(self.index_name, self.vector_field, self.text_field)
 
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE,
@@ -133,28 +170,211 @@ class OpenSearchProcessor:
             if "resource_already_exists_exception" not in msg:
                 raise
 
+    def _ensure_hash_mapping(self) -> bool:
+        """Add the keyword chunk_hash mapping to an existing index; False if it cannot be added."""
+        try:
+            self.client.indices.put_mapping(index=self.index_name, body={"properties": CHUNK_HASH_MAPPING})
+            return True
+        except Exception as e:
+            # Index cũ đã có chunk_hash với kiểu khác: tắt dedupe thay vì query sai
+            custom_logger.warning(f"chunk dedupe disabled for index '{self.index_name}': {e}")
+            return False
+
+    def chunk_document(self, d: ImportedDocument) -> Tuple[List[str], List[Dict], List[str]]:
+        """Chunk texts, metadatas and ids of one document.
+
+        _id của chunk là "<doc_id>:<chunk>" nên index lại (retry) sẽ ghi đè thay vì nhân bản.
+        chunk_hash là sha256 của text nguyên văn (xem hash_chunk).
+        """
+        chunks = self.splitter.split_text(d.content)
+        metadatas = [
+            {"doc_id": d.id, "file_name": d.file_name, "part": d.part, "chunk": i, "chunk_hash": hash_chunk(text)}
+            for i, text in enumerate(chunks)
+        ]
+        ids = [f"{d.id}:{i}" for i in range(len(chunks))]
+        return chunks, metadatas, ids
+
+    def indexed_hashes(self, hashes: Iterable[str]) -> Set[str]:
+        """Subset of `hashes` already present in the index."""
+        hashes = list(dict.fromkeys(hashes))
+        found: Set[str] = set()
+        for start in range(0, len(hashes), _TERMS_BATCH):
+            batch = hashes[start:start + _TERMS_BATCH]
+            res = self.client.search(
+                index=self.index_name,
+                body={
+                    "size": len(batch),
+                    "_source": [CHUNK_HASH_FIELD],
+                    "query": {"terms": {CHUNK_HASH_FIELD: batch}},
+                    "collapse": {"field": CHUNK_HASH_FIELD},
+                },
+            )
+            for hit in res["hits"]["hits"]:
+                found.add(hit["_source"]["metadata"]["chunk_hash"])
+        return found
+
+    async def drop_duplicates(
+        self, texts: List[str], metadatas: List[Dict], ids: List[str], seen: Optional[Set[str]] = None,
+        check_index: bool = True,
+    ) -> Tuple[List[str], List[Dict], List[str]]:
+        """Drop chunks whose content is already in the index, or earlier in `seen` (updated in place).
+
+        No-op khi dedupe tắt; chunk bị bỏ vẫn tìm được qua bản đã index của document khác.
+        `check_index=False` khi document sắp xoá chunk cũ: bản trong index có thể chính là chunk bị xoá.
+        """
+        if not self.dedupe_chunks or not texts:
+            return texts, metadatas, ids
+        seen = set() if seen is None else seen
+        pending = [m["chunk_hash"] for m in metadatas if m["chunk_hash"] not in seen] if check_index else []
+        seen.update(await asyncio.to_thread(self.indexed_hashes, pending) if pending else ())
+        kept = ([], [], [])
+        for text, meta, _id in zip(texts, metadatas, ids):
+            if meta["chunk_hash"] in seen:
+                continue
+            seen.add(meta["chunk_hash"])
+            kept[0].append(text)
+            kept[1].append(meta)
+            kept[2].append(_id)
+        return kept
+
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """Delete chunks by _id; returns the number deleted."""
+        deleted = 0
+        for start in range(0, len(chunk_ids), _TERMS_BATCH):
+            res = self.client.delete_by_query(
+                index=self.index_name,
+                body={"query": {"ids": {"values": chunk_ids[start:start + _TERMS_BATCH]}}},
+                conflicts="proceed",
+            )
+            deleted += res.get("deleted", 0)
+        return deleted
+
+    def delete_file_copies(self, d: ImportedDocument) -> int:
+        """Delete chunks of earlier uploads of `d`'s file and part that indexed_chunk does not know about.
+
+        Chunk index trước khi có indexed_chunk không có metadata.part: coi như part 0. Với part 0 cũng
+        xoá part >= parts (phần thừa của bản cũ dài hơn).
+        """
+        if d.part == 0:
+            part_filter = {"bool": {"should": [
+                {"term": {PART_FIELD: 0}},
+                {"range": {PART_FIELD: {"gte": d.parts}}},
+                {"bool": {"must_not": {"exists": {"field": PART_FIELD}}}},
+            ], "minimum_should_match": 1}}
+        else:
+            part_filter = {"term": {PART_FIELD: d.part}}
+        res = self.client.delete_by_query(
+            index=self.index_name,
+            body={"query": {"bool": {
+                "filter": [{"term": {FILE_NAME_FIELD: d.file_name}}, part_filter],
+                "must_not": [{"term": {DOC_ID_FIELD: d.id}}],
+            }}},
+            conflicts="proceed",
+        )
+        return res.get("deleted", 0)
+
+    def remove_stale(self, d: ImportedDocument, removed: List[str], purge: bool) -> int:
+        """Delete what the new version of `d` replaces; gọi sau khi bản mới đã index."""
+        deleted = self.delete_chunks(removed) if removed else 0
+        if purge:
+            deleted += self.delete_file_copies(d)
+        return deleted
+
+    async def plan_reindex(
+        self, db: AsyncSession, d: ImportedDocument, chunks: Tuple[List[str], List[Dict], List[str]]
+    ) -> Reindex:
+        """Diff the chunks of `d` against those recorded in indexed_chunk for its file and part."""
+        existing = await self.chunks.chunks_for_file(db, self.index_name, d.file_name, d.part)
+        texts, metadatas, ids, removed = diff_chunks(*chunks, existing)
+        beyond = await self.chunks.chunks_beyond(db, self.index_name, d.file_name, d.parts) if d.part == 0 else []
+        # Không có chunk nào được ghi nhận nhưng file đã từng upload: bản cũ index trước khi có indexed_chunk
+        purge = not existing and not beyond and await self.dao.has_earlier_upload(db, d)
+        return Reindex(texts, metadatas, ids, removed + beyond, purge)
+
+    @staticmethod
+    def chunk_rows(d: ImportedDocument, tracked: Iterable[Tuple[str, Dict]]) -> List[Dict]:
+        """indexed_chunk rows of the (chunk_id, metadata) indexed for `d`, dedupe-dropped chunks included."""
+        return [
+            {"chunk_id": _id, "file_name": d.file_name, "part": d.part, "chunk_hash": meta["chunk_hash"], "doc_id": d.id}
+            for _id, meta in tracked
+        ]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed through the cache (RAM + SQLite); misses go to the token-batched, rate-limited ingestion client.
+
+        Có store trên đĩa thì vector của ingestion chỉ ghi xuống đĩa, không đẩy embedding câu hỏi chat khỏi LRU.
+        """
+        return await self.emb.aembed_documents(
+            texts, call=self.batcher.embed, remember=self.emb.store is None
+        )
+
+    def bulk_docs(
+        self, texts: List[str], vectors: List[List[float]], metadatas: List[Dict], ids: List[str]
+    ) -> List[Tuple[str, Dict]]:
+        """(_id, source) pairs in the layout of OpenSearchVectorSearch, so retrieval reads them unchanged."""
+        return [
+            (_id, {self.vector_field: list(vec), self.text_field: text, "metadata": meta})
+            for text, vec, meta, _id in zip(texts, vectors, metadatas, ids)
+        ]
+
+    async def index_embedded(
+        self, texts: List[str], vectors: List[List[float]], metadatas: List[Dict], ids: List[str]
+    ) -> None:
+        if not texts:
+            return
+        failed = await self.bulk.index(self.index_name, self.bulk_docs(texts, vectors, metadatas, ids))
+        if failed:
+            raise RuntimeError(f"{len(failed)} chunk(s) could not be indexed")
+
+    async def embed_and_index(self, texts: List[str], metadatas: List[Dict], ids: List[str]) -> None:
+        """Embed and index `INGESTION_EMBED_MAX_CHUNKS` chunks at a time, so only one slice of vectors is in memory."""
+        for i in range(0, len(texts), INGESTION_EMBED_MAX_CHUNKS):
+            j = i + INGESTION_EMBED_MAX_CHUNKS
+            await self.index_embedded(texts[i:j], await self.embed(texts[i:j]), metadatas[i:j], ids[i:j])
+
+    async def index_document(self, d: ImportedDocument) -> int:
+        """Chunk, embed and index one document; returns the number of chunks.
+
+        Incremental: giống ingestion worker (chỉ index phần chênh lệch, xoá chunk cũ, ghi indexed_chunk);
+        indexed_chunk được commit cùng mark_processed_many.
+        """
+        chunks = self.chunk_document(d)
+        if not self.incremental:
+            texts, metadatas, ids = await self.drop_duplicates(*chunks)
+            await self.embed_and_index(texts, metadatas, ids)
+            return len(texts)
+
+        if await self.dao.is_superseded(self.db, d):
+            return 0
+        plan = await self.plan_reindex(self.db, d, chunks)
+        texts, metadatas, ids = await self.drop_duplicates(
+            plan.texts, plan.metadatas, plan.ids, check_index=not (plan.removed or plan.purge)
+        )
+        await self.embed_and_index(texts, metadatas, ids)
+        await asyncio.to_thread(self.remove_stale, d, plan.removed, plan.purge)
+        await self.chunks.replace(
+            self.db, self.index_name, plan.removed, self.chunk_rows(d, zip(plan.ids, plan.metadatas))
+        )
+        return len(texts)
+
     async def process_unprocessed(self, limit: Optional[int] = None):
+        """Index unprocessed documents inline (the HTTP route queues an IngestionJob instead)."""
         try:
             docs = await self.dao.list_unprocessed(self.db, limit=limit)
             if not docs:
                 return BaseResponse.success_response(message="No unprocessed documents.")
 
             indexed_ids: List[str] = []
-            for d in docs:
-                chunks = self.splitter.create_documents([d.content])
-                doc_objs: List[Document] = []
-                for i, ch in enumerate(chunks):
-                    doc_objs.append(
-                        Document(
-                            page_content=ch.page_content,
-                            metadata={"doc_id": d.id, "file_name": d.file_name, "chunk": i},
-                        )
-                    )
-
-                # Đảm bảo trường phải khớp với mapping của index hiện tại
-                self.vs.add_documents(doc_objs, vector_field=self.vector_field, text_field=self.text_field)
-                indexed_ids.append(d.id)
-                await self.dao.mark_processed(self.db, d.id)
+            try:
+                for d in docs:
+                    await self.index_document(d)
+                    indexed_ids.append(d.id)
+            finally:
+                # Một UPDATE cho cả batch, kể cả khi dừng giữa chừng
+                await self.dao.mark_processed_many(self.db, indexed_ids)
+
+            # Tài liệu mới -> câu trả lời đã cache có thể đã cũ
+            answer_cache.invalidate()
 
             return BaseResponse.success_response(
                 message=f"Indexed {len(indexed_ids)} document(s) to OpenSearch index '{self.index_name}'",
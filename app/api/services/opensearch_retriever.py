@@ -0,0 +1,72 @@
+"""kNN retriever on AsyncOpenSearch, không block event loop khi chat."""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+
+class AsyncOpenSearchRetriever(BaseRetriever):
+    """Retriever querying an OpenSearch kNN index through the shared async client.
+
+    `client` (sync) is only used when the chain is invoked synchronously.
+    """
+
+    async_client: Any
+    client: Any = None
+    embeddings: Embeddings
+    index_name: str
+    vector_field: str = "vector"
+    text_field: str = "text"
+    k: int = 3
+    # 0/None -> dùng ef_search mặc định của index (method_parameters cần OpenSearch >= 2.16)
+    ef_search: Optional[int] = None
+    request_timeout: float = 5.0
+
+    def _knn_body(self, vector: List[float]) -> Dict:
+        knn: Dict[str, Any] = {"vector": vector, "k": self.k}
+        if self.ef_search:
+            knn["method_parameters"] = {"ef_search": self.ef_search}
+        return {
+            "size": self.k,
+            # Không kéo vector 1536 chiều về, chỉ cần text + metadata
+            "_source": {"excludes": [self.vector_field]},
+            "query": {"knn": {self.vector_field: knn}},
+        }
+
+    def _to_documents(self, response: Dict) -> List[Document]:
+        docs = []
+        for hit in response["hits"]["hits"]:
+            source = hit["_source"]
+            docs.append(Document(
+                page_content=source.get(self.text_field, ""),
+                metadata=source.get("metadata") or {},
+            ))
+        return docs
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        response = await self.async_client.search(
+            index=self.index_name,
+            body=self._knn_body(vector),
+            request_timeout=self.request_timeout,
+        )
+        return self._to_documents(response)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.embeddings.embed_query(query)
+        response = self.client.search(
+            index=self.index_name,
+            body=self._knn_body(vector),
+            request_timeout=self.request_timeout,
+        )
+        return self._to_documents(response)
@@ -0,0 +1,31 @@
+"""Opaque (time, id) keyset cursors for listing endpoints."""
+from __future__ import annotations
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.core.config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+
+Cursor = Tuple[datetime, str]
+
+
+def encode_cursor(time: datetime, id: str) -> str:
+    raw = json.dumps([time.isoformat(), id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """Parse a cursor from `encode_cursor`; raises ValueError when it is malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        time, id = json.loads(raw)
+        return datetime.fromisoformat(time), str(id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX))
@@ -0,0 +1,88 @@
+"""
+    In-process cache of the active custom prompt and its compiled templates
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import time
+from typing import Optional
+
+from langchain.prompts import ChatPromptTemplate
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.database.dao.conversation_dao import ConversationDAO
+from app.api.database.models.custom_prompt import CustomPrompt
+from app.api.services.custom_prompt_service import CustomPromptService
+from app.core.cache import LRUCache
+from app.core.condense_prompt import _template
+from app.core.config import PROMPT_CACHE_CHECK_INTERVAL
+
+DEFAULT_PROMPT = "You are a helpful assistant."
+
+
+class CompiledPrompt:
+    """Prompt text with its QA/condense templates; `version` is the content hash."""
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.version = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        cps = CustomPromptService(content, _template)
+        self.qa_prompt: ChatPromptTemplate = cps.custom_prompt()
+        self.condense_prompt: ChatPromptTemplate = cps.custom_condense_prompt()
+
+
+class PromptCache:
+    """Serve the latest CustomPrompt from memory.
+
+    Worker hiện tại được cập nhật ngay qua `invalidate` (route /custom_prompt);
+    worker khác thấy thay đổi nhờ check id prompt mới nhất, tối đa mỗi
+    `check_interval` giây.
+    """
+
+    def __init__(self, check_interval: float) -> None:
+        self.check_interval = check_interval
+        self.dao = ConversationDAO()
+        self._compiled = LRUCache(maxsize=32, name="compiled_prompt")
+        self._current: Optional[CompiledPrompt] = None
+        self._prompt_id: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _compile(self, content: str) -> CompiledPrompt:
+        key = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = CompiledPrompt(content)
+            self._compiled.set(key, compiled)
+        return compiled
+
+    def _set(self, prompt: Optional[CustomPrompt]) -> None:
+        self._prompt_id = prompt.id if prompt else None
+        self._current = self._compile(prompt.content if prompt else DEFAULT_PROMPT)
+        self._checked_at = time.monotonic()
+
+    def _fresh(self) -> bool:
+        return self._current is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    async def get(self, db: AsyncSession) -> CompiledPrompt:
+        if self._fresh():
+            return self._current
+        async with self._lock:
+            if self._fresh():
+                return self._current
+            latest_id = await self.dao.get_prompt_version(db)
+            if self._current is None or latest_id != self._prompt_id:
+                self._set(await self.dao.get_prompt(db))
+            else:
+                self._checked_at = time.monotonic()
+        return self._current
+
+    def invalidate(self, prompt: Optional[CustomPrompt] = None) -> None:
+        """Use `prompt` as the active one right away, or force a reload on next `get`."""
+        if prompt is not None:
+            self._set(prompt)
+        else:
+            self._current = None
+
+
+prompt_cache = PromptCache(PROMPT_CACHE_CHECK_INTERVAL)
@@ -0,0 +1,26 @@
+"""Cheap heuristics deciding whether a follow-up question needs condensing."""
+from __future__ import annotations
+import re
+
+from app.api.services.embedding_cache import normalize_text
+
+# Từ tham chiếu tới lượt trước (tiếng Anh + tiếng Việt)
+_REFERENCE_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "he", "she", "him", "her", "his", "there", "then", "above", "previous",
+    "same", "more", "also", "else", "other", "again", "one", "ones",
+    "nó", "đó", "này", "kia", "ấy", "vậy", "thế", "họ", "còn", "trên", "trước",
+}
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def is_self_contained(question: str, min_words: int) -> bool:
+    """True when the question is long enough and has no reference to earlier turns."""
+    words = _WORD.findall(normalize_text(question))
+    if len(words) < min_words:
+        return False
+    return not any(w in _REFERENCE_WORDS for w in words)
+
+
+def same_question(a: str, b: str) -> bool:
+    return normalize_text(a) == normalize_text(b)
@@ -0,0 +1,151 @@
+"""
+    Retry trong giới hạn deadline + hedged request cho từng stage của chat
+"""
+from __future__ import annotations
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError
+
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.core.metrics import register_metrics
+from app.core.config import (
+    LLM_MAX_RETRIES, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX,
+    HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES,
+)
+
+T = TypeVar("T")
+
+# Lỗi tạm thời, đáng retry (timeout của openai là subclass của APIConnectionError)
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    OpenSearchConnectionError,
+)
+
+
+class StageStats:
+    """Counters and a latency window for one stage."""
+
+    def __init__(self, window: int = 500) -> None:
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def to_dict(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+stage_stats: Dict[str, StageStats] = {}
+register_metrics("stages", lambda: {name: s.to_dict() for name, s in stage_stats.items()})
+
+
+def get_stage_stats(stage: str) -> StageStats:
+    if stage not in stage_stats:
+        stage_stats[stage] = StageStats()
+    return stage_stats[stage]
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+async def _hedged(stage: str, factory: Callable[[], Awaitable[T]], deadline: Deadline) -> T:
+    """Start a duplicate call once the first one is slower than the stage's latency percentile."""
+    stats = get_stage_stats(stage)
+    delay = stats.percentile(HEDGE_PERCENTILE)
+    if delay is None:
+        return await factory()
+
+    first = asyncio.ensure_future(factory())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+
+        stats.hedges += 1
+        deadline.record(stage, "hedges")
+        second = asyncio.ensure_future(factory())
+        tasks.add(second)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        stats.hedge_wins += 1
+                        deadline.record(stage, "hedge_wins")
+                    return task.result()
+        # Cả hai đều lỗi -> ném lỗi của request đầu
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def run_stage(
+    stage: str,
+    factory: Callable[[], Awaitable[T]],
+    deadline: Deadline,
+    *,
+    hedge: bool = False,
+) -> T:
+    """Await `factory()` within the remaining budget, retrying transient errors while budget remains."""
+    stats = get_stage_stats(stage)
+    attempt = 0
+    while True:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            stats.timeouts += 1
+            raise DeadlineExceeded(stage)
+        stats.calls += 1
+        started = time.monotonic()
+        try:
+            call = _hedged(stage, factory, deadline) if hedge and HEDGE_ENABLED else factory()
+            result = await asyncio.wait_for(call, remaining)
+            stats.observe(time.monotonic() - started)
+            return result
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            deadline.record(stage, "timeouts")
+            raise DeadlineExceeded(stage)
+        except RETRYABLE_ERRORS:
+            attempt += 1
+            delay = backoff_delay(attempt)
+            if attempt > LLM_MAX_RETRIES or deadline.remaining() <= delay:
+                stats.failures += 1
+                raise
+            stats.retries += 1
+            deadline.record(stage, "retries")
+            await asyncio.sleep(delay)
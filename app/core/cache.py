@@ -0,0 +1,145 @@
+"""Bounded in-process caches."""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+from app.core.metrics import register_metrics
+from app.logger.logger import custom_logger
+
+_MISSING = object()
+
+
+class LRUCache:
+    """LRU cache with a max entry count, optional idle TTL and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, name: Optional[str] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if name:
+            register_cache(self)
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, last_access = item
+            if self._expired(last_access, now):
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data[key] = (value, now)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            return item is not _MISSING and not self._expired(item[1], time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def sweep(self) -> int:
+        """Drop idle entries; entries are in access order so stop at the first live one."""
+        if self.ttl is None:
+            return 0
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._data:
+                key, (_, last_access) = next(iter(self._data.items()))
+                if not self._expired(last_access, now):
+                    break
+                del self._data[key]
+                removed += 1
+            self.expirations += removed
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_caches: List[LRUCache] = []
+
+
+def register_cache(cache: LRUCache) -> None:
+    """Track a named cache for background sweeping and /bot/metrics."""
+    _caches.append(cache)
+    register_metrics(f"cache.{cache.name}", cache.stats)
+
+
+class CacheSweeper:
+    """Background task sweeping expired entries of every registered cache."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for cache in list(_caches):
+                try:
+                    removed = cache.sweep()
+                    if removed:
+                        custom_logger.debug(f"cache {cache.name}: swept {removed} idle entries")
+                except Exception as e:
+                    custom_logger.error(str(e))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -25,7 +25,23 @@ loguru_logger.remove()
 loguru_logger.add(sys.stderr, level=LOGGING_LEVEL)
 
 # ===== Limits / Model =====
-MAX_FILE_SIZE: int = config("MAX_FILE_SIZE", cast=int, default=5 * 1024 * 1024)
+MAX_FILE_SIZE: int = config("MAX_FILE_SIZE", cast=int, default=512 * 1024 * 1024)
+# Upload được ghi ra file tạm theo từng khối, text được lưu thành nhiều part (mỗi part một imported_document)
+UPLOAD_SPOOL_DIR: str = config("UPLOAD_SPOOL_DIR", default="")  # rỗng = thư mục tạm của hệ thống
+UPLOAD_READ_CHUNK: int = config("UPLOAD_READ_CHUNK", cast=int, default=1024 * 1024)
+IMPORT_PART_CHARS: int = config("IMPORT_PART_CHARS", cast=int, default=2_000_000)
+# Extract text trong process pool (0 = chạy trong thread của event loop process)
+EXTRACT_WORKERS: int = config("EXTRACT_WORKERS", cast=int, default=2)
+EXTRACT_MAX_PENDING: int = config("EXTRACT_MAX_PENDING", cast=int, default=8)  # số file extract cùng lúc, quá thì trả 503
+EXTRACT_TIMEOUT: float = config("EXTRACT_TIMEOUT", cast=float, default=600)  # giây cho toàn bộ một file
+EXTRACT_PDF_PAGES_PER_TASK: int = config("EXTRACT_PDF_PAGES_PER_TASK", cast=int, default=50)
+EXTRACT_MAX_TASKS_PER_CHILD: int = config("EXTRACT_MAX_TASKS_PER_CHILD", cast=int, default=200)  # task / process trước khi thay pool, 0 = không giới hạn
+# Bulk import (nhiều file / ZIP): file một part được insert chung theo batch
+IMPORT_BULK_MAX_FILES: int = config("IMPORT_BULK_MAX_FILES", cast=int, default=10000)
+IMPORT_BULK_MAX_BYTES: int = config("IMPORT_BULK_MAX_BYTES", cast=int, default=2 * 1024 * 1024 * 1024)  # tổng sau giải nén
+IMPORT_BULK_CONCURRENCY: int = config("IMPORT_BULK_CONCURRENCY", cast=int, default=4)
+IMPORT_BULK_INSERT_ROWS: int = config("IMPORT_BULK_INSERT_ROWS", cast=int, default=200)
+IMPORT_BULK_INSERT_CHARS: int = config("IMPORT_BULK_INSERT_CHARS", cast=int, default=16_000_000)
 CHUNK_SIZE: int = config("CHUNK_SIZE", cast=int, default=1000)
 CHUNK_OVERLAP: int = config("CHUNK_OVERLAP", cast=int, default=200)
 MODEL_NAME: str = config("MODEL_NAME", default="gpt-3.5-turbo")
@@ -47,6 +63,115 @@ OPENSEARCH_PASSWORD: str = config("OPENSEARCH_PASSWORD", default="")
 OPENSEARCH_INDEX: str = config("OPENSEARCH_INDEX", default="chatbot")
 OPENSEARCH_USE_SSL: bool = config("OPENSEARCH_USE_SSL", cast=bool, default=False)
 OPENSEARCH_VERIFY_CERTS: bool = config("OPENSEARCH_VERIFY_CERTS", cast=bool, default=False)
+OPENSEARCH_POOL_MAXSIZE: int = config("OPENSEARCH_POOL_MAXSIZE", cast=int, default=20)
+OPENSEARCH_K: int = config("OPENSEARCH_K", cast=int, default=3)
+OPENSEARCH_EF_SEARCH: int = config("OPENSEARCH_EF_SEARCH", cast=int, default=0)  # 0 = mặc định của index
+OPENSEARCH_TIMEOUT: float = config("OPENSEARCH_TIMEOUT", cast=float, default=5.0)
+
+# ===== Shared HTTP pool (OpenAI chat + embeddings) =====
+HTTP_MAX_CONNECTIONS: int = config("HTTP_MAX_CONNECTIONS", cast=int, default=100)
+HTTP_MAX_KEEPALIVE_CONNECTIONS: int = config("HTTP_MAX_KEEPALIVE_CONNECTIONS", cast=int, default=20)
+HTTP_KEEPALIVE_EXPIRY: float = config("HTTP_KEEPALIVE_EXPIRY", cast=float, default=30.0)
+
+# ===== Chat pipeline =====
+# "always": luôn condense khi có history; "auto": bỏ qua khi câu hỏi tự đủ nghĩa
+CONDENSE_MODE: str = config("CONDENSE_MODE", default="auto")
+CONDENSE_MIN_WORDS: int = config("CONDENSE_MIN_WORDS", cast=int, default=6)
+# Retrieval trên câu hỏi gốc chạy song song với condense, giữ kết quả xong trước (thường là retrieval)
+CONDENSE_SPECULATIVE_RETRIEVAL: bool = config("CONDENSE_SPECULATIVE_RETRIEVAL", cast=bool, default=True)
+
+# ===== Deadline / retry / hedging =====
+CHAT_DEADLINE: float = config("CHAT_DEADLINE", cast=float, default=60.0)  # ngân sách cho cả condense + retrieval + answer
+LLM_TIMEOUT: float = config("LLM_TIMEOUT", cast=float, default=30.0)
+LLM_MAX_RETRIES: int = config("LLM_MAX_RETRIES", cast=int, default=3)
+RETRY_BACKOFF_BASE: float = config("RETRY_BACKOFF_BASE", cast=float, default=0.5)
+RETRY_BACKOFF_MAX: float = config("RETRY_BACKOFF_MAX", cast=float, default=8.0)
+HEDGE_ENABLED: bool = config("HEDGE_ENABLED", cast=bool, default=False)
+HEDGE_PERCENTILE: float = config("HEDGE_PERCENTILE", cast=float, default=95)
+HEDGE_MIN_SAMPLES: int = config("HEDGE_MIN_SAMPLES", cast=int, default=20)
+
+# ===== Admission control =====
+ADMISSION_MAX_CHATS: int = config("ADMISSION_MAX_CHATS", cast=int, default=64)
+ADMISSION_CHAT_QUEUE: int = config("ADMISSION_CHAT_QUEUE", cast=int, default=128)
+ADMISSION_MAX_LLM_CALLS: int = config("ADMISSION_MAX_LLM_CALLS", cast=int, default=32)
+ADMISSION_MAX_EMBED_CALLS: int = config("ADMISSION_MAX_EMBED_CALLS", cast=int, default=16)
+ADMISSION_CALL_QUEUE: int = config("ADMISSION_CALL_QUEUE", cast=int, default=256)
+ADMISSION_QUEUE_TIMEOUT: float = config("ADMISSION_QUEUE_TIMEOUT", cast=float, default=10.0)
+
+# ===== In-process caches =====
+CONVERSATION_CACHE_MAX_ENTRIES: int = config("CONVERSATION_CACHE_MAX_ENTRIES", cast=int, default=10000)
+CONVERSATION_CACHE_TTL: float = config("CONVERSATION_CACHE_TTL", cast=float, default=12 * 3600)
+EMBED_CACHE_MAX_ENTRIES: int = config("EMBED_CACHE_MAX_ENTRIES", cast=int, default=10000)
+# File SQLite riêng của mỗi pod, không tự dọn: đặt trên volume dữ liệu, vd. /data/embeddings.sqlite3
+EMBED_CACHE_PATH: str = config("EMBED_CACHE_PATH", default="")  # rỗng = chỉ cache RAM
+PROMPT_CACHE_CHECK_INTERVAL: float = config("PROMPT_CACHE_CHECK_INTERVAL", cast=float, default=5)
+ANSWER_CACHE_ENABLED: bool = config("ANSWER_CACHE_ENABLED", cast=bool, default=False)
+ANSWER_CACHE_THRESHOLD: float = config("ANSWER_CACHE_THRESHOLD", cast=float, default=0.95)  # cosine similarity
+ANSWER_CACHE_MAX_ENTRIES: int = config("ANSWER_CACHE_MAX_ENTRIES", cast=int, default=2000)
+ANSWER_CACHE_TTL: float = config("ANSWER_CACHE_TTL", cast=float, default=3600)
+CACHE_SWEEP_INTERVAL: float = config("CACHE_SWEEP_INTERVAL", cast=float, default=60)
+# Ring buffer các lượt chat gần nhất của mỗi conversation; chỉ bật khi một worker hoặc routing sticky
+# theo conversation_id (nhiều worker không sticky -> buffer của worker khác bị cũ)
+HISTORY_BUFFER_ENABLED: bool = config("HISTORY_BUFFER_ENABLED", cast=bool, default=False)
+HISTORY_BUFFER_TURNS: int = config("HISTORY_BUFFER_TURNS", cast=int, default=4)
+HISTORY_BUFFER_MAX_CONVERSATIONS: int = config("HISTORY_BUFFER_MAX_CONVERSATIONS", cast=int, default=10000)
+HISTORY_BUFFER_TTL: float = config("HISTORY_BUFFER_TTL", cast=float, default=12 * 3600)
+# Ghi history kiểu write-behind: insert được gom batch, flush tối đa sau HISTORY_FLUSH_INTERVAL giây
+HISTORY_WRITE_BEHIND: bool = config("HISTORY_WRITE_BEHIND", cast=bool, default=True)
+HISTORY_FLUSH_INTERVAL: float = config("HISTORY_FLUSH_INTERVAL", cast=float, default=0.5)
+HISTORY_FLUSH_MAX_BATCH: int = config("HISTORY_FLUSH_MAX_BATCH", cast=int, default=500)
+# DB lỗi: hàng đợi giới hạn (bỏ message cũ nhất), row lỗi quá N lần flush bị ghi log và bỏ
+HISTORY_MAX_PENDING: int = config("HISTORY_MAX_PENDING", cast=int, default=50000)
+HISTORY_FLUSH_MAX_ATTEMPTS: int = config("HISTORY_FLUSH_MAX_ATTEMPTS", cast=int, default=20)
+
+# ===== Ingestion jobs =====
+INGESTION_WORKERS: int = config("INGESTION_WORKERS", cast=int, default=2)  # số worker async mỗi process; 0 = tắt
+INGESTION_POLL_INTERVAL: float = config("INGESTION_POLL_INTERVAL", cast=float, default=2)
+INGESTION_LEASE_SECONDS: float = config("INGESTION_LEASE_SECONDS", cast=float, default=600)
+INGESTION_MAX_ATTEMPTS: int = config("INGESTION_MAX_ATTEMPTS", cast=int, default=5)
+INGESTION_BACKOFF_BASE: float = config("INGESTION_BACKOFF_BASE", cast=float, default=30)
+INGESTION_BACKOFF_MAX: float = config("INGESTION_BACKOFF_MAX", cast=float, default=3600)
+
+INGESTION_CLAIM_BATCH: int = config("INGESTION_CLAIM_BATCH", cast=int, default=20)  # số document mỗi worker lấy một lần
+# Số chunk tối đa embed + index cùng lúc mỗi worker: giới hạn RAM cho vector (~100 MB / 2000 chunk 1536 chiều)
+INGESTION_EMBED_MAX_CHUNKS: int = config("INGESTION_EMBED_MAX_CHUNKS", cast=int, default=2000)
+# Embedding cho ingestion: batch theo token, gộp chunk của nhiều document
+EMBED_BATCH_MAX_TOKENS: int = config("EMBED_BATCH_MAX_TOKENS", cast=int, default=100000)
+EMBED_BATCH_MAX_INPUTS: int = config("EMBED_BATCH_MAX_INPUTS", cast=int, default=1000)  # API giới hạn 2048 input / request
+EMBED_CONCURRENCY: int = config("EMBED_CONCURRENCY", cast=int, default=4)
+EMBED_RPM: int = config("EMBED_RPM", cast=int, default=3000)  # 0 = không giới hạn
+EMBED_TPM: int = config("EMBED_TPM", cast=int, default=1000000)  # 0 = không giới hạn
+EMBED_MAX_RETRIES: int = config("EMBED_MAX_RETRIES", cast=int, default=6)
+
+# Bỏ qua chunk có cùng nội dung (metadata.chunk_hash) đã có trong index
+INGESTION_DEDUPE_CHUNKS: bool = config("INGESTION_DEDUPE_CHUNKS", cast=bool, default=False)
+
+# Import lại cùng file_name: chỉ embed / index chunk mới hoặc đã đổi, xoá chunk đã mất.
+# Nếu bật cùng INGESTION_DEDUPE_CHUNKS, chunk dùng chung với file khác sẽ mất khi file đã index nó đổi nội dung
+INGESTION_INCREMENTAL: bool = config("INGESTION_INCREMENTAL", cast=bool, default=True)
+
+# Ghi OpenSearch qua _bulk: batch giới hạn theo số action và số byte, gửi song song
+INGESTION_BULK_MAX_ACTIONS: int = config("INGESTION_BULK_MAX_ACTIONS", cast=int, default=500)
+INGESTION_BULK_MAX_BYTES: int = config("INGESTION_BULK_MAX_BYTES", cast=int, default=10 * 1024 * 1024)
+INGESTION_BULK_CONCURRENCY: int = config("INGESTION_BULK_CONCURRENCY", cast=int, default=4)
+INGESTION_BULK_MAX_RETRIES: int = config("INGESTION_BULK_MAX_RETRIES", cast=int, default=3)
+# Đặt refresh_interval=-1 trong lúc load, khôi phục khi hàng đợi rỗng của mọi process (bảng bulk_load)
+INGESTION_BULK_DISABLE_REFRESH: bool = config("INGESTION_BULK_DISABLE_REFRESH", cast=bool, default=False)
+INGESTION_BULK_LOAD_LEASE: float = config("INGESTION_BULK_LOAD_LEASE", cast=float, default=600)
+
+# ===== Listing / export =====
+PAGE_SIZE_DEFAULT: int = config("PAGE_SIZE_DEFAULT", cast=int, default=50)
+PAGE_SIZE_MAX: int = config("PAGE_SIZE_MAX", cast=int, default=500)
+EXPORT_BATCH_SIZE: int = config("EXPORT_BATCH_SIZE", cast=int, default=1000)  # số row mỗi lần fetch từ server-side cursor
+
+# ===== History partition / archive =====
+# conversation_detail chia partition theo tháng; job định kỳ tạo trước partition và (tuỳ chọn) archive
+HISTORY_ARCHIVE_DIR: str = config("HISTORY_ARCHIVE_DIR", default="app/resources/history_archive")
+HISTORY_ARCHIVE_IDLE_DAYS: int = config("HISTORY_ARCHIVE_IDLE_DAYS", cast=int, default=0)  # 0 = không archive conversation
+HISTORY_RETENTION_MONTHS: int = config("HISTORY_RETENTION_MONTHS", cast=int, default=0)  # 0 = giữ mọi partition
+HISTORY_PARTITIONS_AHEAD: int = config("HISTORY_PARTITIONS_AHEAD", cast=int, default=2)
+HISTORY_ARCHIVE_INTERVAL: float = config("HISTORY_ARCHIVE_INTERVAL", cast=float, default=3600)
+HISTORY_ARCHIVE_BATCH: int = config("HISTORY_ARCHIVE_BATCH", cast=int, default=200)
 
 # ===== (Tùy chọn) DB =====
 POSTGRES_DETAILS: str = config("POSTGRES_DETAILS", default="")
@@ -0,0 +1,34 @@
+"""End-to-end deadline budget shared by the stages of one request."""
+from __future__ import annotations
+import time
+from collections import defaultdict
+from typing import Dict
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the remaining budget."""
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        super().__init__(f"Deadline exceeded during {stage}")
+
+
+class Deadline:
+    """Budget in seconds; also counts per-stage retry/hedge events of the request."""
+
+    def __init__(self, budget: float) -> None:
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.events: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def record(self, stage: str, event: str) -> None:
+        self.events[stage][event] += 1
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {stage: dict(counts) for stage, counts in self.events.items()}
@@ -0,0 +1,14 @@
+"""In-process metrics registry, exposed by GET /bot/metrics."""
+from __future__ import annotations
+from typing import Callable, Dict
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, collector: Callable[[], dict]) -> None:
+    """Register a callable returning a JSON-serialisable dict under `name`."""
+    _collectors[name] = collector
+
+
+def collect_metrics() -> Dict[str, dict]:
+    return {name: collector() for name, collector in _collectors.items()}
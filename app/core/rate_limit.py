@@ -0,0 +1,62 @@
+"""Requests-per-minute / tokens-per-minute limiter for outbound API calls."""
+from __future__ import annotations
+import asyncio
+import time
+
+
+class _Bucket:
+    """Token bucket refilled continuously at `per_minute / 60` units per second."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """Wait until one request of `tokens` tokens fits both the RPM and the TPM budget.
+
+    `rpm` / `tpm` <= 0 tắt giới hạn tương ứng.
+    """
+
+    def __init__(self, rpm: float, tpm: float) -> None:
+        self.requests = _Bucket(rpm) if rpm > 0 else None
+        self.tokens = _Bucket(tpm) if tpm > 0 else None
+        self._lock = asyncio.Lock()
+        self.waited = 0.0
+
+    async def acquire(self, tokens: int) -> None:
+        # FIFO: request đến trước được cấp quota trước
+        async with self._lock:
+            while True:
+                wait = 0.0
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    # Batch lớn hơn cả capacity chỉ cần chờ bucket đầy
+                    wait = max(wait, self.tokens.wait_time(min(tokens, self.tokens.capacity)))
+                if wait <= 0:
+                    break
+                self.waited += wait
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= min(tokens, self.tokens.capacity)
+
+    def pause(self, seconds: float) -> None:
+        """Empty the buckets after a 429 so every caller backs off, not only the one that was rejected."""
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.refill()
+                bucket.level = min(bucket.level, -bucket.rate * seconds)
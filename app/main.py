@@ -73,9 +73,34 @@ def get_application() -> FastAPI:
 
 app = get_application()
 from app.api.database.create_db import create_db
+from app.api.services.client_registry import init_clients, close_clients
+from app.api.services.history_writer import history_writer
+from app.api.services.history_archive import history_archiver
+from app.api.services.ingestion_worker import ingestion_workers
+from app.api.services.extraction_pool import extraction_pool
+from app.core.cache import CacheSweeper
+from app.core.config import CACHE_SWEEP_INTERVAL
+
+cache_sweeper = CacheSweeper(CACHE_SWEEP_INTERVAL)
+
 @app.on_event("startup")
 async def on_startup():
     await create_db()
+    await init_clients()
+    cache_sweeper.start()
+    history_writer.start()
+    history_archiver.start()
+    ingestion_workers.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await ingestion_workers.stop()
+    extraction_pool.shutdown()
+    await cache_sweeper.stop()
+    await history_archiver.stop()
+    # Ghi nốt history còn trong hàng đợi trước khi tắt
+    await history_writer.stop()
+    await close_clients()
 
 if __name__ == "__main__":
     HOST = os.getenv("APP_HOST")
@@ -0,0 +1,108 @@
+"""
+    Benchmark extract text DOCX: đường cũ (đọc cả file -> NamedTemporaryFile -> docx2txt.process)
+    so với iter_docx (iterparse trực tiếp từ zip, từ file đã spool hoặc BytesIO).
+
+    Sinh một file .docx tổng hợp rồi đo thời gian (tốt nhất trong --repeat lần) và bộ nhớ đỉnh (tracemalloc):
+
+        python -m benchmarks.docx_extract_bench --paragraphs 200000
+"""
+from __future__ import annotations
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from typing import Callable, Tuple
+
+import docx2txt
+
+from app.api.services.extractors import iter_docx
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def make_docx(path: str, paragraphs: int, words: int) -> None:
+    """Minimal .docx with `paragraphs` paragraphs; every 50th is a one-cell table."""
+    sentence = " ".join(f"word{i}" for i in range(words))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("word/document.xml", "w") as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="{W_NS}"><w:body>'.encode())
+            for i in range(paragraphs):
+                p = f"<w:p><w:r><w:t>{i} {sentence}</w:t><w:tab/><w:t>end</w:t></w:r></w:p>"
+                if i % 50 == 0:
+                    p = f"<w:tbl><w:tr><w:tc>{p}</w:tc></w:tr></w:tbl>"
+                f.write(p.encode())
+            f.write(b"<w:sectPr/></w:body></w:document>")
+        zf.writestr("word/header1.xml", f'<w:hdr xmlns:w="{W_NS}"><w:p><w:r><w:t>header</w:t></w:r></w:p></w:hdr>')
+
+
+def legacy_docx_to_text(path: str) -> str:
+    """Former ImportService.docx_to_text: whole upload in memory, copied to a temp file."""
+    with open(path, "rb") as src:
+        data = src.read()
+    with tempfile.NamedTemporaryFile(suffix=".docx") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        return docx2txt.process(tmp.name)
+
+
+def iterparse_from_path(path: str) -> str:
+    return "".join(iter_docx(path))
+
+
+def iterparse_from_bytes(path: str) -> str:
+    with open(path, "rb") as src:
+        stream = io.BytesIO(src.read())
+    return "".join(iter_docx(stream))
+
+
+def iterparse_count(path: str) -> str:
+    """Consume paragraphs without joining them, as a streaming consumer would."""
+    chars = sum(len(p) for p in iter_docx(path))
+    return str(chars)
+
+
+def measure(fn: Callable[[str], str], path: str, repeat: int) -> Tuple[float, float, str]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn(path)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 / 1024, out
+
+
+def main(args: argparse.Namespace) -> None:
+    fd, path = tempfile.mkstemp(suffix=".docx")
+    os.close(fd)
+    try:
+        make_docx(path, args.paragraphs, args.words)
+        print(f"{args.paragraphs} paragraphs, {os.path.getsize(path) / 1024 / 1024:.1f} MB docx\n")
+        reference = None
+        for label, fn in [
+            ("docx2txt + temp file (legacy)", legacy_docx_to_text),
+            ("iter_docx from spooled file", iterparse_from_path),
+            ("iter_docx from BytesIO", iterparse_from_bytes),
+            ("iter_docx streamed, not joined", iterparse_count),
+        ]:
+            seconds, peak_mb, out = measure(fn, path, args.repeat)
+            if fn is legacy_docx_to_text:
+                reference = out
+            elif fn is not iterparse_count:
+                assert out == reference, f"{label}: output differs from docx2txt"
+            print(f"{label:<34} {seconds:7.2f} s   peak {peak_mb:8.1f} MB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=200_000)
+    parser.add_argument("--words", type=int, default=30, help="words per paragraph")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())